@@ -1,13 +1,44 @@
-from collections import namedtuple
+"""
+title: Conversation Saver Pipeline
+requirements: httpx
+"""
+
+import asyncio
+from collections import OrderedDict, namedtuple
+import hashlib
 import json
 from pathlib import Path
 import re
+import threading
+import time
 from typing import Literal, Optional, List
 from datetime import datetime
+from fnmatch import fnmatchcase
 from pydantic import BaseModel, Field
-import requests
+import httpx
 
 ModelCollection = namedtuple("ModelCollection", ["id", "name"])
+# Removed from every message: <source>/<source_context> blocks, [source_id…] markers and [1]-like citations.
+# The source block rule is an unrolled loop (no lazy `.*?`) matching the innermost block of its tag, across lines;
+# blocks nested in a block of the same tag are removed by the next pass (see `ContentCleaner`).
+DEFAULT_CLEAN_RULES = [
+    r"<(?P<tag>source(?:_context)?)>[^<]*(?:<(?!/?(?P=tag)>)[^<]*)*</(?P=tag)>",
+    r"\[source_id[^\]\n]*\]",
+    r"\[\d+\]",
+]
+
+# What was last written for a chat: number of messages, hash of these messages, file size and header
+PersistedConversation = namedtuple("PersistedConversation", ["count", "prefix_hash", "size", "header"])
+MAX_PERSISTED = 1024  # conversations remembered for append-only writes, a forgotten one is just rewritten
+LOCK_STRIPES = 64  # conversations are written under one of these locks, picked by hash of their id
+GLOB_CHARS = set("*?[")  # keys of model_collections.json containing one are glob patterns
+
+
+def conversation_path(root: str, chat_id: str, extension: str, shard_levels: int = 0) -> Path:
+    """`root/ab/cd/<chat_id>.<extension>` with `shard_levels` hash-prefix directories (same layout as Archivist)."""
+    digest = hashlib.sha1(chat_id.encode("utf-8")).hexdigest()
+    shards = [digest[2 * i : 2 * i + 2] for i in range(shard_levels)]
+    return Path(root, *shards, f"{chat_id}.{extension}")
 
 
 class OngoingConversation(BaseModel):
@@ -52,10 +83,18 @@ class OngoingConversationTracker:
 
 
 class CollectionLoader:
+    """
+    Model collections of `model_collections.json`, reloaded when it changes. Models are resolved as Archivist does
+    (see `collection_registry.py`): exact name (`model:latest` also as `model`), name without tag, glob pattern
+    in file order, else `default`.
+    """
+
     def __init__(self, path: str):
         self.path = Path(path)
         self.last_mtime = 0
         self.cache: dict[str, ModelCollection] = {}
+        self.exact: dict[str, ModelCollection] = {}
+        self.patterns: list[tuple[str, ModelCollection]] = []
 
     def load(self):
         try:
@@ -63,11 +102,52 @@ class CollectionLoader:
             if current_mtime != self.last_mtime:
                 raw = json.loads(self.path.read_text(encoding="utf-8"))
                 self.cache = {k: ModelCollection(**v) for k, v in raw.items()}
+                self.exact, self.patterns = {}, []
+                for key, collection in self.cache.items():
+                    if GLOB_CHARS & set(key):
+                        self.patterns.append((key, collection))
+                        continue
+                    self.exact[key] = collection
+                    if key.endswith(":latest"):
+                        self.exact.setdefault(key[: -len(":latest")], collection)
                 self.last_mtime = current_mtime
         except Exception as e:
             print(f"[CollectionLoader] Failed to reload: {e}")
         return self.cache
 
+    def match(self, model: str) -> Optional[ModelCollection]:
+        """Collection listed for `model`, without falling back to `default`."""
+        collection = self.exact.get(model)
+        if collection is None and ":" in model:
+            collection = self.exact.get(model.split(":", 1)[0])
+        if collection is None:
+            collection = next((c for pattern, c in self.patterns if fnmatchcase(model, pattern)), None)
+        return collection
+
+    def resolve(self, model: str) -> Optional[ModelCollection]:
+        return self.match(model) or self.exact.get("default")
+
+
+class ContentCleaner:
+    """
+    Remove every match of the `rules` regexes with one compiled pattern, pass after pass until nothing matches
+    (a block nested in another one of the same tag leaves the outer one to the next pass).
+    Rules keep their own flags: `.` only matches newlines in a rule written `(?s:...)`.
+    """
+
+    def __init__(self, rules: List[str]):
+        self.rules = tuple(rules)
+        self.pattern = re.compile("|".join(f"(?:{rule})" for rule in self.rules)) if self.rules else None
+
+    def clean(self, text: str) -> str:
+        if self.pattern is None:
+            return text.strip()
+        while True:
+            cleaned = self.pattern.sub("", text)
+            if cleaned == text:
+                return cleaned.strip()
+            text = cleaned
+
 
 class Pipeline:
     class Valves(BaseModel):
@@ -86,6 +166,13 @@ class Pipeline:
             title="File extension for the conversation files. Support any text format file (txt, md…)",
         )
         archive_per_knowledge: bool = Field(default=False, title="Archive conversation per knowledge")
+        shard_levels: int = Field(
+            default=0,
+            ge=0,
+            le=4,
+            title="Hash-prefix directory levels of the conversation files (ab/cd/<chat_id>.md), 0 for a flat directory."
+            " Must match MEMORY_SHARD_LEVELS of Archivist",
+        )
         models_collections_path: str = Field(
             default="/app/model_collections.json",
             title="Path to the JSON file for model collections to archive conversation and exclude models",
@@ -98,16 +185,28 @@ class Pipeline:
             default="http://archivist:9000/notify",
             title="URL to notify when a conversation is saved",
         )
+        append_only: bool = Field(
+            default=True,
+            title="Only append the new messages to the conversation file. It is fully rewritten if earlier messages were edited",
+        )
+        clean_rules: List[str] = Field(
+            default=DEFAULT_CLEAN_RULES,
+            title="Regex patterns removed from the messages (RAG sources, citations…)",
+        )
+        notify_timeout: float = Field(default=5.0, title="Timeout (seconds) of the notification sent to Archivist")
+        notify_retry_interval: int = Field(
+            default=30,
+            title="Seconds between two retries of the notifications that failed (kept in save_path/notify_spool)",
+        )
 
     def delete_archived(self, chat_id: str, model_name: str):
-        archived_path = Path(self.valves.archive_path, f"{chat_id}.{self.valves.extension}")
+        archive_dir = Path(self.valves.archive_path)
         if self.valves.archive_per_knowledge:
-            knowledge_name = (
-                self.knowledges.get(model_name)
-                or self.knowledges.get("default")
-                or ModelCollection(id="default", name=model_name)
+            knowledge_name = self.collection_loader.resolve(model_name) or ModelCollection(
+                id="default", name=model_name
             )
-            archived_path = Path(self.valves.archive_path, knowledge_name.name, f"{chat_id}.{self.valves.extension}")
+            archive_dir = Path(self.valves.archive_path, knowledge_name.name)
+        archived_path = conversation_path(archive_dir, chat_id, self.valves.extension, self.valves.shard_levels)
         if archived_path.exists():
             try:
                 archived_path.unlink()
@@ -121,6 +220,14 @@ class Pipeline:
         self.valves = self.Valves()
         self.collection_loader = CollectionLoader(self.valves.models_collections_path)
         self.ongoing_tracker = OngoingConversationTracker(Path(self.valves.save_path, "ongoing_conversations"))
+        self.persisted: OrderedDict[str, PersistedConversation] = OrderedDict()
+        self._persisted_lock = threading.Lock()
+        self._cleaner: Optional[ContentCleaner] = None
+        self._locks = [threading.Lock() for _ in range(LOCK_STRIPES)]
+        self._client: Optional[httpx.AsyncClient] = None
+        self._tasks: set[asyncio.Task] = set()
+        self._spool_pending = False
+        self._last_flush = 0.0
         self._print("[ConversationSaver] Initialized")
 
     def _print(self, *msg: object):
@@ -129,25 +236,191 @@ class Pipeline:
 
     async def on_startup(self):
         self._print("[ConversationSaver] on_startup")
+        self._spool_pending = await asyncio.to_thread(lambda: any(self.spool_path.glob("*.json")))
 
     async def on_shutdown(self):
         self._print("[ConversationSaver] on_shutdown")
+        if self._client:
+            await self._client.aclose()
+            self._client = None
+
+    @property
+    def spool_path(self) -> Path:
+        return Path(self.valves.save_path, "notify_spool")
+
+    def _background(self, coro):
+        # Keep a reference so the task isn't garbage collected before its end
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def send_notification(self, payload: dict) -> bool:
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient()
+        try:
+            res = await self._client.post(self.valves.notify_url, json=payload, timeout=self.valves.notify_timeout)
+            if res.is_success:
+                return True
+            self._print(f"[ConversationSaver] Notification refused: {res.status_code} - {res.text}")
+        except Exception as e:
+            self._print(f"[ConversationSaver] Failed to notify archivist: {e}")
+        return False
+
+    def spool(self, payload: dict):
+        self.spool_path.mkdir(parents=True, exist_ok=True)
+        Path(self.spool_path, f"{payload['chat_id']}.json").write_text(json.dumps(payload), encoding="utf-8")
+        self._spool_pending = True
+
+    async def notify(self, payload: dict):
+        """Notify Archivist, or keep the notification in the spool to retry it later."""
+        if not await self.send_notification(payload):
+            await asyncio.to_thread(self.spool, payload)
+
+    async def flush_spool(self):
+        """Resend the spooled notifications, stopping at the first failure (Archivist still down)."""
+        self._last_flush = time.monotonic()
+        files = await asyncio.to_thread(lambda: sorted(self.spool_path.glob("*.json")))
+        for path in files:
+            try:
+                payload = json.loads(await asyncio.to_thread(path.read_text, encoding="utf-8"))
+            except Exception as e:
+                self._print(f"[ConversationSaver] Dropping unreadable notification {path}: {e}")
+                path.unlink(missing_ok=True)
+                continue
+            if not await self.send_notification(payload):
+                return
+            path.unlink(missing_ok=True)
+        self._spool_pending = False
+
+    @property
+    def cleaner(self) -> ContentCleaner:
+        # Valves can be replaced from the admin panel: recompile only when the rules change
+        if self._cleaner is None or self._cleaner.rules != tuple(self.valves.clean_rules):
+            try:
+                self._cleaner = ContentCleaner(self.valves.clean_rules)
+            except re.error as e:
+                print(f"[ConversationSaver] Invalid clean_rules, using the default ones: {e}")
+                self._cleaner = ContentCleaner(DEFAULT_CLEAN_RULES)
+                self._cleaner.rules = tuple(self.valves.clean_rules)
+        return self._cleaner
 
     def clean_content(self, text: str) -> str:
-        # Supprimer les balises <source_context> et <source> ainsi que leur contenu
-        text = re.sub(r"<source(_context)?>.*?</source(_context)?>", "", text, flags=re.DOTALL)
-        text = re.sub(r"\[source_id.*\]", "", text)
-        text = re.sub(r"\[\d+\]", "", text)
-        return text.strip()
+        return self.cleaner.clean(text)
+
+    @staticmethod
+    def hash_message(hasher, msg: dict):
+        hasher.update(f"{msg.get('role')}\0{msg.get('content')}\0".encode("utf-8"))
+
+    def format_message(self, msg: dict, username: str) -> Optional[str]:
+        role = msg.get("role", "user")
+        content = self.clean_content(msg.get("content", ""))
+        if not content.strip():
+            return None
+        speaker = username if role == "user" else role.capitalize()
+        return f"**{speaker}**: {content}\n\n"
+
+    def write_conversation(
+        self, filename: Path, conversation_id: str, messages: list, username: str, model: str, timestamp: str, intro: str
+    ):
+        """
+        Write the conversation file. In `append_only` mode, only the messages added since the last write are cleaned
+        and appended, as long as the file is untouched and the messages already written didn't change.
+        """
+        header = (username, model, intro)
+        previous = self.get_persisted(conversation_id) if self.valves.append_only else None
+        hasher = hashlib.sha256()
+        start = 0
+        if previous and previous.header == header and len(messages) >= previous.count:
+            for msg in messages[: previous.count]:
+                self.hash_message(hasher, msg)
+            try:
+                unchanged_file = filename.stat().st_size == previous.size
+            except OSError:
+                unchanged_file = False
+            if unchanged_file and hasher.hexdigest() == previous.prefix_hash:
+                start = previous.count
+            else:
+                hasher = hashlib.sha256()
+        if start:
+            with open(filename, "a", encoding="utf-8") as f:
+                for msg in messages[start:]:
+                    self.hash_message(hasher, msg)
+                    line = self.format_message(msg, username)
+                    if line:
+                        f.write(line)
+            self._print(f"[ConversationSaver] Appended {len(messages) - start} messages to {filename}")
+        else:
+            with open(filename, "w", encoding="utf-8") as f:
+                # frontmatter, usefull if used with Obsidian for example
+                f.write("---\n")
+                f.write(f'conversation_id: "{conversation_id}"\n')
+                f.write(f'date: "{timestamp}"\n')
+                f.write(f'model: "{model}"\n')
+                f.write(f'user: "{username}"\n')
+                f.write(f"---\n{intro}\n\n")
+
+                for msg in messages:
+                    self.hash_message(hasher, msg)
+                    line = self.format_message(msg, username)
+                    if line:
+                        f.write(line)
+        self.set_persisted(
+            conversation_id,
+            PersistedConversation(
+                count=len(messages), prefix_hash=hasher.hexdigest(), size=filename.stat().st_size, header=header
+            ),
+        )
+
+    def get_persisted(self, conversation_id: str) -> Optional[PersistedConversation]:
+        with self._persisted_lock:
+            persisted = self.persisted.get(conversation_id)
+            if persisted:
+                self.persisted.move_to_end(conversation_id)
+            return persisted
+
+    def set_persisted(self, conversation_id: str, persisted: Optional[PersistedConversation]):
+        """Remember what was written for `conversation_id` (`None` to forget it), only the last MAX_PERSISTED."""
+        with self._persisted_lock:
+            if persisted is None:
+                self.persisted.pop(conversation_id, None)
+                return
+            self.persisted[conversation_id] = persisted
+            self.persisted.move_to_end(conversation_id)
+            while len(self.persisted) > MAX_PERSISTED:
+                self.persisted.popitem(last=False)
+
+    def save_conversation(
+        self, conversation_id: str, messages: list, username: str, user_id: str, model: str
+    ) -> Optional[OngoingConversation]:
+        """Write the conversation file and track it as the user's ongoing conversation. Return the previous one."""
+        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M")
+        filename = conversation_path(
+            self.valves.save_path, conversation_id, self.valves.extension, self.valves.shard_levels
+        )
+        filename.parent.mkdir(parents=True, exist_ok=True)
+        intro = self.valves.intro_template.format(user=username, model=model)
+        with self._locks[hash(conversation_id) % LOCK_STRIPES]:
+            self.delete_archived(conversation_id, model)
+            self.write_conversation(filename, conversation_id, messages, username, model, timestamp, intro)
+        self._print(f"[ConversationSaver] Saved to {filename}")
+        return self.ongoing_tracker.set(
+            user_id,
+            OngoingConversation(
+                chat_id=conversation_id,
+                model=model,
+                username=username,
+            ),
+        )
 
     async def outlet(self, body: dict, user: Optional[dict] = None) -> dict:
         self._print("[ConversationSaver] outlet called")
         model = body.get("model") or "unknown"
-        self.knowledges = self.collection_loader.load()
+        self.knowledges = await asyncio.to_thread(self.collection_loader.load)
         self._print(f"[ConversationSaver] Loaded model collections: {self.knowledges}")
 
-        if (self.valves.ignore_models_not_listed and model not in self.knowledges) or (
-            self.knowledges.get(model) and self.knowledges[model].id == "0"
+        collection = self.collection_loader.resolve(model)
+        if (self.valves.ignore_models_not_listed and self.collection_loader.match(model) is None) or (
+            collection and collection.id == "0"
         ):
             self._print(f"[ConversationSaver] Model excluded: {model}")
             return body
@@ -160,49 +433,31 @@ class Pipeline:
             self._print("[ConversationSaver] No messages to save")
             return body
 
-        Path(self.valves.save_path).mkdir(parents=True, exist_ok=True)
-        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M")
-        filename = Path(self.valves.save_path, f"{conversation_id}.{self.valves.extension}")
-        intro = self.valves.intro_template.format(user=username, model=model)
-        self.delete_archived(conversation_id, model)
         try:
-            with open(filename, "w", encoding="utf-8") as f:
-                # frontmatter, usefull if used with Obsidian for example
-                f.write("---\n")
-                f.write(f'conversation_id: "{conversation_id}"\n')
-                f.write(f'date: "{timestamp}"\n')
-                f.write(f'model: "{model}"\n')
-                f.write(f'user: "{username}"\n')
-                f.write(f"---\n{intro}\n\n")
-
-                for msg in messages:
-                    role = msg.get("role", "user")
-                    content = self.clean_content(msg.get("content", ""))
-                    if not content.strip():
-                        continue
-                    speaker = username if role == "user" else role.capitalize()
-                    f.write(f"**{speaker}**: {content}\n\n")
-            data_to_update = OngoingConversation(
-                chat_id=conversation_id,
-                model=model,
-                username=username,
+            previous = await asyncio.to_thread(
+                self.save_conversation, conversation_id, messages, username, user_id, model
             )
-            previous = self.ongoing_tracker.set(
-                user_id,
-                data_to_update,
-            )
-            self._print(f"[ConversationSaver] Saved to {filename}")
             self._print(f"[ConversationSaver] Ongoing conversation updated: {previous}")
-            if self.valves.notify_url and previous and previous.chat_id != conversation_id:
-                requests.post(
-                    self.valves.notify_url,
-                    json={
-                        "chat_id": previous.chat_id,
-                        "user_id": user_id,
-                        "username": previous.username,
-                        "model": previous.model,
-                    },
-                )
+            if previous and previous.chat_id != conversation_id:
+                # Left by the user, and archived when notified
+                self.set_persisted(previous.chat_id, None)
+                if self.valves.notify_url:
+                    self._background(
+                        self.notify(
+                            {
+                                "chat_id": previous.chat_id,
+                                "user_id": user_id,
+                                "username": previous.username,
+                                "model": previous.model,
+                            }
+                        )
+                    )
         except Exception as e:
             self._print(f"[ConversationSaver] Failed to write file: {e}")
+        if (
+            self.valves.notify_url
+            and self._spool_pending
+            and time.monotonic() - self._last_flush > self.valves.notify_retry_interval
+        ):
+            self._background(self.flush_spool())
         return body
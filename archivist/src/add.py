@@ -1,26 +1,52 @@
-from datetime import datetime
-import json
+import asyncio
+from contextlib import asynccontextmanager
 from pathlib import Path
+import time
 from typing import Optional
-from webui_api import add_to_knowledge, get_chat_info, upload_file
-from config import ARCHIVE_CACHE_FILE, DEFAULT_KNOWLEDGE_ID, FILENAME_TEMPLATE, MEMORY_DIR
+from http_client import close_client
+from idle_archiver import IdleArchiver, IdleChat
+from jobs import JobQueue, JobStatus, QueueFull
+from knowledge_batcher import batch_add
+from leases import Leader, LeaseLocked, leases
+from webui_api import get_chat_info, get_existing_file, update_knowledge_file, upload_file
+from archive_index import archive_index
+from archive_store import ArchivedChat, archive_store
+from cold_storage import cold_storage
+from collection_registry import collection_registry
+from delete import delete_loop
+from config import ARCHIVE_LOCK_TTL, DEFAULT_KNOWLEDGE_ID, FILENAME_TEMPLATE, IDLE_ARCHIVE_AFTER, MEMORY_DIR
 from file_utils import (
     ModelCollection,
+    conversation_path,
+    file_hash,
     generate_filename,
     get_archive_path,
-    load_model_collections,
 )
 from logger import log
-from fastapi import FastAPI
+from metrics import archive_queue_depth, archive_seconds, notify_responses, registry
+from fastapi import FastAPI, HTTPException, Response
+from fastapi.responses import PlainTextResponse
 from pydantic import BaseModel
 
-app = FastAPI()
 
-model_collections = load_model_collections()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await archive_queue.start()
+    collection_registry.watch()
+    # Every worker runs the loops, the holder of their lease only works: its metrics are served by its own /metrics
+    delete_task = asyncio.create_task(delete_loop())
+    idle_task = asyncio.create_task(idle_archiver.run()) if IDLE_ARCHIVE_AFTER > 0 else None
+    yield
+    tasks = [task for task in (delete_task, idle_task) if task]
+    for task in tasks:
+        task.cancel()
+    # Releases their leases for another worker
+    await asyncio.gather(*tasks, return_exceptions=True)
+    await archive_queue.stop()
+    await close_client()
 
-log(
-    f"[Notify] Loading model collections...{json.dumps(model_collections)}",
-)
+
+app = FastAPI(lifespan=lifespan)
 
 
 class NotifyRequest(BaseModel):
@@ -35,60 +61,112 @@ class NotifyResponse(BaseModel):
     detail: Optional[dict[str, str]] = None
 
 
-def load_archived_ids():
-    try:
-        if ARCHIVE_CACHE_FILE.exists():
-            return json.loads(ARCHIVE_CACHE_FILE.read_text(encoding="utf-8"))
-    except Exception as e:
-        log(f"Failed to load archived_ids cache: {e}")
-    return {}
-
-
-def save_archived_ids(cache):
+def get_memory_path(chat_id: str) -> Path:
+    extention = Path(FILENAME_TEMPLATE).suffix[1:]
+    return conversation_path(MEMORY_DIR, chat_id, extention)
+
+
+async def archive_file(
+    filepath: Path,
+    chat_id: str,
+    collection: ModelCollection,
+    file_name: str,
+    user_id: Optional[str] = None,
+    username: Optional[str] = None,
+    model: Optional[str] = None,
+) -> str:
+    """
+    Send `filepath` to `collection` as `file_name`, move it to the archive and record it.
+    A conversation identical to its last archive in the same knowledge is only moved, a file already in the knowledge
+    is updated in place, and only new files are uploaded.
+    Return `archived`, `unchanged`, `upload failed` or `failed to add`.
+    """
+    content_hash = await asyncio.to_thread(file_hash, filepath)
+    previous = archive_store.get(chat_id)
+    if (
+        previous
+        and previous.file_id
+        and previous.content_hash == content_hash
+        and previous.knowledge_id == collection.id
+    ):
+        log(f"[Notify] {chat_id} unchanged since its last archive, skipping upload")
+        status, knowledge_file_id = "unchanged", previous.file_id
+    else:
+        status, knowledge_file_id = "archived", None
+        previous_id = previous.file_id if previous and previous.knowledge_id == collection.id else None
+        existing_file = await get_existing_file(collection.id, file_name, previous_id)
+        if existing_file and existing_file.get("id"):
+            if await update_knowledge_file(collection.id, existing_file["id"], file_name, filepath):
+                knowledge_file_id = existing_file["id"]
+        if not knowledge_file_id:
+            file_id = await upload_file(filepath, file_name)
+            if not file_id:
+                log("[Notify] Upload failed or no file ID returned")
+                return "upload failed"
+            knowledge_file_id = await batch_add(file_id, collection.id, file_name)
+            if not knowledge_file_id:
+                log(f"[Notify] Failed to add {file_name} to knowledge", level="warning")
+                return "failed to add"
+        log(f"[Notify] Added {chat_id} to knowledge {collection.name}")
+    archived_path = get_archive_path(filepath.name, collection.name)
+    filepath.rename(archived_path)
+    # A copy archived earlier and moved to the cold tier is outdated
+    cold_storage.delete(chat_id)
+    log(f"[Notify] Moved {filepath} to {archived_path}")
+    archive_index.add(archived_path, time.time())
+    archive_store.upsert(
+        ArchivedChat(
+            chat_id=chat_id,
+            knowledge_id=collection.id,
+            knowledge_name=collection.name,
+            file_id=knowledge_file_id,
+            filename=file_name,
+            archive_path=str(archived_path),
+            user_id=user_id,
+            username=username,
+            model=model,
+            content_hash=content_hash,
+        )
+    )
+    return status
+
+
+async def archive_conversation(data: NotifyRequest) -> NotifyResponse:
+    """Upload the conversation file of `data.chat_id`, add it to its knowledge and move it to the archive."""
+    start = time.perf_counter()
     try:
-        ARCHIVE_CACHE_FILE.write_text(json.dumps(cache, indent=2), encoding="utf-8")
-    except Exception as e:
-        log(f"Failed to save archived_ids cache: {e}")
-
+        # Workers and replicas sharing the archive database never archive the same chat at once
+        async with leases.hold(f"archive:{data.chat_id}", ARCHIVE_LOCK_TTL):
+            response = await _archive_conversation(data)
+    except LeaseLocked as e:
+        log(f"[Notify] {e}, archive of {data.chat_id} postponed")
+        response = NotifyResponse(status="locked", detail={"chat_id": data.chat_id})
+    archive_seconds.observe(time.perf_counter() - start, status=response.status)
+    return response
 
-archived_ids = load_archived_ids()
 
-
-@app.post("/notify", response_model=NotifyResponse)
-async def notify_conversation(data: NotifyRequest):
-    """
-    Notify Archivist of a new conversation to archive.
-
-    Example:
-    ```json
-    {
-      "chat_id": "89ecea6c-accc-4979-ac62-4c42a280073a",
-      "user_id": "12345",
-      "username": "Lili",
-      "model": "llama3.1:latest",
-    }
-    ```
-    """
+async def _archive_conversation(data: NotifyRequest) -> NotifyResponse:
     chat_id = data.chat_id
-    extention = Path(FILENAME_TEMPLATE).suffix[1:]
     user_id = data.user_id
     username = data.username or "User"
     model = data.model
-    filepath = Path(MEMORY_DIR) / f"{chat_id}.{extention}"
+    filepath = get_memory_path(chat_id)
     if not filepath.exists():
         log(f"[Notify] No memory file found for {chat_id} at {filepath}")
         return NotifyResponse(status="no file", detail={"chat_id": chat_id})
     log(f"[Notify] Processing archive for {chat_id}")
     try:
-        chat_info = get_chat_info(chat_id)
+        chat_info = await get_chat_info(chat_id, user_id)
         if not chat_info:
-            log(f"[Notify] Failed to get chat info for {chat_id}")
+            log(f"[Notify] Failed to get chat info for {chat_id}", level="warning")
             return NotifyResponse(status="no title", detail={"chat_id": chat_id})
+        # Chats archived when idle have no user id when their user switched to another chat since
+        user_id = user_id or chat_info.get("user_id") or ""
         title = chat_info.get("title")
         if not title:
             log(f"[Notify] No title found for {chat_id}")
             return NotifyResponse(status="no title", detail={"chat_id": chat_id})
-        collection_id = model_collections.get(model) or model_collections.get("default")
+        collection_id = collection_registry.resolve(model)
         if collection_id and collection_id.id == "0":
             log(f"[Notify] Excluded model {model}.")
             return NotifyResponse(status="excluded", detail={"chat_id": chat_id})
@@ -96,33 +174,82 @@ async def notify_conversation(data: NotifyRequest):
             collection_id = ModelCollection(id=DEFAULT_KNOWLEDGE_ID, name="default")
             log(f"[Notify] Model collection not found for {model}. Using default.")
         file_name = generate_filename(FILENAME_TEMPLATE, model, username, chat_id)
-        file_id = upload_file(filepath, file_name)
-        if not file_id:
-            log("[Notify] Upload failed or no file ID returned")
-            return NotifyResponse(status="upload failed", detail={"chat_id": chat_id})
-
-        success = add_to_knowledge(file_id, collection_id.id, file_name, filepath)
-        if success:
-            log(f"[Notify] Added {chat_id} to knowledge {collection_id.name}")
-            archived_ids[chat_id] = collection_id.id
-            save_archived_ids(archived_ids)
-            archived_path = get_archive_path(filepath.name, collection_id.name)
-            filepath.rename(archived_path)
-            log(f"[Notify] Moved {filepath} to {archived_path}")
-            archived_ids[chat_id] = {
-                "user_id": user_id,
-                "username": username,
-                "model": model,
-                "archived_at": datetime.now().isoformat(),
-            }
-            save_archived_ids(archived_ids)
-            return NotifyResponse(
-                status="archived",
-                detail={"chat_id": chat_id, "user_id": user_id, "username": username, "model": model, "title": title},
-            )
-        else:
-            log(f"[Notify] Failed to add {file_name} to knowledge")
-            return NotifyResponse(status="failed to add", detail={"chat_id": chat_id})
+        status = await archive_file(filepath, chat_id, collection_id, file_name, user_id or None, username, model)
+        if status not in ("archived", "unchanged"):
+            return NotifyResponse(status=status, detail={"chat_id": chat_id})
+        return NotifyResponse(
+            status=status,
+            detail={"chat_id": chat_id, "user_id": user_id, "username": username, "model": model, "title": title},
+        )
     except Exception as e:
-        log(f"[Notify] Error processing archive: {e}")
+        log(f"[Notify] Error processing archive: {e}", level="error")
         return NotifyResponse(status="error", detail={"chat_id": chat_id, "error": str(e)})
+
+
+archive_queue = JobQueue(archive_conversation)
+archive_queue_depth.set_function(archive_queue.depth)
+
+
+def submit_idle_chat(chat: IdleChat) -> bool:
+    """Queue the archive of a conversation left idle. Return `False` when the queue is full."""
+    data = NotifyRequest(
+        chat_id=chat.chat_id, user_id=chat.user_id or "", username=chat.username, model=chat.model or "default"
+    )
+    try:
+        archive_queue.submit(chat.chat_id, data)
+    except QueueFull:
+        return False
+    return True
+
+
+idle_archiver = IdleArchiver(submit_idle_chat, leader=Leader("idle_archiver", leases))
+
+
+@app.post("/notify", response_model=NotifyResponse, status_code=202)
+async def notify_conversation(data: NotifyRequest, response: Response):
+    """
+    Notify Archivist of a new conversation to archive.
+    The archive is done in background: the response is sent as soon as the job is queued (`202`),
+    and its progress can be followed with `GET /jobs/{chat_id}`.
+
+    Example:
+    ```json
+    {
+      "chat_id": "89ecea6c-accc-4979-ac62-4c42a280073a",
+      "user_id": "12345",
+      "username": "Lili",
+      "model": "llama3.1:latest",
+    }
+    ```
+    """
+    chat_id = data.chat_id
+    filepath = get_memory_path(chat_id)
+    if not filepath.exists():
+        log(f"[Notify] No memory file found for {chat_id} at {filepath}")
+        response.status_code = 200
+        notify_responses.inc(status="no file")
+        return NotifyResponse(status="no file", detail={"chat_id": chat_id})
+    try:
+        job = archive_queue.submit(chat_id, data)
+    except QueueFull as e:
+        log(f"[Notify] {e}, rejecting {chat_id}")
+        response.status_code = 503
+        notify_responses.inc(status="queue full")
+        return NotifyResponse(status="queue full", detail={"chat_id": chat_id})
+    notify_responses.inc(status="queued")
+    return NotifyResponse(status="queued", detail={"chat_id": chat_id, "job": job.state})
+
+
+@app.get("/jobs/{chat_id}", response_model=JobStatus)
+async def get_job(chat_id: str):
+    """Return the state of the last archive job of `chat_id`."""
+    job = archive_queue.get(chat_id)
+    if not job:
+        raise HTTPException(status_code=404, detail=f"No job for {chat_id}")
+    return job
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """Metrics in the Prometheus text format: archive results and durations, Open WebUI latencies, sweeps, caches."""
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
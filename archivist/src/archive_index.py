@@ -0,0 +1,181 @@
+import heapq
+import os
+from pathlib import Path
+import random
+import threading
+import time
+from typing import Optional
+
+from cold_storage import ColdStorage, cold_storage
+from config import ARCHIVE_CHECK_AGE_RATIO, ARCHIVE_CHECK_MAX_INTERVAL, ARCHIVE_DIR, ARCHIVE_RESCAN_INTERVAL, TIMELOOP
+from logger import log
+
+try:
+    from watchdog.events import FileSystemEventHandler
+    from watchdog.observers import Observer
+except ImportError:
+    FileSystemEventHandler = object
+    Observer = None
+
+
+class ArchiveEntry:
+    __slots__ = ("chat_id", "path", "archived_at", "next_check")
+
+    def __init__(self, chat_id: str, path: Path, archived_at: float, next_check: float):
+        self.chat_id = chat_id
+        self.path = path
+        self.archived_at = archived_at
+        self.next_check = next_check
+
+
+class ArchiveIndex:
+    """
+    In-memory index of the archived files, with the time each chat must next be checked against Open WebUI.
+    Recently archived chats are checked every `min_interval` seconds, older ones less and less often
+    (`age × age_ratio`, up to `max_interval`), so a sweep only touches the chats that are due.
+    Files moved to the `cold` tier stay indexed with their former archive path.
+    """
+
+    def __init__(
+        self,
+        root: Path = ARCHIVE_DIR,
+        min_interval: float = TIMELOOP,
+        max_interval: float = ARCHIVE_CHECK_MAX_INTERVAL,
+        age_ratio: float = ARCHIVE_CHECK_AGE_RATIO,
+        cold: ColdStorage = cold_storage,
+    ):
+        self.root = Path(root)
+        self.cold = cold
+        self.min_interval = min_interval
+        self.max_interval = max(max_interval, min_interval)
+        self.age_ratio = age_ratio
+        self._entries: dict[str, ArchiveEntry] = {}
+        self._heap: list[tuple[float, str]] = []
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, chat_id: str):
+        return chat_id in self._entries
+
+    def interval(self, archived_at: float, now: float) -> float:
+        age = max(now - archived_at, 0)
+        return min(max(age * self.age_ratio, self.min_interval), self.max_interval)
+
+    def _schedule(self, entry: ArchiveEntry, delay: float):
+        entry.next_check = time.time() + delay
+        heapq.heappush(self._heap, (entry.next_check, entry.chat_id))
+
+    def add(self, path: Path, archived_at: Optional[float] = None, delay: Optional[float] = None):
+        """Index an archived file. A new archive is checked after `min_interval`, unless `delay` is given."""
+        path = Path(path)
+        chat_id = path.stem
+        with self._lock:
+            entry = self._entries.get(chat_id)
+            if entry is not None and entry.path == path and archived_at is None:
+                return
+            entry = ArchiveEntry(chat_id, path, archived_at or time.time(), 0)
+            self._entries[chat_id] = entry
+            self._schedule(entry, self.min_interval if delay is None else delay)
+
+    def discard(self, chat_id: str):
+        with self._lock:
+            self._entries.pop(chat_id, None)
+
+    def get(self, chat_id: str) -> Optional[ArchiveEntry]:
+        return self._entries.get(chat_id)
+
+    def paths(self) -> list[Path]:
+        with self._lock:
+            return [entry.path for entry in self._entries.values()]
+
+    def due(self, now: Optional[float] = None) -> list[Path]:
+        """Pop the files whose check is due. They must be given back with `reschedule` once checked."""
+        now = time.time() if now is None else now
+        due = []
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now:
+                next_check, chat_id = heapq.heappop(self._heap)
+                entry = self._entries.get(chat_id)
+                # Stale heap item: the entry was removed or rescheduled since
+                if entry is None or entry.next_check != next_check:
+                    continue
+                due.append(entry.path)
+        return due
+
+    def reschedule(self, paths: list[Path], delay: Optional[float] = None):
+        """Schedule the next check of `paths`, after `delay` or the interval matching their age."""
+        now = time.time()
+        with self._lock:
+            for path in paths:
+                entry = self._entries.get(Path(path).stem)
+                if entry is not None:
+                    self._schedule(entry, self.interval(entry.archived_at, now) if delay is None else delay)
+
+    def scan(self):
+        """Walk the archive once and reconcile the index with the files on disk."""
+        found: dict[str, tuple[Path, float]] = {}
+        stack = [self.root]
+        while stack:
+            try:
+                with os.scandir(stack.pop()) as it:
+                    for item in it:
+                        if item.is_dir(follow_symlinks=False):
+                            stack.append(Path(item.path))
+                        elif item.is_file(follow_symlinks=False):
+                            path = Path(item.path)
+                            found[path.stem] = (path, item.stat().st_mtime)
+            except FileNotFoundError:
+                continue
+        for cold in self.cold.entries():
+            found.setdefault(cold.chat_id, (Path(cold.archive_path), cold.mtime))
+        now = time.time()
+        with self._lock:
+            for chat_id in set(self._entries) - set(found):
+                del self._entries[chat_id]
+        for chat_id, (path, mtime) in found.items():
+            if chat_id not in self._entries:
+                # Spread the first checks of existing archives over their interval
+                self.add(path, mtime, delay=random.uniform(0, self.interval(mtime, now)))
+        return len(found)
+
+
+class ArchiveEventHandler(FileSystemEventHandler):
+    def __init__(self, index: ArchiveIndex):
+        self.index = index
+
+    def on_created(self, event):
+        if not event.is_directory:
+            self.index.add(Path(event.src_path))
+
+    def on_moved(self, event):
+        if not event.is_directory:
+            self.index.discard(Path(event.src_path).stem)
+            if Path(event.dest_path).is_relative_to(self.index.root):
+                self.index.add(Path(event.dest_path))
+
+    def on_deleted(self, event):
+        # Packed files are deleted once in the cold tier, where they are still archived
+        if not event.is_directory and Path(event.src_path).stem not in self.index.cold:
+            self.index.discard(Path(event.src_path).stem)
+
+
+def watch_archive(index: ArchiveIndex):
+    """
+    Keep `index` in sync with external changes of the archive directory using inotify (`watchdog`).
+    Return the started observer, to `stop()` when done, or `None` if `watchdog` is not installed: the caller must
+    rescan every `ARCHIVE_RESCAN_INTERVAL` instead.
+    """
+    if Observer is None:
+        log(f"[Archive index] watchdog not installed, rescanning every {ARCHIVE_RESCAN_INTERVAL}s")
+        return None
+    observer = Observer()
+    observer.schedule(ArchiveEventHandler(index), str(index.root), recursive=True)
+    observer.daemon = True
+    observer.start()
+    log(f"[Archive index] Watching {index.root}")
+    return observer
+
+
+archive_index = ArchiveIndex()
@@ -0,0 +1,190 @@
+from collections import namedtuple
+from datetime import datetime
+import json
+from pathlib import Path
+import sqlite3
+import threading
+from typing import Optional
+
+from config import ARCHIVE_CACHE_FILE, ARCHIVE_DB
+from logger import log
+
+ArchivedChat = namedtuple(
+    "ArchivedChat",
+    [
+        "chat_id",
+        "knowledge_id",
+        "knowledge_name",
+        "file_id",
+        "filename",
+        "archive_path",
+        "user_id",
+        "username",
+        "model",
+        "archived_at",
+        "updated_at",
+        "content_hash",
+    ],
+    defaults=(None,) * 11,
+)
+
+# column -> SQL type. New columns are added to existing databases on startup.
+COLUMNS: dict[str, str] = {
+    "chat_id": "TEXT PRIMARY KEY",
+    "knowledge_id": "TEXT",
+    "knowledge_name": "TEXT",
+    "file_id": "TEXT",
+    "filename": "TEXT",
+    "archive_path": "TEXT",
+    "user_id": "TEXT",
+    "username": "TEXT",
+    "model": "TEXT",
+    "archived_at": "TEXT",
+    "updated_at": "TEXT",
+    "content_hash": "TEXT",  # sha256 of the archived file, to skip unchanged conversations
+}
+
+INDEXES: dict[str, str] = {
+    "idx_archived_chats_knowledge": "knowledge_id",
+    "idx_archived_chats_user": "user_id",
+    "idx_archived_chats_updated": "updated_at",
+}
+
+
+class ArchiveStore:
+    """
+    Archived chats state, kept in a SQLite database in WAL mode.
+    Each thread gets its own connection, writes are serialized by SQLite.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()
+        self._init_schema()
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=30000")
+            self._local.conn = conn
+        return conn
+
+    def _init_schema(self):
+        columns = ", ".join(f"{name} {kind}" for name, kind in COLUMNS.items())
+        self.conn.execute(f"CREATE TABLE IF NOT EXISTS archived_chats ({columns})")
+        existing = {row["name"] for row in self.conn.execute("PRAGMA table_info(archived_chats)")}
+        for name, kind in COLUMNS.items():
+            if name not in existing:
+                self.conn.execute(f"ALTER TABLE archived_chats ADD COLUMN {name} {kind}")
+        for index, column in INDEXES.items():
+            self.conn.execute(f"CREATE INDEX IF NOT EXISTS {index} ON archived_chats ({column})")
+
+    @staticmethod
+    def _to_record(row: Optional[sqlite3.Row]) -> Optional[ArchivedChat]:
+        if row is None:
+            return None
+        return ArchivedChat(**{key: row[key] for key in ArchivedChat._fields})
+
+    def get(self, chat_id: str) -> Optional[ArchivedChat]:
+        row = self.conn.execute("SELECT * FROM archived_chats WHERE chat_id = ?", (chat_id,)).fetchone()
+        return self._to_record(row)
+
+    def upsert(self, record: ArchivedChat):
+        """Insert or update `record`. `None` fields keep the stored value, `archived_at` is kept from the first archive."""
+        now = datetime.now().isoformat()
+        record = record._replace(archived_at=record.archived_at or now, updated_at=record.updated_at or now)
+        fields = ArchivedChat._fields
+        updates = ", ".join(
+            f"{name} = COALESCE(excluded.{name}, archived_chats.{name})"
+            for name in fields
+            if name not in ("chat_id", "archived_at")
+        )
+        self.conn.execute(
+            f"INSERT INTO archived_chats ({', '.join(fields)}) VALUES ({', '.join('?' * len(fields))}) "
+            f"ON CONFLICT(chat_id) DO UPDATE SET {updates}",
+            tuple(record),
+        )
+
+    def delete(self, chat_id: str):
+        self.conn.execute("DELETE FROM archived_chats WHERE chat_id = ?", (chat_id,))
+
+    def by_knowledge(self, knowledge_id: str) -> list[ArchivedChat]:
+        rows = self.conn.execute("SELECT * FROM archived_chats WHERE knowledge_id = ?", (knowledge_id,))
+        return [self._to_record(row) for row in rows]
+
+    def by_user(self, user_id: str) -> list[ArchivedChat]:
+        rows = self.conn.execute("SELECT * FROM archived_chats WHERE user_id = ?", (user_id,))
+        return [self._to_record(row) for row in rows]
+
+    def updated_since(self, since: str) -> list[ArchivedChat]:
+        """Chats archived or updated since `since` (ISO time), by any process using the database."""
+        rows = self.conn.execute("SELECT * FROM archived_chats WHERE updated_at >= ?", (since,))
+        return [self._to_record(row) for row in rows]
+
+    def count(self) -> int:
+        return self.conn.execute("SELECT COUNT(*) FROM archived_chats").fetchone()[0]
+
+    def migrate_from_json(self, json_path: Path) -> int:
+        """
+        Import the legacy `archived_ids.json` cache, then rename it to `archived_ids.json.migrated`.
+        Values are either a knowledge id or a dict with `user_id`, `username`, `model` and `archived_at`.
+        Every worker runs it on import: the write lock taken by `BEGIN IMMEDIATE` lets a single one migrate the file.
+        """
+        if not json_path.exists():
+            return 0
+        migrated = json_path.with_name(json_path.name + ".migrated")
+        self.conn.execute("BEGIN IMMEDIATE")
+        renamed = False
+        try:
+            # Checked again under the lock, another worker may have migrated it meanwhile
+            records = self._read_legacy_json(json_path)
+            for record in records or []:
+                self.upsert(record)
+            if records is not None:
+                json_path.rename(migrated)
+                renamed = True
+            self.conn.execute("COMMIT")
+        except Exception:
+            self.conn.execute("ROLLBACK")
+            if renamed:
+                migrated.rename(json_path)
+            raise
+        if records is None:
+            return 0
+        log(f"[Store] Migrated {len(records)} archived chats from {json_path}")
+        return len(records)
+
+    @staticmethod
+    def _read_legacy_json(json_path: Path) -> Optional[list[ArchivedChat]]:
+        """Records of the legacy cache, `None` when it is gone or unreadable."""
+        try:
+            cache = json.loads(json_path.read_text(encoding="utf-8"))
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            log(f"[Store] Failed to read {json_path} for migration: {e}", level="warning")
+            return None
+        records = []
+        for chat_id, value in cache.items():
+            if isinstance(value, dict):
+                records.append(
+                    ArchivedChat(
+                        chat_id=chat_id,
+                        user_id=value.get("user_id"),
+                        username=value.get("username"),
+                        model=value.get("model"),
+                        archived_at=value.get("archived_at"),
+                    )
+                )
+            else:
+                records.append(ArchivedChat(chat_id=chat_id, knowledge_id=value))
+        return records
+
+archive_store = ArchiveStore(ARCHIVE_DB)
+archive_store.migrate_from_json(ARCHIVE_CACHE_FILE)
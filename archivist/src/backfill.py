@@ -0,0 +1,200 @@
+"""
+Archive the conversations already waiting in `MEMORY_DIR`, without waiting for a `/notify` of the pipeline.
+
+    python backfill.py [--dry-run] [--concurrency 8] [--batch-size 200] [--min-age 3600] [--rate 20]
+
+Files are grouped by target collection (from their frontmatter and `model_collections.json`) and archived in
+parallel batches. Archived files leave `MEMORY_DIR`, so an interrupted run is resumed by running it again.
+Chats are listed once per run, those missing from the listing are checked one by one: the files of chats deleted
+in Open WebUI are left in place and reported as `deleted`.
+"""
+
+import argparse
+import asyncio
+from collections import Counter, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+import time
+from typing import Optional
+
+from add import archive_file
+from archive_store import archive_store
+from collection_registry import CollectionRegistry, collection_registry
+from config import (
+    ARCHIVE_LOCK_TTL,
+    DEFAULT_KNOWLEDGE_ID,
+    FILENAME_TEMPLATE,
+    MEMORY_DIR,
+    SWEEP_CONCURRENCY,
+    SWEEP_RATE_LIMIT,
+)
+from file_utils import (
+    ModelCollection,
+    extract_from_file,
+    generate_filename,
+    iter_conversation_files,
+)
+from http_client import close_client
+from leases import LeaseLocked, leases
+from logger import flush_logs, log
+from rate_limit import RateLimiter, current_limiter
+from token_router import token_router
+from webui_api import get_chat_info, is_webui_reachable, list_all_chat_ids
+
+BackfillItem = namedtuple("BackfillItem", ["chat_id", "path", "model", "user"])
+DONE_STATUSES = {"archived", "unchanged", "already archived", "excluded", "deleted"}
+
+
+def scan_memory_dir(memory_dir: Path, extension: str, min_age: float = 0) -> list[Path]:
+    """Conversation files of `memory_dir` (not the archive) untouched for at least `min_age` seconds."""
+    limit = time.time() - min_age
+    files = []
+    for entry in iter_conversation_files(memory_dir, extension):
+        if entry.stat().st_mtime <= limit:
+            files.append(Path(entry.path))
+    return sorted(files)
+
+
+def already_archived(path: Path) -> bool:
+    """`path` was archived by a previous run and has not changed since."""
+    record = archive_store.get(path.stem)
+    if not record or not record.file_id or not record.updated_at:
+        return False
+    try:
+        return path.stat().st_mtime <= datetime.fromisoformat(record.updated_at).timestamp()
+    except (OSError, ValueError):
+        return False
+
+
+def plan(
+    files: list[Path], registry: CollectionRegistry = collection_registry, workers: int = 8
+) -> tuple[dict[ModelCollection, list[BackfillItem]], Counter]:
+    """Read the frontmatter of `files` and group them by target collection. Return the groups and the skipped counts."""
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        infos = list(pool.map(extract_from_file, files))
+    groups: dict[ModelCollection, list[BackfillItem]] = {}
+    skipped: Counter = Counter()
+    for path, info in zip(files, infos):
+        if already_archived(path):
+            skipped["already archived"] += 1
+            continue
+        collection = registry.resolve(info.model)
+        if collection and collection.id == "0":
+            skipped["excluded"] += 1
+            continue
+        if not collection:
+            collection = ModelCollection(id=DEFAULT_KNOWLEDGE_ID, name="default")
+        groups.setdefault(collection, []).append(BackfillItem(path.stem, path, info.model, info.user))
+    return groups, skipped
+
+
+async def check_chat(chat_id: str, known_ids: set[str]) -> Optional[str]:
+    """Status skipping the archive of `chat_id` (`deleted`, `no title`), or `None` when it exists in Open WebUI."""
+    if chat_id in known_ids:
+        return None
+    chat_info = await get_chat_info(chat_id)
+    if chat_info and chat_info.get("title"):
+        return None
+    if not chat_info and token_router.is_missing(chat_id):
+        # Not found with any key, not a failed lookup
+        return "deleted"
+    return "no title"
+
+
+async def archive_item(item: BackfillItem, collection: ModelCollection, known_ids: set[str]) -> str:
+    try:
+        status = await check_chat(item.chat_id, known_ids)
+        if status:
+            log(f"[Backfill] {item.chat_id} skipped: {status}")
+            return status
+        file_name = generate_filename(FILENAME_TEMPLATE, item.model, item.user, item.chat_id)
+        # Same lock as the archives of the API, the idle archiver and the other replicas
+        async with leases.hold(f"archive:{item.chat_id}", ARCHIVE_LOCK_TTL):
+            if not item.path.exists():
+                return "no file"
+            return await archive_file(
+                item.path, item.chat_id, collection, file_name, username=item.user, model=item.model
+            )
+    except LeaseLocked as e:
+        log(f"[Backfill] {e}, skipped")
+        return "locked"
+    except Exception as e:
+        log(f"[Backfill] Error archiving {item.path.name}: {e}", level="error")
+        return "error"
+
+
+async def backfill(
+    memory_dir: Path = MEMORY_DIR,
+    dry_run: bool = False,
+    concurrency: int = SWEEP_CONCURRENCY,
+    batch_size: int = 200,
+    min_age: float = 3600,
+    rate: float = SWEEP_RATE_LIMIT,
+) -> Counter:
+    """Archive the files of `memory_dir`. Return the count of each result (`archived`, `upload failed`…)."""
+    extension = Path(FILENAME_TEMPLATE).suffix[1:]
+    files = await asyncio.to_thread(scan_memory_dir, Path(memory_dir), extension, min_age)
+    groups, results = await asyncio.to_thread(plan, files, collection_registry)
+    total = sum(len(items) for items in groups.values())
+    log(f"[Backfill] {len(files)} files found, {total} to archive in {len(groups)} collections")
+    for collection, items in groups.items():
+        log(f"[Backfill]   {collection.name} ({collection.id}): {len(items)} files")
+    if dry_run or not total:
+        return results
+    if not await is_webui_reachable():
+        log("[Backfill] 🚫 WebUI not reachable, aborting", level="error")
+        return results
+
+    current_limiter.set(RateLimiter(rate=rate, per_key=concurrency))
+    known_ids, complete = await list_all_chat_ids()
+    if not complete:
+        log("[Backfill] ⚠️ Chat listing incomplete, unlisted chats are checked one by one", level="warning")
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run(item: BackfillItem, collection: ModelCollection) -> str:
+        async with semaphore:
+            return await archive_item(item, collection, known_ids)
+
+    done = 0
+    started = time.monotonic()
+    for collection, items in groups.items():
+        for i in range(0, len(items), batch_size):
+            batch = items[i : i + batch_size]
+            results.update(await asyncio.gather(*(run(item, collection) for item in batch)))
+            done += len(batch)
+            rate_done = done / max(time.monotonic() - started, 1e-6)
+            summary = ", ".join(f"{status}: {count}" for status, count in sorted(results.items()))
+            log(f"[Backfill] {done}/{total} ({rate_done:.1f} files/s) | {summary}")
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Archive the conversations waiting in MEMORY_DIR.")
+    parser.add_argument("--memory-dir", type=Path, default=MEMORY_DIR)
+    parser.add_argument("--dry-run", action="store_true", help="only list what would be archived")
+    parser.add_argument("--concurrency", type=int, default=SWEEP_CONCURRENCY, help="files archived at once")
+    parser.add_argument("--batch-size", type=int, default=200, help="files between two progress reports")
+    parser.add_argument(
+        "--min-age", type=float, default=3600, help="skip files modified in the last N seconds (ongoing chats)"
+    )
+    parser.add_argument("--rate", type=float, default=SWEEP_RATE_LIMIT, help="requests per second, 0: unlimited")
+    args = parser.parse_args(argv)
+
+    async def run():
+        try:
+            return await backfill(
+                args.memory_dir, args.dry_run, max(args.concurrency, 1), max(args.batch_size, 1), args.min_age, args.rate
+            )
+        finally:
+            await close_client()
+
+    results = asyncio.run(run())
+    log(f"[Backfill] Done: {dict(results)}")
+    flush_logs()
+    failed = sum(count for status, count in results.items() if status not in DONE_STATUSES)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
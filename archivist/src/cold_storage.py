@@ -0,0 +1,380 @@
+"""
+Cold tier of the archive: archived files untouched for `COLD_STORAGE_AFTER` seconds are packed into compressed
+segment files of `COLD_STORAGE_DIR` and removed from `ARCHIVE_DIR`.
+
+    python cold_storage.py pack [--older-than 2592000]
+    python cold_storage.py restore <chat_id>... [--to DIR]
+    python cold_storage.py stats
+"""
+
+import argparse
+from collections import namedtuple
+import os
+from pathlib import Path
+import shutil
+import threading
+import time
+from typing import Iterator, Optional
+import zlib
+
+from archive_store import ArchiveStore, archive_store
+from config import (
+    ARCHIVE_DIR,
+    COLD_SEGMENT_SIZE,
+    COLD_STORAGE_AFTER,
+    COLD_STORAGE_COMPRESSION,
+    COLD_STORAGE_DIR,
+    FILENAME_TEMPLATE,
+)
+from file_utils import Info, extract_from_file
+from logger import flush_logs, log
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+ColdEntry = namedtuple(
+    "ColdEntry", ["chat_id", "segment", "position", "length", "size", "archive_path", "model", "username", "mtime"]
+)
+
+# column -> SQL type of the `cold_files` table, next to `archived_chats` in the archive database
+COLD_COLUMNS: dict[str, str] = {
+    "chat_id": "TEXT PRIMARY KEY",
+    "segment": "TEXT",  # segment file name in the cold directory
+    "position": "INTEGER",  # start of the compressed file in the segment
+    "length": "INTEGER",  # compressed size
+    "size": "INTEGER",  # original size
+    "archive_path": "TEXT",  # where the file was in the archive, and is restored
+    "model": "TEXT",  # frontmatter, read by the delete sweep instead of the file
+    "username": "TEXT",
+    "mtime": "REAL",
+}
+
+CHUNK_SIZE = 1024 * 1024
+
+
+def compressor(extension: str):
+    if extension == ".zst":
+        return zstandard.ZstdCompressor(level=10).compressobj()
+    return zlib.compressobj(6, zlib.DEFLATED, 31)  # gzip container
+
+
+def decompressor(extension: str):
+    if extension == ".zst":
+        if zstandard is None:
+            raise RuntimeError("zstandard is not installed, zstd segments can't be read")
+        return zstandard.ZstdDecompressor().decompressobj()
+    return zlib.decompressobj(31)
+
+
+class ColdStorage:
+    """
+    Segments of compressed archived files. Each file is compressed on its own (one gzip member or zstd frame),
+    so it is read back from its position without touching the rest of the segment.
+    The index, with the `model` and `user` of each frontmatter, is a table of the archive database: the delete sweep
+    never decompresses a segment. Segments mostly made of deleted or restored files are rewritten by `compact`.
+    """
+
+    def __init__(
+        self,
+        directory: Path = COLD_STORAGE_DIR,
+        store: ArchiveStore = archive_store,
+        compression: str = COLD_STORAGE_COMPRESSION,
+        segment_size: int = COLD_SEGMENT_SIZE,
+    ):
+        self.directory = Path(directory)
+        self.store = store
+        if compression == "zstd" and zstandard is None:
+            log("[Cold] zstandard not installed, compressing with gzip", level="warning")
+        self.extension = ".zst" if compression == "zstd" and zstandard is not None else ".gz"
+        self.segment_size = segment_size
+        self._lock = threading.RLock()
+        columns = ", ".join(f"{name} {kind}" for name, kind in COLD_COLUMNS.items())
+        self.store.conn.execute(f"CREATE TABLE IF NOT EXISTS cold_files ({columns})")
+        self.store.conn.execute("CREATE INDEX IF NOT EXISTS idx_cold_files_segment ON cold_files (segment)")
+
+    @staticmethod
+    def _to_entry(row) -> ColdEntry:
+        return ColdEntry(**{key: row[key] for key in ColdEntry._fields})
+
+    def get(self, chat_id: str) -> Optional[ColdEntry]:
+        row = self.store.conn.execute("SELECT * FROM cold_files WHERE chat_id = ?", (chat_id,)).fetchone()
+        return None if row is None else self._to_entry(row)
+
+    def __contains__(self, chat_id: str) -> bool:
+        return self.store.conn.execute("SELECT 1 FROM cold_files WHERE chat_id = ?", (chat_id,)).fetchone() is not None
+
+    def entries(self) -> list[ColdEntry]:
+        return [self._to_entry(row) for row in self.store.conn.execute("SELECT * FROM cold_files")]
+
+    def info(self, chat_id: str) -> Optional[Info]:
+        """Frontmatter of a cold file, from the index."""
+        entry = self.get(chat_id)
+        return None if entry is None else Info(entry.model or "default", entry.username or "User")
+
+    def delete(self, chat_id: str):
+        """Forget a cold file (deleted chat, or archived again). Its bytes are reclaimed by `compact`."""
+        self.store.conn.execute("DELETE FROM cold_files WHERE chat_id = ?", (chat_id,))
+
+    def set_archive_path(self, chat_id: str, archive_path: Path):
+        """Restore the file of `chat_id` to `archive_path` from now on (archive layout changed)."""
+        self.store.conn.execute(
+            "UPDATE cold_files SET archive_path = ? WHERE chat_id = ?", (str(archive_path), chat_id)
+        )
+
+    def _segments(self) -> list[Path]:
+        return sorted(self.directory.glob("segment-*.*"))
+
+    def _new_segment(self) -> Path:
+        numbers = [int(path.name.split("-")[1].split(".")[0]) for path in self._segments()]
+        return Path(self.directory, f"segment-{max(numbers, default=0) + 1:06d}{self.extension}")
+
+    def _writable_segment(self) -> Path:
+        segments = [path for path in self._segments() if path.suffix == self.extension]
+        if segments and segments[-1].stat().st_size < self.segment_size:
+            return segments[-1]
+        return self._new_segment()
+
+    @staticmethod
+    def _close(f):
+        f.flush()
+        os.fsync(f.fileno())
+        f.close()
+
+    def pack(self, paths: list[Path], older_than: float = COLD_STORAGE_AFTER, now: Optional[float] = None) -> int:
+        """
+        Move the files of `paths` untouched for `older_than` seconds to the segments. Return the number of files packed.
+        Segments are synced before the index is written, and a file is only removed once indexed.
+        """
+        cutoff = (time.time() if now is None else now) - older_than
+        candidates = []
+        for path in paths:
+            try:
+                stat = Path(path).stat()
+            except OSError:
+                continue  # already cold, or gone
+            if stat.st_mtime <= cutoff:
+                candidates.append((Path(path), stat))
+        if not candidates:
+            return 0
+
+        with self._lock:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            packed: list[tuple[ColdEntry, os.stat_result]] = []
+            segment, f = None, None
+            try:
+                for path, stat in candidates:
+                    if f is None or f.tell() >= self.segment_size:
+                        if f is not None:
+                            self._close(f)
+                        segment = self._writable_segment()
+                        f = open(segment, "ab")
+                    position = f.tell()
+                    try:
+                        compress = compressor(self.extension)
+                        with open(path, "rb") as source:
+                            for chunk in iter(lambda: source.read(CHUNK_SIZE), b""):
+                                f.write(compress.compress(chunk))
+                        f.write(compress.flush())
+                    except OSError as e:
+                        log(f"[Cold] Failed to pack {path}: {e}", level="warning")
+                        f.truncate(position)
+                        continue
+                    info = extract_from_file(path)
+                    entry = ColdEntry(
+                        path.stem,
+                        segment.name,
+                        position,
+                        f.tell() - position,
+                        stat.st_size,
+                        str(path),
+                        info.model,
+                        info.user,
+                        stat.st_mtime,
+                    )
+                    packed.append((entry, stat))
+            finally:
+                if f is not None:
+                    self._close(f)
+            self._insert([entry for entry, _ in packed])
+
+            done = 0
+            for entry, stat in packed:
+                path = Path(entry.archive_path)
+                try:
+                    current = path.stat()
+                except OSError:
+                    current = None
+                # Replaced while being packed (conversation resumed and archived again): the new file stays hot
+                if current is None or (current.st_ino, current.st_mtime_ns, current.st_size) != (
+                    stat.st_ino,
+                    stat.st_mtime_ns,
+                    stat.st_size,
+                ):
+                    self.delete(entry.chat_id)
+                    continue
+                path.unlink()
+                done += 1
+        log(f"[Cold] Packed {done} archived files")
+        return done
+
+    def _insert(self, entries: list[ColdEntry]):
+        if not entries:
+            return
+        conn = self.store.conn
+        fields = ColdEntry._fields
+        conn.execute("BEGIN")
+        try:
+            conn.executemany(
+                f"INSERT OR REPLACE INTO cold_files ({', '.join(fields)}) VALUES ({', '.join('?' * len(fields))})",
+                [tuple(entry) for entry in entries],
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _relocate(self, moved: list[tuple[ColdEntry, str, int]]):
+        """Point the entries copied by `compact` to their new place, unless they were deleted or replaced meanwhile."""
+        if not moved:
+            return
+        conn = self.store.conn
+        conn.execute("BEGIN")
+        try:
+            conn.executemany(
+                "UPDATE cold_files SET segment = ?, position = ? WHERE chat_id = ? AND segment = ? AND position = ?",
+                [(segment, position, old.chat_id, old.segment, old.position) for old, segment, position in moved],
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _read_raw(self, entry: ColdEntry) -> Iterator[bytes]:
+        with open(Path(self.directory, entry.segment), "rb") as f:
+            f.seek(entry.position)
+            remaining = entry.length
+            while remaining > 0:
+                chunk = f.read(min(CHUNK_SIZE, remaining))
+                if not chunk:
+                    raise EOFError(f"Segment {entry.segment} is truncated")
+                remaining -= len(chunk)
+                yield chunk
+
+    def iter_content(self, entry: ColdEntry) -> Iterator[bytes]:
+        """Original content of a cold file, decompressed chunk by chunk."""
+        decompress = decompressor(Path(entry.segment).suffix)
+        for chunk in self._read_raw(entry):
+            data = decompress.decompress(chunk)
+            if data:
+                yield data
+        tail = decompress.flush()
+        if tail:
+            yield tail
+
+    def restore(self, chat_id: str, target: Optional[Path] = None) -> Optional[Path]:
+        """Write a cold file back to `target` (its archive path by default) and drop it from the cold tier."""
+        with self._lock:
+            entry = self.get(chat_id)
+            if entry is None:
+                return None
+            target = Path(target or entry.archive_path)
+            if target.is_dir():
+                target = target / Path(entry.archive_path).name
+            target.parent.mkdir(parents=True, exist_ok=True)
+            # Written aside, so the archive watcher only sees the complete file
+            tmp = Path(self.directory, f"{chat_id}.restoring")
+            with open(tmp, "wb") as out:
+                for chunk in self.iter_content(entry):
+                    out.write(chunk)
+            os.utime(tmp, (entry.mtime, entry.mtime))
+            shutil.move(tmp, target)
+            self.delete(chat_id)
+        log(f"[Cold] Restored {chat_id} to {target}")
+        return target
+
+    def compact(self, min_live_ratio: float = 0.5) -> int:
+        """
+        Rewrite the segments whose live files take less than `min_live_ratio` of their size into a new segment
+        (compressed bytes are copied as is), and remove the segments left empty. Return the number of segments removed.
+        """
+        with self._lock:
+            live = dict(
+                self.store.conn.execute("SELECT segment, SUM(length) FROM cold_files GROUP BY segment").fetchall()
+            )
+            sparse = []
+            for segment in self._segments():
+                if live.get(segment.name, 0) < segment.stat().st_size * min_live_ratio:
+                    sparse.append(segment)
+            if not sparse:
+                return 0
+            moved: list[tuple[ColdEntry, str, int]] = []
+            # Compressed bytes are copied as is: one new segment per codec
+            targets: dict[str, Path] = {}
+            for segment in sparse:
+                if not live.get(segment.name):
+                    continue
+                if segment.suffix not in targets:
+                    targets[segment.suffix] = Path(self.directory, self._new_segment().stem + segment.suffix)
+                    targets[segment.suffix].touch()
+                target = targets[segment.suffix]
+                rows = self.store.conn.execute("SELECT * FROM cold_files WHERE segment = ?", (segment.name,))
+                with open(target, "ab") as out:
+                    for entry in [self._to_entry(row) for row in rows]:
+                        position = out.tell()
+                        for chunk in self._read_raw(entry):
+                            out.write(chunk)
+                        moved.append((entry, target.name, position))
+                    self._close(out)
+            self._relocate(moved)
+            for segment in sparse:
+                segment.unlink(missing_ok=True)
+        log(f"[Cold] Compacted {len(sparse)} segments, {len(moved)} files moved")
+        return len(sparse)
+
+    def stats(self) -> dict[str, int]:
+        files, size, length = self.store.conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0), COALESCE(SUM(length), 0) FROM cold_files"
+        ).fetchone()
+        segments = self._segments() if self.directory.exists() else []
+        return {
+            "files": files,
+            "original_bytes": size,
+            "compressed_bytes": length,
+            "segments": len(segments),
+            "segment_bytes": sum(path.stat().st_size for path in segments),
+        }
+
+
+cold_storage = ColdStorage()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Cold tier of the archive: compressed segments of old archived files.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    pack = commands.add_parser("pack", help="pack the archived files untouched for --older-than seconds")
+    pack.add_argument("--older-than", type=float, default=COLD_STORAGE_AFTER or 30 * 86400)
+    restore = commands.add_parser("restore", help="write cold files back to the archive")
+    restore.add_argument("chat_ids", nargs="+")
+    restore.add_argument("--to", type=Path, help="directory to restore to, instead of the archive")
+    commands.add_parser("stats", help="size of the cold tier")
+    args = parser.parse_args(argv)
+
+    status = 0
+    if args.command == "pack":
+        extension = Path(FILENAME_TEMPLATE).suffix
+        cold_storage.pack(sorted(ARCHIVE_DIR.rglob(f"*{extension}")), args.older_than)
+        cold_storage.compact()
+    elif args.command == "restore":
+        for chat_id in args.chat_ids:
+            if cold_storage.restore(chat_id, args.to) is None:
+                log(f"[Cold] {chat_id} is not in cold storage", level="warning")
+                status = 1
+    log(f"[Cold] {cold_storage.stats()}")
+    flush_logs()
+    return status
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
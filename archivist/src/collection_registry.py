@@ -0,0 +1,153 @@
+from collections import namedtuple
+from fnmatch import fnmatchcase
+import json
+from pathlib import Path
+import threading
+import time
+from typing import Optional
+
+from config import COLLECTIONS_FILE, COLLECTIONS_RELOAD_INTERVAL
+from file_utils import ModelCollection
+from logger import log
+
+try:
+    from watchdog.events import FileSystemEventHandler
+    from watchdog.observers import Observer
+except ImportError:
+    FileSystemEventHandler = object
+    Observer = None
+
+GLOB_CHARS = set("*?[")
+MAX_RESOLVED = 4096  # models whose collection is kept
+
+# Lookup tables built from one version of the file, swapped at once on reload
+CollectionTable = namedtuple("CollectionTable", ["exact", "patterns", "default", "version"])
+EMPTY_TABLE = CollectionTable({}, (), None, None)
+
+
+def build_table(raw: dict, version=None) -> CollectionTable:
+    """
+    Validate the entries of `model_collections.json` (`{"id": str, "name": str}`, invalid ones are skipped) and build
+    the lookup tables: exact names, with `model:latest` also reachable as `model`, then glob patterns in file order.
+    """
+    if not isinstance(raw, dict):
+        raise ValueError("model collections must be a JSON object")
+    exact: dict[str, ModelCollection] = {}
+    patterns: list[tuple[str, ModelCollection]] = []
+    for key, values in raw.items():
+        if not isinstance(values, dict) or not all(isinstance(values.get(f), str) and values[f] for f in ("id", "name")):
+            log(f"[Collections] Invalid entry {key!r}: `id` and `name` are required, ignored", level="warning")
+            continue
+        collection = ModelCollection(id=values["id"], name=values["name"])
+        if GLOB_CHARS & set(key):
+            patterns.append((key, collection))
+            continue
+        exact[key] = collection
+        if key.endswith(":latest"):
+            exact.setdefault(key[: -len(":latest")], collection)
+    return CollectionTable(exact, tuple(patterns), exact.get("default"), version)
+
+
+class CollectionRegistry:
+    """
+    Collection of each model, from `model_collections.json`, shared by the API and the delete loop threads.
+    Models are resolved by exact name, then by name without tag (`llama3:8b` → `llama3`), then by glob pattern
+    (`mistral*`), else to `default`. Results are kept until the file changes.
+    The file is checked at most every `check_interval` seconds (immediately on change when watched with `watchdog`),
+    and an invalid file keeps the previous mapping.
+    """
+
+    def __init__(self, path: Path = COLLECTIONS_FILE, check_interval: float = COLLECTIONS_RELOAD_INTERVAL):
+        self.path = Path(path)
+        self.check_interval = check_interval
+        self._table = EMPTY_TABLE
+        self._resolved: dict[str, Optional[ModelCollection]] = {}
+        self._next_check = 0.0
+        self._lock = threading.Lock()
+        self._observer = None
+        self.reload(force=True)
+
+    def _file_version(self) -> Optional[tuple[int, int]]:
+        try:
+            stat = self.path.stat()
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def reload(self, force: bool = False) -> bool:
+        """Reload the file if it changed since the last load. Return `True` when the mapping changed."""
+        with self._lock:
+            self._next_check = time.monotonic() + self.check_interval
+            version = self._file_version()
+            if version == self._table.version and not force:
+                return False
+            if version is None:
+                log(f"[Collections] {self.path} not found, no model collection", level="warning")
+                table = EMPTY_TABLE
+            else:
+                try:
+                    table = build_table(json.loads(self.path.read_text(encoding="utf-8")), version)
+                except Exception as e:
+                    log(f"[Collections] Failed to load {self.path}, keeping the previous mapping: {e}", level="error")
+                    # Not retried until the file changes again
+                    self._table = self._table._replace(version=version)
+                    return False
+            self._table = table
+            self._resolved = {}
+        names = {**table.exact, **dict(table.patterns)}
+        log(f"[Collections] Loaded {len(names)} model collections: {json.dumps(names)}")
+        return True
+
+    def _check(self):
+        if time.monotonic() >= self._next_check:
+            self.reload()
+
+    def resolve(self, model: Optional[str]) -> Optional[ModelCollection]:
+        """Collection of `model`, `default` if it has none, `None` if there is no default either."""
+        self._check()
+        model = model or ""
+        resolved = self._resolved
+        if model in resolved:
+            return resolved[model]
+        table = self._table
+        collection = table.exact.get(model)
+        if collection is None and ":" in model:
+            collection = table.exact.get(model.split(":", 1)[0])
+        if collection is None:
+            collection = next((c for pattern, c in table.patterns if fnmatchcase(model, pattern)), table.default)
+        if len(resolved) >= MAX_RESOLVED:
+            resolved.clear()
+        resolved[model] = collection
+        return collection
+
+    def collections(self) -> dict[str, ModelCollection]:
+        """Valid entries of the file, by key."""
+        self._check()
+        return {**self._table.exact, **dict(self._table.patterns)}
+
+    def watch(self) -> bool:
+        """Reload as soon as the file changes, with `watchdog`. Return `False` if it is not installed."""
+        if Observer is None or self._observer is not None or not self.path.parent.is_dir():
+            return False
+        self._observer = Observer()
+        self._observer.schedule(CollectionsEventHandler(self), str(self.path.parent), recursive=False)
+        self._observer.daemon = True
+        self._observer.start()
+        return True
+
+    def changed(self):
+        """Check the file on the next lookup."""
+        self._next_check = 0.0
+
+
+class CollectionsEventHandler(FileSystemEventHandler):
+    def __init__(self, registry: CollectionRegistry):
+        self.registry = registry
+
+    def on_any_event(self, event):
+        # Editors often write a temporary file then move it over the original
+        if str(self.registry.path) in (event.src_path, getattr(event, "dest_path", None)):
+            self.registry.changed()
+
+
+collection_registry = CollectionRegistry()
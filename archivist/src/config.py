@@ -8,15 +8,101 @@ TOKEN = os.getenv("WEBUI_TOKEN")
 FILENAME_TEMPLATE = os.getenv("FILENAME_TEMPLATE", "conversation_{datetime}.txt")
 TIMELOOP = int(os.getenv("TIMELOOP", 10))
 ARCHIVE_PER_KNOWLEDGE = os.getenv("ARCHIVE_PER_KNOWLEDGE", "false").lower() == "true"
+# Archived chats are checked every `age × ARCHIVE_CHECK_AGE_RATIO` seconds, between TIMELOOP and the max interval
+ARCHIVE_CHECK_AGE_RATIO = float(os.getenv("ARCHIVE_CHECK_AGE_RATIO", 0.1))
+ARCHIVE_CHECK_MAX_INTERVAL = float(os.getenv("ARCHIVE_CHECK_MAX_INTERVAL", 86400))
+# Concurrent checks in a delete sweep, global requests per second (0: unlimited) and concurrent requests per API key
+SWEEP_CONCURRENCY = int(os.getenv("SWEEP_CONCURRENCY", 8))
+SWEEP_RATE_LIMIT = float(os.getenv("SWEEP_RATE_LIMIT", 20))
+SWEEP_PER_TOKEN_CONCURRENCY = int(os.getenv("SWEEP_PER_TOKEN_CONCURRENCY", 4))
+# The chat listing of a sweep is reused for SWEEP_LISTING_TTL seconds. A sweep with fewer due chats than
+# SWEEP_LISTING_MIN_RATIO × the last listing size confirms them one by one instead of listing every chat again
+SWEEP_LISTING_TTL = float(os.getenv("SWEEP_LISTING_TTL", 300))
+SWEEP_LISTING_MIN_RATIO = float(os.getenv("SWEEP_LISTING_MIN_RATIO", 0.02))
+# Archived files untouched for COLD_STORAGE_AFTER seconds (0: never) are packed every COLD_STORAGE_INTERVAL seconds
+# into compressed segments of COLD_SEGMENT_SIZE bytes (zstd needs the `zstandard` package, gzip otherwise)
+COLD_STORAGE_AFTER = float(os.getenv("COLD_STORAGE_AFTER", 0))
+COLD_STORAGE_INTERVAL = float(os.getenv("COLD_STORAGE_INTERVAL", 3600))
+COLD_STORAGE_COMPRESSION = os.getenv("COLD_STORAGE_COMPRESSION", "zstd").lower()  # zstd | gzip
+COLD_SEGMENT_SIZE = int(os.getenv("COLD_SEGMENT_SIZE", 64 * 1024 * 1024))
+# Conversation files are kept in MEMORY_SHARD_LEVELS levels of hash-prefix directories (`ab/cd/<chat_id>.md`),
+# 0 for a flat directory. Must match the `shard_levels` valve of the pipeline (see migrate_layout.py to change it)
+MEMORY_SHARD_LEVELS = int(os.getenv("MEMORY_SHARD_LEVELS", 0))
+# Uvicorn worker processes. Instances sharing ARCHIVE_DB coordinate through leases in it: a chat is archived by one
+# instance at a time (lock released after ARCHIVE_LOCK_TTL seconds if its holder died), and a single leader runs the
+# delete sweep, the cold storage and the idle archive, replaced LEADER_LEASE_TTL seconds after it stopped
+API_WORKERS = int(os.getenv("API_WORKERS", 1))
+LEADER_LEASE_TTL = float(os.getenv("LEADER_LEASE_TTL", 30))
+ARCHIVE_LOCK_TTL = float(os.getenv("ARCHIVE_LOCK_TTL", 600))
+# Full rescan of the archive directory, only used when watchdog (inotify) is not installed
+ARCHIVE_RESCAN_INTERVAL = float(os.getenv("ARCHIVE_RESCAN_INTERVAL", 600))
+# Archive conversations untouched for IDLE_ARCHIVE_AFTER seconds (0: only on chat switch), once their last change
+# is IDLE_ARCHIVE_DEBOUNCE seconds old, at most IDLE_ARCHIVE_MAX_PER_SCAN per scan
+IDLE_ARCHIVE_AFTER = float(os.getenv("IDLE_ARCHIVE_AFTER", 0))
+IDLE_ARCHIVE_DEBOUNCE = float(os.getenv("IDLE_ARCHIVE_DEBOUNCE", 60))
+IDLE_ARCHIVE_MAX_PER_SCAN = int(os.getenv("IDLE_ARCHIVE_MAX_PER_SCAN", 20))
+
+# -- HTTP client
+HTTP2_ENABLED = os.getenv("HTTP2_ENABLED", "true").lower() == "true"
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", 20))
+HTTP_MAX_KEEPALIVE = int(os.getenv("HTTP_MAX_KEEPALIVE", 10))
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", 5))
+HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", 30))
+# Per-endpoint read timeouts, overridable with HTTP_TIMEOUT_<ENDPOINT> (ex: HTTP_TIMEOUT_UPLOAD=300)
+HTTP_TIMEOUTS: dict[str, float] = {
+    endpoint: float(os.getenv(f"HTTP_TIMEOUT_{endpoint.upper()}", default))
+    for endpoint, default in {
+        "health": 5,
+        "chat": HTTP_TIMEOUT,
+        "knowledge": HTTP_TIMEOUT,
+        "upload": 120,
+        "update": 120,
+        "add": 120,
+        "remove": HTTP_TIMEOUT,
+        "delete": HTTP_TIMEOUT,
+    }.items()
+}
+# Uploads are streamed UPLOAD_CHUNK_SIZE bytes at a time, at most UPLOAD_MEMORY_BUDGET bytes of files in flight
+# (0: no limit), and gzip-compressed with UPLOAD_GZIP (needs a server or proxy decoding `Content-Encoding: gzip`)
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", 64 * 1024))
+UPLOAD_MEMORY_BUDGET = int(os.getenv("UPLOAD_MEMORY_BUDGET", 32 * 1024 * 1024))
+UPLOAD_GZIP = os.getenv("UPLOAD_GZIP", "false").lower() == "true"
+# model_collections.json is checked for changes at most every COLLECTIONS_RELOAD_INTERVAL seconds
+COLLECTIONS_RELOAD_INTERVAL = float(os.getenv("COLLECTIONS_RELOAD_INTERVAL", 5))
+TOKEN_NEGATIVE_TTL = float(os.getenv("TOKEN_NEGATIVE_TTL", 60))
+KNOWLEDGE_CACHE_TTL = float(os.getenv("KNOWLEDGE_CACHE_TTL", 300))
+# Files added to / removed from a knowledge while a request to it is in flight are sent together when it ends, after
+# at most KNOWLEDGE_BATCH_WINDOW seconds
+KNOWLEDGE_BATCH_WINDOW = float(os.getenv("KNOWLEDGE_BATCH_WINDOW", 0.5))
+KNOWLEDGE_BATCH_SIZE = int(os.getenv("KNOWLEDGE_BATCH_SIZE", 50))
+KNOWLEDGE_BATCH_CONCURRENCY = int(os.getenv("KNOWLEDGE_BATCH_CONCURRENCY", 4))
+
+# -- Archive jobs
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", 4))
+JOB_QUEUE_SIZE = int(os.getenv("JOB_QUEUE_SIZE", 1000))
+JOB_MAX_RETRIES = int(os.getenv("JOB_MAX_RETRIES", 5))
+JOB_RETRY_BACKOFF = float(os.getenv("JOB_RETRY_BACKOFF", 2))
+JOB_RETRY_MAX_BACKOFF = float(os.getenv("JOB_RETRY_MAX_BACKOFF", 300))
+JOB_HISTORY_SIZE = int(os.getenv("JOB_HISTORY_SIZE", 1000))
+
+# -- Logs
+LOG_LEVEL = os.getenv("LOG_LEVEL", "info").lower()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text").lower()  # text | json (one JSON object per line)
+LOG_MAX_BYTES = int(os.getenv("LOG_MAX_BYTES", 10 * 1024 * 1024))
+LOG_ROTATE_INTERVAL = float(os.getenv("LOG_ROTATE_INTERVAL", 0))  # seconds, 0 to rotate on size only
+LOG_BACKUP_COUNT = int(os.getenv("LOG_BACKUP_COUNT", 5))
+LOG_FLUSH_INTERVAL = float(os.getenv("LOG_FLUSH_INTERVAL", 0.2))
 
 # -- Dirs
 MEMORY_DIR = Path(os.getenv("MEMORY_DIR", "/app/memory"))
 COLLECTIONS_FILE = Path(os.getenv("COLLECTIONS_FILE", "/app/model_collections.json"))
 USERS_API = Path(os.getenv("USERS_API", "/app/user_api.json"))
-ARCHIVE_CACHE_FILE = Path(MEMORY_DIR) / "archived_ids.json"
+ARCHIVE_CACHE_FILE = Path(MEMORY_DIR) / "archived_ids.json"  # legacy cache, migrated to ARCHIVE_DB
+ARCHIVE_DB = Path(os.getenv("ARCHIVE_DB", Path(MEMORY_DIR, "archivist.db")))
 
 # --- Path
 ARCHIVE_DIR = Path(MEMORY_DIR, "archived")
+COLD_STORAGE_DIR = Path(os.getenv("COLD_STORAGE_DIR", Path(MEMORY_DIR, "cold")))
 LOG_DIR = Path(MEMORY_DIR, "logs")
 LOG_FILE = Path(LOG_DIR, "archivist.log")
 HISTORY_LOG = Path(LOG_DIR, "archivist_history.log")
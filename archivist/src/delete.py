@@ -1,52 +1,210 @@
-import time
+import asyncio
+from datetime import datetime, timedelta
 from pathlib import Path
+import time
+from typing import Optional
 
-from webui_api import delete_file, get_chat_info, get_existing_file, is_webui_reachable, remove_from_knowledge
-from config import ARCHIVE_DIR, DEFAULT_KNOWLEDGE_ID, FILENAME_TEMPLATE, TIMELOOP
-from file_utils import ModelCollection, extract_from_file, generate_filename, load_model_collections
+from archive_index import archive_index, watch_archive
+from archive_store import archive_store
+from cold_storage import cold_storage
+from collection_registry import CollectionRegistry, collection_registry
+from knowledge_batcher import batch_remove
+from leases import Leader, leases
+from metrics import sweep_files, sweep_seconds
+from rate_limit import RateLimiter, current_limiter
+from webui_api import (
+    delete_file,
+    get_chat_info,
+    get_existing_file,
+    is_webui_reachable,
+    list_all_chat_ids,
+)
+from config import (
+    ARCHIVE_RESCAN_INTERVAL,
+    COLD_STORAGE_AFTER,
+    COLD_STORAGE_INTERVAL,
+    DEFAULT_KNOWLEDGE_ID,
+    FILENAME_TEMPLATE,
+    SWEEP_CONCURRENCY,
+    SWEEP_LISTING_MIN_RATIO,
+    SWEEP_LISTING_TTL,
+    TIMELOOP,
+)
+from file_utils import ModelCollection, extract_from_file, generate_filename
 from logger import log
 
 
-def delete_loop():
+async def delete_archived_chat(fpath: Path, registry: CollectionRegistry = collection_registry):
+    """Remove the archived file of a deleted chat from its knowledge, then from the archive."""
+    fname = fpath.name
+    chat_id = fpath.stem
+    log(f"❌ Chat info not found for {fname} | Delete it from knowledge")
+    # Files of the cold tier are not decompressed: their frontmatter is in its index
+    info = (None if fpath.exists() else cold_storage.info(chat_id)) or extract_from_file(fpath)
+    collection_id = registry.resolve(info.model)
+    if not collection_id:
+        collection_id = ModelCollection(id=DEFAULT_KNOWLEDGE_ID, name="default")
+    file_name: str = generate_filename(
+        FILENAME_TEMPLATE,
+        info.model,
+        info.user,
+        chat_id,
+    )
+    record = archive_store.get(chat_id)
+    recorded_id = record.file_id if record and record.knowledge_id == collection_id.id else None
+    existing_file = await get_existing_file(collection_id.id, file_name, recorded_id)
+    if existing_file:
+        file_id = existing_file.get("id")
+        if await delete_file(file_id):
+            if await batch_remove(file_id, collection_id.id, fname):
+                log(f"Deleted {fname} from knowledge {collection_id}")
+        else:
+            log(f"Failed to delete {fname} from knowledge {collection_id}", level="warning")
+    else:
+        log(f"File not found in knowledge {collection_id}: {fname}")
+    # remove file from archive as they are not in knowledge or deleted
+    fpath.unlink(missing_ok=True)
+    cold_storage.delete(chat_id)
+    archive_index.discard(chat_id)
+    archive_store.delete(chat_id)
+
+
+class ChatListing:
+    """
+    Chat ids listed by Open WebUI, reused by the sweeps for `ttl` seconds: a listed chat deleted meanwhile is found
+    at most `ttl` seconds later. A sweep with fewer due chats than `min_ratio` × the last listing size skips the
+    listing, confirming them one by one takes fewer calls than paging through every chat.
+    """
+
+    def __init__(self, ttl: float = SWEEP_LISTING_TTL, min_ratio: float = SWEEP_LISTING_MIN_RATIO):
+        self.ttl = ttl
+        self.min_ratio = min_ratio
+        self.ids: set[str] = set()
+        self.listed_at: Optional[float] = None
+
+    async def get(self, due: int) -> set[str]:
+        """Ids of the existing chats, empty when the `due` chats are better confirmed one by one."""
+        if self.listed_at is not None:
+            if time.monotonic() - self.listed_at < self.ttl:
+                return self.ids
+            if due < self.min_ratio * len(self.ids):
+                return set()
+        ids, complete = await list_all_chat_ids()
+        if not complete:
+            log("[Delete archive] ⚠️ Chat listing incomplete, unlisted chats are checked one by one", level="warning")
+            return ids
+        self.ids, self.listed_at = ids, time.monotonic()
+        return ids
+
+
+chat_listing = ChatListing()
+
+
+async def sweep(
+    files: list[Path], registry: CollectionRegistry = collection_registry, listing: ChatListing = chat_listing
+):
+    """
+    Check the archived `files` against the chats listed in Open WebUI (see `ChatListing`).
+    Chats missing from the listing are confirmed one by one before being deleted, as the listing can be incomplete
+    (failed key, chats in folders…) or outdated. Up to `SWEEP_CONCURRENCY` chats are confirmed and deleted at once.
+    """
+    if not files:
+        return
+    start = time.perf_counter()
+    known_ids = await listing.get(len(files))
+    semaphore = asyncio.Semaphore(SWEEP_CONCURRENCY)
+
+    async def check(fpath: Path) -> str:
+        chat_id = fpath.stem
+        if chat_id in known_ids:
+            return "listed"
+        async with semaphore:
+            try:
+                if await get_chat_info(chat_id):
+                    return "alive"
+                if not fpath.exists() and chat_id not in cold_storage:
+                    # Moved back to the memory by the pipeline while being checked: the conversation goes on
+                    archive_index.discard(chat_id)
+                    return "resumed"
+                await delete_archived_chat(fpath, registry)
+                return "deleted"
+            except Exception as e:
+                log(f"[Delete archive] Error checking {fpath.name}: {e}", level="error")
+                return "error"
+
+    for result in await asyncio.gather(*(check(fpath) for fpath in files)):
+        sweep_files.inc(result=result)
+    sweep_seconds.observe(time.perf_counter() - start)
+
+
+def index_archived_since(since: datetime) -> int:
+    """Index the files archived since `since` by the other workers and replicas sharing the archive database."""
+    indexed = 0
+    for record in archive_store.updated_since(since.isoformat()):
+        path = Path(record.archive_path) if record.archive_path else None
+        if path and path.is_relative_to(archive_index.root) and path.exists():
+            archive_index.add(path)
+            indexed += 1
+    return indexed
+
+
+async def delete_loop():
     log("[Delete archive] ✅ Cleaning up archived files")
-    model_collections = load_model_collections()
-    while True:
-        if not is_webui_reachable():
-            log("[Delete archive] 🚫 WebUI not reachable. Skip cleaning up")
-            time.sleep(TIMELOOP)
-            continue
-        try:
-            files = [f for f in Path(ARCHIVE_DIR).rglob("*") if f.is_file()]
-            for fpath in files:
-                fname = fpath.name
-                chat_id = fpath.stem
-                info_chat = get_chat_info(chat_id)
-                if info_chat:
-                    # log(f"✅ Chat {fname} exists! Continue...")
-                    continue
-                log(f"❌ Chat info not found for {fname} | Delete it from knowledge")
-                info = extract_from_file(fpath)
-                collection_id = model_collections.get(info.model) or model_collections.get("default")
-                if not collection_id:
-                    collection_id = ModelCollection(id=DEFAULT_KNOWLEDGE_ID, name="default")
-                file_name: str = generate_filename(
-                    FILENAME_TEMPLATE,
-                    info.model,
-                    info.user,
-                    chat_id,
-                )
-                existing_file = get_existing_file(collection_id.id, file_name)
-                if existing_file:
-                    file_id = existing_file.get("id")
-                    if delete_file(file_id):
-                        if remove_from_knowledge({"file_id": file_id}, collection_id.id, fname):
-                            log(f"Deleted {fname} from knowledge {collection_id}")
-                    else:
-                        log(f"Failed to delete {fname} from knowledge {collection_id}")
+    # Every Open WebUI call of the sweeps goes through the limiter
+    current_limiter.set(RateLimiter())
+    # Instances sharing the archive database sweep in turn: only the holder of the lease does, and only it indexes and
+    # watches the archive
+    await sweeper.start()
+    observer = None
+    last_scan = None  # set while this worker is the leader and its index is loaded
+    try:
+        while True:
+            if not sweeper.is_leader:
+                if last_scan is not None:
+                    log("[Delete archive] No longer sweeping, stopped indexing the archive")
+                    if observer:
+                        observer.stop()
+                    observer = last_scan = None
+                await asyncio.sleep(TIMELOOP)
+                continue
+            if last_scan is None:
+                indexed = await asyncio.to_thread(archive_index.scan)
+                log(f"[Delete archive] Indexed {indexed} archived files")
+                observer = watch_archive(archive_index)
+                last_scan = last_pack = time.monotonic()
+                last_sync = datetime.now()
+            # Archived by the other workers or replicas (overlapping the last sync, for late commits)
+            synced_at = datetime.now()
+            try:
+                await asyncio.to_thread(index_archived_since, last_sync - timedelta(seconds=TIMELOOP))
+                last_sync = synced_at
+            except Exception as e:
+                log(f"[Delete archive] Failed to index the new archives: {e}", level="error")
+            if observer is None and time.monotonic() - last_scan > ARCHIVE_RESCAN_INTERVAL:
+                await asyncio.to_thread(archive_index.scan)
+                last_scan = time.monotonic()
+            if COLD_STORAGE_AFTER > 0 and time.monotonic() - last_pack > COLD_STORAGE_INTERVAL:
+                try:
+                    await asyncio.to_thread(cold_storage.pack, archive_index.paths(), COLD_STORAGE_AFTER)
+                    await asyncio.to_thread(cold_storage.compact)
+                except Exception as e:
+                    log(f"[Cold] Error packing archived files: {e}", level="error")
+                last_pack = time.monotonic()
+            files = archive_index.due()
+            if files:
+                if not await is_webui_reachable():
+                    log("[Delete archive] 🚫 WebUI not reachable. Skip cleaning up")
+                    archive_index.reschedule(files, delay=TIMELOOP)
                 else:
-                    log(f"File not found in knowledge {collection_id}: {fname}")
-                # remove file from archive as they are not in knowledge or deleted
-                fpath.unlink()
-        except Exception as e:
-            log(f"Error: {e}")
-        time.sleep(TIMELOOP)
+                    try:
+                        await sweep(files)
+                    except Exception as e:
+                        log(f"Error: {e}", level="error")
+                    archive_index.reschedule(files)
+            await asyncio.sleep(TIMELOOP)
+    finally:
+        if observer:
+            observer.stop()
+        await sweeper.stop()
+
+sweeper = Leader("sweeper", leases)
@@ -1,84 +1,219 @@
-from collections import namedtuple
+from collections import OrderedDict, namedtuple
 from datetime import datetime
-import json
+from functools import lru_cache
+import hashlib
+import os
 from pathlib import Path
 import random
 import re
+from string import Formatter
+import threading
+from typing import Iterator, Optional
 
-import requests
+from http_client import request
 from logger import log
 
-from config import ARCHIVE_DIR, ARCHIVE_PER_KNOWLEDGE, COLLECTIONS_FILE, HEADERS, USERS_API, WEBUI_API
+from config import ARCHIVE_DIR, ARCHIVE_PER_KNOWLEDGE, FILENAME_TEMPLATE, MEMORY_SHARD_LEVELS
 
 Info = namedtuple("Info", ["model", "user"])
 ModelCollection = namedtuple("ModelCollection", ["id", "name"])
 
 
-def read_file_content(path: Path):
-    try:
-        return path.read_text(encoding="utf-8")
-    except Exception as e:
-        log(f"Error reading file content: {e}")
-    return ""
+def file_hash(path: Path) -> str:
+    """sha256 of the content of `path`, read by chunks."""
+    hasher = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            hasher.update(chunk)
+    return hasher.hexdigest()
 
 
-def extract_from_file(file_path: Path) -> Info:
-    info = {"model": "default", "user": "User"}
-    try:
-        content = file_path.read_text(encoding="utf-8")
-        sections = content.split("---")
-        if len(sections) > 1:
-            frontmatter = sections[1]
-            for line in frontmatter.splitlines():
-                for key in ("Model", "User", "Title"):
-                    match = re.search(rf'{key}:\s*"([^"]+)"', line, re.IGNORECASE)
-                    if match:
-                        info[key.lower()] = match.group(1).strip()
-    except Exception as e:
-        log(f"Failed to read metadata from {file_path}: {e}")
+# `key: value` line of a YAML frontmatter
+FRONTMATTER_LINE = re.compile(r"\s*([A-Za-z_][\w-]*)\s*:\s*(.*?)\s*$")
+# A frontmatter longer than this is not read further (the conversation never starts before)
+FRONTMATTER_MAX_LINES = 64
+FRONTMATTER_CACHE_SIZE = 4096
+DOUBLE_QUOTE_ESCAPES = {"\\": "\\", '"': '"', "/": "/", "n": "\n", "t": "\t", "r": "\r", "0": "\0"}
 
-    return Info(**info)
 
+def parse_yaml_scalar(raw: str) -> str:
+    """Value of a YAML scalar: double-quoted (with escapes), single-quoted (`''` for a quote) or plain."""
+    if raw.startswith('"'):
+        end = raw.rfind('"')
+        body = raw[1:end] if end > 0 else raw[1:]
+        if "\\" not in body:
+            return body
+        out = []
+        chars = iter(body)
+        for char in chars:
+            if char != "\\":
+                out.append(char)
+                continue
+            escaped = next(chars, "")
+            if escaped == "u":
+                code = "".join(next(chars, "") for _ in range(4))
+                try:
+                    out.append(chr(int(code, 16)))
+                except ValueError:
+                    out.append("\\u" + code)
+            else:
+                out.append(DOUBLE_QUOTE_ESCAPES.get(escaped, "\\" + escaped))
+        return "".join(out)
+    if raw.startswith("'"):
+        end = raw.rfind("'")
+        return (raw[1:end] if end > 0 else raw[1:]).replace("''", "'")
+    # Plain scalar: a ` #` starts a comment
+    return raw.split(" #", 1)[0].strip()
 
-def load_user_api():
-    try:
-        return list(json.loads(USERS_API.read_text(encoding="utf-8")).values())
-    except Exception as e:
-        log(f"Failed to load user API: {e}")
-        return []
+
+def read_frontmatter(file_path: Path) -> dict[str, str]:
+    """
+    Keys (lowercased) of the YAML frontmatter at the top of `file_path`, read line by line:
+    the conversation after the closing `---` is never read.
+    """
+    values: dict[str, str] = {}
+    with open(file_path, encoding="utf-8-sig", errors="replace") as f:
+        first = f.readline()
+        if first.strip() != "---":
+            return values
+        for _ in range(FRONTMATTER_MAX_LINES):
+            line = f.readline()
+            if not line or line.strip() in ("---", "..."):
+                break
+            match = FRONTMATTER_LINE.match(line)
+            if match:
+                values[match.group(1).lower()] = parse_yaml_scalar(match.group(2))
+    return values
 
 
-def load_model_collections():
+class FrontmatterCache:
+    """Parsed metadata of the conversation files, keyed by path and invalidated when their mtime or size change."""
+
+    def __init__(self, size: int = FRONTMATTER_CACHE_SIZE):
+        self.size = size
+        self._entries: OrderedDict[str, tuple[int, int, Info]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, file_path: Path) -> Info:
+        stat = os.stat(file_path)
+        key = str(file_path)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[0] == stat.st_mtime_ns and entry[1] == stat.st_size:
+                self._entries.move_to_end(key)
+                return entry[2]
+        frontmatter = read_frontmatter(file_path)
+        info = Info(model=frontmatter.get("model") or "default", user=frontmatter.get("user") or "User")
+        with self._lock:
+            self._entries[key] = (stat.st_mtime_ns, stat.st_size, info)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+        return info
+
+
+frontmatter_cache = FrontmatterCache()
+
+
+def extract_from_file(file_path: Path) -> Info:
     try:
-        raw = json.loads(COLLECTIONS_FILE.read_text(encoding="utf-8"))
-        return {model: ModelCollection(**values) for model, values in raw.items()}
+        return frontmatter_cache.get(file_path)
     except Exception as e:
-        log(f"Failed to load model collections: {e}")
-        return {}
+        log(f"Failed to read metadata from {file_path}: {e}", level="warning")
+    return Info(model="default", user="User")
 
 
-def render_datetime_template(text: str):
-    now = datetime.now()
+# Default format of the date placeholders, changed with `{date:%d-%m-%Y}`
+DATE_FORMATS = {"date": "%Y-%m-%d", "time": "%H:%M", "datetime": "%Y-%m-%d_%H-%M"}
+TEXT_FIELDS = ("model", "user", "chat_id")
 
-    default_formats = {"date": "%Y-%m-%d", "time": "%H:%M", "datetime": "%Y-%m-%d_%H-%M"}
+ParsedFilename = namedtuple("ParsedFilename", ["uid", "model", "user", "chat_id"], defaults=(None, None, None))
 
-    def replacer(match):
-        key = match.group(1)
-        format_spec = match.group(2) or default_formats[key]
 
-        if key == "date":
-            value = now.date()
-        elif key == "time":
-            value = now.time()
-        elif key == "datetime":
-            value = now
-        else:
-            return match.group(0)
+class FilenameTemplate:
+    """
+    `FILENAME_TEMPLATE` parsed once into literal parts and placeholders, rendered without any regex.
+    Unknown placeholders raise a `ValueError` when the template is compiled.
+    """
 
-        return value.strftime(format_spec)
+    def __init__(self, template: str):
+        self.template = template
+        # [(literal text, placeholder or None, format spec)]
+        self.parts: list[tuple[str, Optional[str], str]] = []
+        try:
+            parsed = list(Formatter().parse(template))
+        except ValueError as e:
+            raise ValueError(f"Invalid filename template {template!r}: {e}") from None
+        for literal, field, spec, conversion in parsed:
+            if field is not None and field not in DATE_FORMATS and field not in TEXT_FIELDS:
+                allowed = ", ".join(f"{{{name}}}" for name in (*TEXT_FIELDS, *DATE_FORMATS))
+                raise ValueError(
+                    f"Unknown placeholder {{{field}}} in filename template {template!r}, allowed: {allowed}"
+                )
+            if conversion:
+                raise ValueError(f"Conversions (!{conversion}) are not supported in filename template {template!r}")
+            if field in DATE_FORMATS:
+                spec = spec or DATE_FORMATS[field]
+            self.parts.append((literal, field, spec or ""))
 
-    # {clé:%format} ou {clé}
-    return re.sub(r"\{(date|time|datetime)(?::(%[^}]+))?\}", replacer, text)
+    def render(
+        self, model: str = "Default", user: str = "User", chat_id: str = "", now: Optional[datetime] = None
+    ) -> str:
+        now = now or datetime.now()
+        values = {"model": model.replace(":latest", ""), "user": user, "chat_id": chat_id}
+        out = [f"[{chat_id[:8]}] "]
+        for literal, field, spec in self.parts:
+            out.append(literal)
+            if field is None:
+                continue
+            if field == "date":
+                out.append(now.date().strftime(spec))
+            elif field == "time":
+                out.append(now.time().strftime(spec))
+            elif field == "datetime":
+                out.append(now.strftime(spec))
+            else:
+                out.append(format(values[field], spec))
+        return "".join(out)
+
+    def parse(self, filename: str) -> Optional[ParsedFilename]:
+        """
+        Recover the uid, model, user and chat id from a name rendered with this template, `None` if it doesn't match.
+        Each placeholder ends where the next literal part starts: a value containing that literal can't be recovered.
+        """
+        uid = uid_prefix(filename)
+        if uid is None or filename[10:11] != " ":
+            return None
+        values = {}
+        pos = 11
+        parts = self.parts
+        for i, (literal, field, _) in enumerate(parts):
+            if not filename.startswith(literal, pos):
+                return None
+            pos += len(literal)
+            if field is None:
+                continue
+            next_literal = parts[i + 1][0] if i + 1 < len(parts) else None
+            if next_literal is None:
+                end = len(filename)
+            elif next_literal:
+                end = filename.find(next_literal, pos)
+                if end < 0:
+                    return None
+            else:
+                # Two placeholders in a row: their boundary is unknown
+                return None
+            if field in TEXT_FIELDS:
+                values[field] = filename[pos:end]
+            pos = end
+        if pos != len(filename):
+            return None
+        return ParsedFilename(uid, **values)
+
+
+@lru_cache(maxsize=16)
+def compile_template(template: str) -> FilenameTemplate:
+    return FilenameTemplate(template)
 
 
 def generate_filename(template: str, model: str = "Default", user: str = "User", chat_id: str = "") -> str:
@@ -98,34 +233,82 @@ def generate_filename(template: str, model: str = "Default", user: str = "User",
     !!!important
     The conversation name will always be prefixed with the chat_id (with eight characters)
     """
+    return compile_template(template).render(model, user, chat_id)
+
+
+def _is_word(text: str) -> bool:
+    return text.replace("_", "0").isalnum()
 
-    return f"[{chat_id[:8]}] {render_datetime_template(template).format(model=model.replace(':latest', ''), user=user)}"
+
+def uid_prefix(name: str) -> Optional[str]:
+    """The `[uid]` prefix of a generated filename, or `None`."""
+    if len(name) >= 10 and name[0] == "[" and name[9] == "]" and _is_word(name[1:9]):
+        return name[1:9]
+    return None
 
 
 def get_uid(filename: str) -> str:
-    fn = re.match(r"^\[(\w{8})", filename, re.IGNORECASE)
-    if fn:
-        return fn.group(1)
+    if len(filename) >= 9 and filename[0] == "[" and _is_word(filename[1:9]):
+        return filename[1:9]
     return "".join(map(str, random.sample(range(0, 9), 8)))
 
 
-def get_knowledge_data(knowledge_id: str):
+async def get_knowledge_data(knowledge_id: str):
     try:
-        res = requests.get(f"{WEBUI_API}/api/v1/knowledge/{knowledge_id}", headers=HEADERS)
+        res = await request("GET", f"/api/v1/knowledge/{knowledge_id}", endpoint="knowledge")
         if res.status_code == 200:
             return res.json()
         else:
-            log(f"Failed to fetch knowledge data: {res.status_code}")
+            log(f"Failed to fetch knowledge data: {res.status_code}", level="warning")
     except Exception as e:
-        log(f"Error fetching knowledge data: {e}")
+        log(f"Error fetching knowledge data: {e}", level="error")
     return None
 
 
+# Compiled at startup: an invalid FILENAME_TEMPLATE stops Archivist with a clear error
+filename_template = compile_template(FILENAME_TEMPLATE)
+
+
+def shard_parts(chat_id: str, levels: int = MEMORY_SHARD_LEVELS) -> list[str]:
+    """Hash-prefix directories of `chat_id`: `["ab", "cd"]` for 2 levels, none for a flat layout."""
+    digest = hashlib.sha1(chat_id.encode("utf-8")).hexdigest()
+    return [digest[2 * i : 2 * i + 2] for i in range(levels)]
+
+
+def is_shard_dir(name: str) -> bool:
+    return len(name) == 2 and all(c in "0123456789abcdef" for c in name)
+
+
+def conversation_path(root: Path, chat_id: str, extension: str, levels: int = MEMORY_SHARD_LEVELS) -> Path:
+    """Path of the conversation file of `chat_id` under `root` (memory or archive directory)."""
+    return Path(root, *shard_parts(chat_id, levels), f"{chat_id}.{extension}")
+
+
+def iter_conversation_files(root: Path, extension: str, levels: int = MEMORY_SHARD_LEVELS) -> Iterator[os.DirEntry]:
+    """
+    Conversation files of `root` in the layout: files of `root` itself when flat, of its shard directories `levels`
+    deep when sharded. Other directories (`archived`, `logs`, `ongoing_conversations`…) are never walked.
+    """
+    suffix = f".{extension}"
+    stack = [(Path(root), 0)]
+    while stack:
+        directory, depth = stack.pop()
+        try:
+            with os.scandir(directory) as it:
+                entries = list(it)
+        except (FileNotFoundError, NotADirectoryError):
+            continue
+        for entry in entries:
+            if depth < levels:
+                if is_shard_dir(entry.name) and entry.is_dir(follow_symlinks=False):
+                    stack.append((Path(entry.path), depth + 1))
+            elif entry.name.endswith(suffix) and entry.is_file():
+                yield entry
+
+
 def get_archive_path(fname: str, knowledge_name: str):
-    archive_path = Path(ARCHIVE_DIR, fname)
-    if ARCHIVE_PER_KNOWLEDGE:
-        archive_path = Path(ARCHIVE_DIR, knowledge_name, fname)
-        knowledge_path = Path(ARCHIVE_DIR, knowledge_name)
-        if not knowledge_path.exists():
-            knowledge_path.mkdir(parents=True, exist_ok=True)
+    archive_dir = Path(ARCHIVE_DIR, knowledge_name) if ARCHIVE_PER_KNOWLEDGE else Path(ARCHIVE_DIR)
+    archive_path = Path(archive_dir, *shard_parts(Path(fname).stem), fname)
+    if not archive_path.parent.exists():
+        archive_path.parent.mkdir(parents=True, exist_ok=True)
     return archive_path
@@ -0,0 +1,89 @@
+import asyncio
+import time
+import weakref
+
+import httpx
+
+from config import (
+    HEADERS,
+    HTTP2_ENABLED,
+    HTTP_CONNECT_TIMEOUT,
+    HTTP_MAX_CONNECTIONS,
+    HTTP_MAX_KEEPALIVE,
+    HTTP_TIMEOUT,
+    HTTP_TIMEOUTS,
+    WEBUI_API,
+)
+from metrics import webui_request_seconds, webui_requests
+from rate_limit import current_limiter
+
+try:
+    import h2  # noqa: F401
+
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+# One pooled client per event loop: the delete loop shares the loop of its API worker, but the scripts (backfill)
+# and the tests run their own loops, and an httpx.AsyncClient can't be shared across loops.
+_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]" = weakref.WeakKeyDictionary()
+
+
+def get_timeout(endpoint: str) -> httpx.Timeout:
+    return httpx.Timeout(HTTP_TIMEOUTS.get(endpoint, HTTP_TIMEOUT), connect=HTTP_CONNECT_TIMEOUT)
+
+
+def get_client() -> httpx.AsyncClient:
+    """
+    Return the keep-alive client bound to the running event loop, creating it on first use.
+    HTTP/2 is used when enabled and the `h2` package is installed.
+    """
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None or client.is_closed:
+        client = httpx.AsyncClient(
+            base_url=WEBUI_API,
+            headers=HEADERS,
+            http2=HTTP2_ENABLED and HTTP2_AVAILABLE,
+            limits=httpx.Limits(max_connections=HTTP_MAX_CONNECTIONS, max_keepalive_connections=HTTP_MAX_KEEPALIVE),
+            timeout=get_timeout("default"),
+        )
+        _clients[loop] = client
+    return client
+
+
+async def request(method: str, path: str, endpoint: str = "default", **kwargs) -> httpx.Response:
+    """
+    Send a request to Open WebUI through the shared client.
+    `endpoint` selects the timeout from `HTTP_TIMEOUTS` (health, chat, knowledge, upload, update, add, remove, delete).
+    Calls are throttled by the `current_limiter` of the context, if any.
+    Their latency (without the time waiting for the limiter) and status are recorded in the metrics.
+    """
+    limiter = current_limiter.get()
+    if limiter is None:
+        return await _send(method, path, endpoint, **kwargs)
+    key = (kwargs.get("headers") or {}).get("Authorization") or HEADERS["Authorization"]
+    async with limiter.limit(key):
+        return await _send(method, path, endpoint, **kwargs)
+
+
+async def _send(method: str, path: str, endpoint: str, **kwargs) -> httpx.Response:
+    start = time.perf_counter()
+    status = "error"
+    try:
+        res = await get_client().request(method, path, timeout=get_timeout(endpoint), **kwargs)
+        status = res.status_code
+        return res
+    finally:
+        webui_request_seconds.observe(time.perf_counter() - start, endpoint=endpoint)
+        webui_requests.inc(endpoint=endpoint, status=status)
+
+
+async def close_client():
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        return
+    client = _clients.pop(loop, None)
+    if client is not None:
+        await client.aclose()
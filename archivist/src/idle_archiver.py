@@ -0,0 +1,157 @@
+import asyncio
+from collections import namedtuple
+import json
+import os
+from pathlib import Path
+import time
+from typing import Callable, Optional
+
+from config import (
+    FILENAME_TEMPLATE,
+    IDLE_ARCHIVE_AFTER,
+    IDLE_ARCHIVE_DEBOUNCE,
+    IDLE_ARCHIVE_MAX_PER_SCAN,
+    MEMORY_DIR,
+    TIMELOOP,
+)
+from file_utils import extract_from_file, iter_conversation_files
+from leases import Leader
+from logger import log
+
+# Chat to archive: the user is only known when the chat is tracked in `ongoing_conversations/`
+IdleChat = namedtuple("IdleChat", ["chat_id", "path", "user_id", "username", "model"])
+
+
+class IdleArchiver:
+    """
+    Archive the conversations of `memory_dir` left untouched for `idle_after` seconds, instead of waiting for the
+    user to switch to another chat. File mtimes are polled every `interval` seconds: a file edited again before being
+    archived just restarts its idle timer, and a change must have been seen for `debounce` seconds before the file is
+    archived, so a burst of writes ends up in a single archive. At most `max_per_scan` chats are submitted per scan,
+    the oldest first, to spread the uploads over time. With a `leader`, only the instance holding its lease scans.
+    """
+
+    def __init__(
+        self,
+        submit: Callable[[IdleChat], bool],
+        memory_dir: Path = MEMORY_DIR,
+        idle_after: float = IDLE_ARCHIVE_AFTER,
+        debounce: float = IDLE_ARCHIVE_DEBOUNCE,
+        max_per_scan: int = IDLE_ARCHIVE_MAX_PER_SCAN,
+        interval: float = TIMELOOP,
+        leader: Optional[Leader] = None,
+    ):
+        self.submit = submit
+        self.memory_dir = Path(memory_dir)
+        self.tracker_dir = self.memory_dir / "ongoing_conversations"
+        self.extension = Path(FILENAME_TEMPLATE).suffix
+        self.idle_after = idle_after
+        self.debounce = debounce
+        self.max_per_scan = max_per_scan
+        self.interval = interval
+        self.leader = leader
+        self._mtimes: dict[str, float] = {}
+        self._changed_at: dict[str, float] = {}
+        self._submitted: dict[str, tuple[float, float]] = {}  # chat_id -> (mtime submitted, submitted at)
+        self._trackers: dict[str, tuple[float, dict]] = {}  # user_id -> (mtime, tracker content)
+
+    def _tracked_chats(self) -> dict[str, tuple[str, dict]]:
+        """`chat_id -> (user_id, tracker)` of the ongoing conversations, tracker files are reread only when changed."""
+        chats = {}
+        seen = set()
+        try:
+            entries = list(os.scandir(self.tracker_dir))
+        except OSError:
+            entries = []
+        for entry in entries:
+            if not entry.name.endswith(".json"):
+                continue
+            user_id = entry.name[: -len(".json")]
+            seen.add(user_id)
+            try:
+                mtime = entry.stat().st_mtime
+                cached = self._trackers.get(user_id)
+                if cached is None or cached[0] != mtime:
+                    cached = self._trackers[user_id] = (mtime, json.loads(Path(entry.path).read_text(encoding="utf-8")))
+            except Exception as e:
+                log(f"[Idle] Failed to read tracker of {user_id}: {e}", level="warning")
+                continue
+            if cached[1].get("chat_id"):
+                chats[cached[1]["chat_id"]] = (user_id, cached[1])
+        for user_id in self._trackers.keys() - seen:
+            del self._trackers[user_id]
+        return chats
+
+    def scan(self, now: Optional[float] = None) -> list[IdleChat]:
+        """Poll `memory_dir` and return the chats to archive now."""
+        now = time.time() if now is None else now
+        mtimes = {}
+        for entry in iter_conversation_files(self.memory_dir, self.extension[1:]):
+            try:
+                mtimes[entry.name[: -len(self.extension)]] = (entry.stat().st_mtime, entry.path)
+            except OSError:
+                continue
+
+        due = []
+        for chat_id, (mtime, path) in mtimes.items():
+            if self._mtimes.get(chat_id) != mtime:
+                self._mtimes[chat_id] = mtime
+                self._changed_at[chat_id] = now
+            if now - mtime < self.idle_after or now - self._changed_at[chat_id] < self.debounce:
+                continue
+            submitted = self._submitted.get(chat_id)
+            # Already submitted: only resubmitted when edited since, or if still there after another idle period
+            if submitted and submitted[0] == mtime and now - submitted[1] < self.idle_after:
+                continue
+            due.append((mtime, chat_id, path))
+        # Archived or deleted files
+        for chat_id in self._mtimes.keys() - mtimes.keys():
+            self._mtimes.pop(chat_id, None)
+            self._changed_at.pop(chat_id, None)
+            self._submitted.pop(chat_id, None)
+        if not due:
+            return []
+
+        due.sort()
+        tracked = self._tracked_chats()
+        chats = []
+        for mtime, chat_id, path in due[: self.max_per_scan]:
+            path = Path(path)
+            if chat_id in tracked:
+                user_id, tracker = tracked[chat_id]
+                chats.append(IdleChat(chat_id, path, user_id, tracker.get("username"), tracker.get("model")))
+            else:
+                info = extract_from_file(path)
+                chats.append(IdleChat(chat_id, path, None, info.user, info.model))
+        return chats
+
+    def submit_all(self, chats: list[IdleChat], now: Optional[float] = None) -> int:
+        """Submit `chats` until the queue is full. Return the number of chats submitted."""
+        now = time.time() if now is None else now
+        submitted = 0
+        for chat in chats:
+            if not self.submit(chat):
+                # Queue full: the remaining chats wait for the next scan
+                break
+            self._submitted[chat.chat_id] = (self._mtimes[chat.chat_id], now)
+            submitted += 1
+        if submitted:
+            log(f"[Idle] Submitted {submitted} idle conversations for archiving")
+        return submitted
+
+    async def run(self):
+        log(f"[Idle] Archiving conversations idle for {self.idle_after:.0f}s")
+        if self.leader:
+            await self.leader.start()
+        try:
+            while True:
+                if self.leader is None or self.leader.is_leader:
+                    try:
+                        # The directory is polled in a thread, jobs are submitted from the event loop
+                        self.submit_all(await asyncio.to_thread(self.scan))
+                    except Exception as e:
+                        log(f"[Idle] Error: {e}", level="error")
+                await asyncio.sleep(self.interval)
+        finally:
+            if self.leader:
+                await self.leader.stop()
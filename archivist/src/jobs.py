@@ -0,0 +1,199 @@
+import asyncio
+from collections import OrderedDict
+from datetime import datetime
+import random
+from typing import Any, Awaitable, Callable, Optional
+
+from pydantic import BaseModel
+
+from config import (
+    JOB_HISTORY_SIZE,
+    JOB_MAX_RETRIES,
+    JOB_QUEUE_SIZE,
+    JOB_RETRY_BACKOFF,
+    JOB_RETRY_MAX_BACKOFF,
+    JOB_WORKERS,
+)
+from logger import log
+
+# Statuses returned by the archive handler that are worth another try (Open WebUI down, timeouts, chat being archived
+# by another instance…)
+RETRYABLE_STATUSES = {"no title", "upload failed", "failed to add", "error", "locked"}
+
+
+class JobStatus(BaseModel):
+    chat_id: str
+    state: str = "queued"  # queued | running | retrying | done | failed
+    attempts: int = 0
+    result: Optional[str] = None
+    detail: Optional[dict[str, str]] = None
+    queued_at: str
+    updated_at: str
+
+
+class QueueFull(Exception):
+    pass
+
+
+class JobQueue:
+    """
+    Bounded queue of archive jobs drained by a pool of asyncio workers.
+    A chat submitted again while its job is still waiting is merged into the waiting job.
+    """
+
+    def __init__(
+        self,
+        handler: Callable[[Any], Awaitable[Any]],
+        workers: int = JOB_WORKERS,
+        maxsize: int = JOB_QUEUE_SIZE,
+        max_retries: int = JOB_MAX_RETRIES,
+        backoff: float = JOB_RETRY_BACKOFF,
+        max_backoff: float = JOB_RETRY_MAX_BACKOFF,
+        history_size: int = JOB_HISTORY_SIZE,
+    ):
+        self.handler = handler
+        self.workers = workers
+        self.maxsize = maxsize
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.history_size = history_size
+        self._queue: Optional[asyncio.Queue] = None
+        self._pending: dict[str, Any] = {}
+        self._running: set[str] = set()
+        self._jobs: OrderedDict[str, JobStatus] = OrderedDict()
+        self._tasks: list[asyncio.Task] = []
+        # Delayed retries and puts waiting for a slot, cancelled by `stop`
+        self._background: set[asyncio.Task] = set()
+
+    @property
+    def queue(self) -> asyncio.Queue:
+        if self._queue is None:
+            self._queue = asyncio.Queue(maxsize=self.maxsize)
+        return self._queue
+
+    def depth(self) -> int:
+        return len(self._pending)
+
+    def get(self, chat_id: str) -> Optional[JobStatus]:
+        return self._jobs.get(chat_id)
+
+    def submit(self, chat_id: str, payload: Any) -> JobStatus:
+        """Queue `payload` for `chat_id`. Raise `QueueFull` when the queue is at capacity."""
+        now = datetime.now().isoformat()
+        if chat_id in self._pending:
+            self._pending[chat_id] = payload
+            log(f"[Jobs] {chat_id} already queued, merged notification")
+            return self._jobs[chat_id]
+        if chat_id not in self._running:
+            try:
+                self.queue.put_nowait(chat_id)
+            except asyncio.QueueFull:
+                raise QueueFull(f"Archive queue is full ({self.maxsize} jobs)")
+        # A chat being archived is queued again once its current run ends (see `_resume`)
+        self._pending[chat_id] = payload
+        job = JobStatus(chat_id=chat_id, queued_at=now, updated_at=now)
+        self._remember(job)
+        return job
+
+    def _remember(self, job: JobStatus):
+        self._jobs[job.chat_id] = job
+        self._jobs.move_to_end(job.chat_id)
+        while len(self._jobs) > self.history_size:
+            oldest = next(iter(self._jobs))
+            if oldest in self._pending or oldest in self._running or self._jobs[oldest].state == "retrying":
+                break
+            self._jobs.popitem(last=False)
+
+    def _update(self, job: JobStatus, **changes):
+        for key, value in changes.items():
+            setattr(job, key, value)
+        job.updated_at = datetime.now().isoformat()
+
+    def _retry_delay(self, attempts: int) -> float:
+        delay = min(self.backoff * 2 ** (attempts - 1), self.max_backoff)
+        return delay * random.uniform(0.8, 1.2)
+
+    def _spawn(self, coro: Awaitable[Any]):
+        task = asyncio.create_task(coro)
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+
+    async def _requeue_later(self, job: JobStatus, payload: Any, delay: float):
+        await asyncio.sleep(delay)
+        chat_id = job.chat_id
+        if self._jobs.get(chat_id) is not job:
+            # Submitted again meanwhile: the new job supersedes this retry
+            log(f"[Jobs] {chat_id} submitted again, dropped the pending retry", level="debug")
+            return
+        if chat_id in self._pending or chat_id in self._running:
+            return
+        self._pending[chat_id] = payload
+        await self.queue.put(chat_id)
+
+    def _resume(self, chat_id: str):
+        """Queue `chat_id` if it was submitted again while running."""
+        if chat_id not in self._pending:
+            return
+        try:
+            self.queue.put_nowait(chat_id)
+        except asyncio.QueueFull:
+            # Waits for a slot without holding a worker
+            self._spawn(self.queue.put(chat_id))
+
+    async def _run(self, chat_id: str):
+        payload = self._pending.pop(chat_id, None)
+        if payload is None:
+            return
+        job = self._jobs.get(chat_id)
+        if job is None:
+            now = datetime.now().isoformat()
+            job = JobStatus(chat_id=chat_id, queued_at=now, updated_at=now)
+            self._remember(job)
+        self._running.add(chat_id)
+        self._update(job, state="running", attempts=job.attempts + 1)
+        try:
+            response = await self.handler(payload)
+            status, detail = response.status, response.detail
+        except Exception as e:
+            log(f"[Jobs] Unexpected error archiving {chat_id}: {e}", level="error")
+            status, detail = "error", {"chat_id": chat_id, "error": str(e)}
+        finally:
+            self._running.discard(chat_id)
+
+        if status in RETRYABLE_STATUSES and job.attempts <= self.max_retries:
+            delay = self._retry_delay(job.attempts)
+            log(f"[Jobs] {chat_id} → {status}, retry {job.attempts}/{self.max_retries} in {delay:.1f}s")
+            self._update(job, state="retrying", result=status, detail=detail)
+            self._spawn(self._requeue_later(job, payload, delay))
+            return
+        state = "failed" if status in RETRYABLE_STATUSES else "done"
+        self._update(job, state=state, result=status, detail=detail)
+
+    async def _worker(self, index: int):
+        while True:
+            chat_id = await self.queue.get()
+            try:
+                if chat_id in self._running:
+                    # Left to `_resume` once the run of the other worker ends
+                    continue
+                await self._run(chat_id)
+                self._resume(chat_id)
+            except Exception as e:
+                log(f"[Jobs] Worker {index} error: {e}", level="error")
+            finally:
+                self.queue.task_done()
+
+    async def start(self):
+        if self._tasks:
+            return
+        log(f"[Jobs] Starting {self.workers} archive workers")
+        self._tasks = [asyncio.create_task(self._worker(i)) for i in range(self.workers)]
+
+    async def stop(self):
+        tasks = self._tasks + list(self._background)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._tasks = []
+        self._background.clear()
@@ -0,0 +1,189 @@
+import asyncio
+from collections import namedtuple
+from typing import Awaitable, Callable, Optional
+import weakref
+
+from config import KNOWLEDGE_BATCH_CONCURRENCY, KNOWLEDGE_BATCH_SIZE, KNOWLEDGE_BATCH_WINDOW
+from http_client import request
+from knowledge_cache import knowledge_cache
+from logger import log, log_history
+from webui_api import add_to_knowledge, remove_from_knowledge
+
+PendingOp = namedtuple("PendingOp", ["file_id", "filename", "future"])
+
+# Statuses meaning the Open WebUI version has no batch add endpoint
+UNSUPPORTED_STATUSES = {404, 405}
+
+
+def failed_file_ids(errors: list) -> set[str]:
+    """Ids of the files in the errors of a batch add: `"<file_id>: <error>"` strings or `{"file_id", "error"}` objects."""
+    failed = set()
+    for error in errors:
+        if isinstance(error, dict):
+            file_id = error.get("file_id")
+        else:
+            # Last word before the colon, in case the id is prefixed (`File <file_id>: …`)
+            words = str(error).partition(":")[0].split()
+            file_id = words[-1] if words else None
+        if file_id:
+            failed.add(file_id)
+    return failed
+
+
+class KnowledgeBatcher:
+    """
+    Send the files added to / removed from each knowledge together: adds go through `/files/batch/add`, which
+    reindexes the collection once, removes (no batch endpoint) are fanned out `concurrency` at a time.
+    A file is sent right away when nothing is in flight for its knowledge. Otherwise it waits for the request in
+    flight to end, at most `window` seconds, or until `max_size` files are waiting, and is sent with them.
+    Each caller still gets the result of its own file. Must be used from a single event loop.
+    """
+
+    def __init__(
+        self,
+        window: float = KNOWLEDGE_BATCH_WINDOW,
+        max_size: int = KNOWLEDGE_BATCH_SIZE,
+        concurrency: int = KNOWLEDGE_BATCH_CONCURRENCY,
+    ):
+        self.window = window
+        self.max_size = max(max_size, 1)
+        self.concurrency = max(concurrency, 1)
+        self.batch_add_supported = True
+        self._pending: dict[tuple[str, str], list[PendingOp]] = {}
+        self._timers: dict[tuple[str, str], asyncio.TimerHandle] = {}
+        self._in_flight: dict[tuple[str, str], int] = {}
+        self._tasks: set[asyncio.Task] = set()
+
+    async def add(self, file_id: str, knowledge_id: str, filename: str) -> Optional[str]:
+        """Add the uploaded `file_id` to the knowledge. Return the id of the file in the knowledge."""
+        return await self._enqueue("add", knowledge_id, file_id, filename)
+
+    async def remove(self, file_id: str, knowledge_id: str, filename: str) -> bool:
+        return await self._enqueue("remove", knowledge_id, file_id, filename)
+
+    def _enqueue(self, action: str, knowledge_id: str, file_id: str, filename: str) -> asyncio.Future:
+        loop = asyncio.get_running_loop()
+        key = (action, knowledge_id)
+        future = loop.create_future()
+        ops = self._pending.setdefault(key, [])
+        ops.append(PendingOp(file_id, filename, future))
+        if len(ops) >= self.max_size or not self._in_flight.get(key):
+            self._flush(key)
+        elif key not in self._timers:
+            self._timers[key] = loop.call_later(self.window, self._flush, key)
+        return future
+
+    def _flush(self, key: tuple[str, str]):
+        timer = self._timers.pop(key, None)
+        if timer:
+            timer.cancel()
+        ops = self._pending.pop(key, [])
+        if ops:
+            self._in_flight[key] = self._in_flight.get(key, 0) + 1
+            task = asyncio.get_running_loop().create_task(self._send(key, ops))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _send(self, key: tuple[str, str], ops: list[PendingOp]):
+        action, knowledge_id = key
+        try:
+            try:
+                if action == "add":
+                    results = await self._send_adds(knowledge_id, ops)
+                else:
+                    results = await self._fan_out(
+                        lambda op: remove_from_knowledge({"file_id": op.file_id}, knowledge_id, op.filename),
+                        knowledge_id,
+                        ops,
+                    )
+            except Exception as e:
+                log(f"[Batch] Error sending {len(ops)} {action} to knowledge {knowledge_id}: {e}", level="error")
+                results = [None if action == "add" else False] * len(ops)
+            for op, result in zip(ops, results):
+                if not op.future.done():
+                    op.future.set_result(result)
+        finally:
+            # Cancelled: the callers must not wait forever
+            for op in ops:
+                if not op.future.done():
+                    op.future.cancel()
+            self._in_flight[key] -= 1
+            if not self._in_flight[key]:
+                del self._in_flight[key]
+                # Files queued during the request go together now
+                self._flush(key)
+
+    async def _fan_out(self, call: Callable[[PendingOp], Awaitable], knowledge_id: str, ops: list[PendingOp]) -> list:
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def run(op: PendingOp):
+            async with semaphore:
+                try:
+                    return await call(op)
+                except Exception as e:
+                    log(f"[Batch] Error with {op.filename} in knowledge {knowledge_id}: {e}", level="error")
+                    return None
+
+        return await asyncio.gather(*(run(op) for op in ops))
+
+    async def _add_one_by_one(self, knowledge_id: str, ops: list[PendingOp]) -> list[Optional[str]]:
+        return await self._fan_out(
+            lambda op: add_to_knowledge(op.file_id, knowledge_id, op.filename), knowledge_id, ops
+        )
+
+    async def _send_adds(self, knowledge_id: str, ops: list[PendingOp]) -> list[Optional[str]]:
+        if len(ops) == 1 or not self.batch_add_supported:
+            return await self._add_one_by_one(knowledge_id, ops)
+        res = await request(
+            "POST",
+            f"/api/v1/knowledge/{knowledge_id}/files/batch/add",
+            endpoint="add",
+            json=[{"file_id": op.file_id} for op in ops],
+        )
+        if res.status_code in UNSUPPORTED_STATUSES:
+            log("[Batch] No batch add endpoint in this Open WebUI version, adding files one by one", level="warning")
+            self.batch_add_supported = False
+            return await self._add_one_by_one(knowledge_id, ops)
+        if res.status_code != 200:
+            # A single faulty file fails the whole batch: retry them one by one to isolate it
+            log(f"[Batch] Batch add failed: {res.status_code} - {res.text}, adding files one by one", level="warning")
+            return await self._add_one_by_one(knowledge_id, ops)
+
+        data = res.json() or {}
+        # Files listed in the knowledge returned, and not reported in the warnings, were added
+        listed = {file.get("id") for file in data.get("files") or []} if "files" in data else None
+        failed = failed_file_ids((data.get("warnings") or {}).get("errors") or [])
+        results = []
+        for op in ops:
+            if (listed is not None and op.file_id not in listed) or op.file_id in failed:
+                log(f"[Batch] Failed to add {op.filename} to knowledge {knowledge_id}", level="warning")
+                results.append(None)
+                continue
+            record = {"id": op.file_id, "filename": op.filename, "meta": {"name": op.filename}}
+            knowledge_cache.put(knowledge_id, record)
+            log_history("added", op.filename, knowledge_id)
+            results.append(op.file_id)
+        log(f"[Batch] Added {sum(1 for r in results if r)}/{len(ops)} files to knowledge {knowledge_id} in one batch")
+        return results
+
+
+# One batcher per event loop, like the HTTP clients
+_batchers: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, KnowledgeBatcher]" = weakref.WeakKeyDictionary()
+
+
+def get_batcher() -> KnowledgeBatcher:
+    loop = asyncio.get_running_loop()
+    batcher = _batchers.get(loop)
+    if batcher is None:
+        batcher = _batchers[loop] = KnowledgeBatcher()
+    return batcher
+
+
+async def batch_add(file_id: str, knowledge_id: str, filename: str) -> Optional[str]:
+    """`add_to_knowledge`, batched with the other files added to the same knowledge."""
+    return await get_batcher().add(file_id, knowledge_id, filename)
+
+
+async def batch_remove(file_id: str, knowledge_id: str, filename: str) -> bool:
+    """`remove_from_knowledge`, batched with the other files removed from the same knowledge."""
+    return bool(await get_batcher().remove(file_id, knowledge_id, filename))
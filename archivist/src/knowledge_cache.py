@@ -0,0 +1,136 @@
+import threading
+import time
+from typing import Optional
+
+from config import KNOWLEDGE_CACHE_TTL
+from file_utils import uid_prefix
+from http_client import request
+from logger import log
+from metrics import cache_lookups
+
+
+def file_names(record: dict) -> set[str]:
+    """Names a knowledge file can be looked up with: its filename and its display name."""
+    return {name for name in (record.get("filename"), (record.get("meta") or {}).get("name")) if name}
+
+
+class KnowledgeIndex:
+    """
+    Files of a knowledge by id, with their full names and `[uid]` prefixes. The 8 characters of a uid can collide
+    in a large knowledge: a uid shared by several files matches none of them.
+    """
+
+    def __init__(self, files: list[dict], etag: Optional[str] = None):
+        self.etag = etag
+        self.fetched_at = time.monotonic()
+        self.files: dict[str, dict] = {}  # file id -> record
+        self.names: dict[str, str] = {}  # full name -> file id
+        self.uids: dict[str, set[str]] = {}  # uid -> file ids
+        for record in files:
+            self.put(record)
+
+    def put(self, record: dict):
+        file_id = record.get("id")
+        if not file_id:
+            return
+        self.remove(file_id)
+        self.files[file_id] = record
+        for name in file_names(record):
+            self.names[name] = file_id
+            uid = uid_prefix(name)
+            if uid:
+                self.uids.setdefault(uid, set()).add(file_id)
+
+    def remove(self, file_id: str):
+        record = self.files.pop(file_id, None)
+        if record is None:
+            return
+        for name in file_names(record):
+            if self.names.get(name) == file_id:
+                del self.names[name]
+            uid = uid_prefix(name)
+            ids = self.uids.get(uid) if uid else None
+            if ids is not None:
+                ids.discard(file_id)
+                if not ids:
+                    del self.uids[uid]
+
+    def find(self, filename: str, file_id: Optional[str] = None) -> Optional[dict]:
+        """The file with id `file_id`, else named `filename`, else the only file with the same `[uid]` prefix."""
+        if file_id and file_id in self.files:
+            return self.files[file_id]
+        if filename in self.names:
+            return self.files[self.names[filename]]
+        uid = uid_prefix(filename)
+        ids = self.uids.get(uid, ()) if uid else ()
+        if len(ids) > 1:
+            log(f"[Knowledge] {len(ids)} files share the uid of {filename}, none of them is used", level="warning")
+            return None
+        return self.files[next(iter(ids))] if ids else None
+
+
+class KnowledgeCache:
+    """
+    Per-knowledge index of files (see `KnowledgeIndex`).
+    Listings are refetched after `ttl` seconds, with `If-None-Match` when Open WebUI sent an ETag,
+    and updated in place when Archivist adds or removes files itself.
+    """
+
+    def __init__(self, ttl: float = KNOWLEDGE_CACHE_TTL):
+        self.ttl = ttl
+        self._indexes: dict[str, KnowledgeIndex] = {}
+        self._lock = threading.Lock()
+
+    async def _fetch(self, knowledge_id: str, current: Optional[KnowledgeIndex]) -> Optional[KnowledgeIndex]:
+        headers = {"If-None-Match": current.etag} if current and current.etag else {}
+        try:
+            res = await request("GET", f"/api/v1/knowledge/{knowledge_id}", endpoint="knowledge", headers=headers)
+        except Exception as e:
+            log(f"Error fetching knowledge {knowledge_id}: {e}", level="error")
+            return current
+        if res.status_code == 304 and current:
+            cache_lookups.inc(cache="knowledge", result="revalidated")
+            current.fetched_at = time.monotonic()
+            return current
+        if res.status_code != 200:
+            log(f"Failed to fetch knowledge details: {res.status_code}", level="warning")
+            return current
+        return KnowledgeIndex(res.json().get("files") or [], res.headers.get("etag"))
+
+    async def get_index(self, knowledge_id: str) -> Optional[KnowledgeIndex]:
+        index = self._indexes.get(knowledge_id)
+        if index is None or time.monotonic() - index.fetched_at > self.ttl:
+            cache_lookups.inc(cache="knowledge", result="miss" if index is None else "expired")
+            index = await self._fetch(knowledge_id, index)
+            if index is not None:
+                with self._lock:
+                    self._indexes[knowledge_id] = index
+        else:
+            cache_lookups.inc(cache="knowledge", result="hit")
+        return index
+
+    async def get_file(self, knowledge_id: str, filename: str, file_id: Optional[str] = None) -> Optional[dict]:
+        index = await self.get_index(knowledge_id)
+        return index.find(filename, file_id) if index else None
+
+    def put(self, knowledge_id: str, record: dict):
+        with self._lock:
+            index = self._indexes.get(knowledge_id)
+            if index is not None:
+                index.put(record)
+
+    def remove(self, knowledge_id: str, file_id: str):
+        with self._lock:
+            index = self._indexes.get(knowledge_id)
+            if index is not None:
+                index.remove(file_id)
+
+    def invalidate(self, knowledge_id: Optional[str] = None):
+        with self._lock:
+            if knowledge_id is None:
+                self._indexes.clear()
+            else:
+                self._indexes.pop(knowledge_id, None)
+
+
+knowledge_cache = KnowledgeCache()
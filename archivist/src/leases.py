@@ -0,0 +1,122 @@
+import asyncio
+from collections import namedtuple
+from contextlib import asynccontextmanager
+import os
+import socket
+import time
+from typing import Optional
+
+from archive_store import ArchiveStore, archive_store
+from config import LEADER_LEASE_TTL
+from logger import log
+
+# Named lease held by `owner` until `expires_at` (unix time), renewed by its owner
+Lease = namedtuple("Lease", ["name", "owner", "expires_at"])
+
+INSTANCE_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+
+class LeaseLocked(Exception):
+    pass
+
+
+class LeaseStore:
+    """
+    Leases kept in the archive database, shared by every process and replica using it: a lease is taken in a single
+    statement, only when it is free, expired or already held by the same owner.
+    Expiry uses the wall clock, hosts sharing the database must be kept in sync (NTP).
+    """
+
+    def __init__(self, store: ArchiveStore = archive_store, owner: str = INSTANCE_ID):
+        self.store = store
+        self.owner = owner
+        self.store.conn.execute(
+            "CREATE TABLE IF NOT EXISTS leases (name TEXT PRIMARY KEY, owner TEXT NOT NULL, expires_at REAL NOT NULL)"
+        )
+
+    def acquire(self, name: str, ttl: float, now: Optional[float] = None) -> bool:
+        """Take or renew `name` for `ttl` seconds. Return `False` when another owner holds it."""
+        now = time.time() if now is None else now
+        cursor = self.store.conn.execute(
+            "INSERT INTO leases (name, owner, expires_at) VALUES (?, ?, ?) "
+            "ON CONFLICT(name) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at "
+            "WHERE leases.owner = excluded.owner OR leases.expires_at <= ?",
+            (name, self.owner, now + ttl, now),
+        )
+        return cursor.rowcount > 0
+
+    def release(self, name: str):
+        self.store.conn.execute("DELETE FROM leases WHERE name = ? AND owner = ?", (name, self.owner))
+
+    def get(self, name: str) -> Optional[Lease]:
+        row = self.store.conn.execute("SELECT * FROM leases WHERE name = ?", (name,)).fetchone()
+        return Lease(row["name"], row["owner"], row["expires_at"]) if row else None
+
+    @asynccontextmanager
+    async def hold(self, name: str, ttl: float, timeout: float = 0, poll: float = 0.5):
+        """
+        Hold `name` for the duration of the block, waiting up to `timeout` seconds for it.
+        Raise `LeaseLocked` when it is still held by another owner. The block must end within `ttl` seconds.
+        """
+        deadline = time.monotonic() + timeout
+        while not await asyncio.to_thread(self.acquire, name, ttl):
+            if time.monotonic() >= deadline:
+                lease = await asyncio.to_thread(self.get, name)
+                raise LeaseLocked(f"{name} is held by {lease.owner if lease else 'another instance'}")
+            await asyncio.sleep(poll)
+        try:
+            yield
+        finally:
+            await asyncio.to_thread(self.release, name)
+
+
+class Leader:
+    """
+    Leader election on the `name` lease: once `start`ed, it is renewed or retried every `ttl / 3` seconds, and another
+    instance takes over `ttl` seconds after the leader stopped renewing it.
+    Work that must run on a single instance checks `is_leader`.
+    """
+
+    def __init__(self, name: str, leases: LeaseStore, ttl: float = LEADER_LEASE_TTL):
+        self.name = name
+        self.leases = leases
+        self.ttl = ttl
+        self.is_leader = False
+        self._task: Optional[asyncio.Task] = None
+
+    def renew(self) -> bool:
+        try:
+            leader = self.leases.acquire(self.name, self.ttl)
+        except Exception as e:
+            log(f"[Leader] Failed to renew the {self.name} lease: {e}", level="error")
+            leader = False
+        if leader != self.is_leader:
+            log(f"[Leader] {self.leases.owner} {'is now' if leader else 'is no longer'} the {self.name} leader")
+        self.is_leader = leader
+        return leader
+
+    async def _keep(self):
+        try:
+            while True:
+                await asyncio.sleep(self.ttl / 3)
+                await asyncio.to_thread(self.renew)
+        finally:
+            if self.is_leader:
+                self.is_leader = False
+                self.leases.release(self.name)
+
+    async def start(self):
+        """Try to take the lease, then keep renewing or trying in background."""
+        if self._task is None:
+            await asyncio.to_thread(self.renew)
+            self._task = asyncio.create_task(self._keep())
+
+    async def stop(self):
+        """Stop renewing and release the lease, so another instance takes over right away."""
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+
+leases = LeaseStore()
@@ -1,17 +1,242 @@
+import atexit
+from contextlib import contextmanager
 from datetime import datetime
-from config import LOG_FILE, HISTORY_LOG
+import json
+import os
+from pathlib import Path
+import queue
+import sys
+import threading
+import time
+from typing import Optional, TextIO
 
+from config import (
+    HISTORY_LOG,
+    LOG_BACKUP_COUNT,
+    LOG_FLUSH_INTERVAL,
+    LOG_FORMAT,
+    LOG_FILE,
+    LOG_LEVEL,
+    LOG_MAX_BYTES,
+    LOG_ROTATE_INTERVAL,
+)
 
-def log(msg: str):
-    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    line = f"[{timestamp}] {msg}"
-    print(line)
-    with LOG_FILE.open("a", encoding="utf-8", newline="\n") as f:
-        f.write(line + "\n")
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+LEVELS = {"debug": 10, "info": 20, "warning": 30, "error": 40}
+
+
+class RotatingFile:
+    """
+    Append-only file kept open, rotated to `.1`, `.2`… when too big or too old.
+    Several processes can share it (API workers): rotations are serialized by a lock file, and the other processes
+    reopen the file as soon as they see it was rotated.
+    """
+
+    def __init__(self, path: Path, max_bytes: int, rotate_interval: float, backup_count: int):
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+        self.rotate_interval = rotate_interval
+        self.backup_count = backup_count
+        self._file: Optional[TextIO] = None
+        self._opened_at = 0.0
+        self._inode = 0
+
+    def _open(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._file = self.path.open("a", encoding="utf-8", newline="\n")
+        self._opened_at = time.monotonic()
+        self._inode = os.fstat(self._file.fileno()).st_ino
+
+    def _rotated_elsewhere(self) -> bool:
+        try:
+            return os.stat(self.path).st_ino != self._inode
+        except FileNotFoundError:
+            return True
+
+    @contextmanager
+    def _rotation_lock(self):
+        if fcntl is None:
+            yield
+            return
+        with open(self.path.with_name(f"{self.path.name}.lock"), "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _should_rotate(self) -> bool:
+        # Size of the file, written by every process sharing it
+        if self.max_bytes > 0 and os.fstat(self._file.fileno()).st_size >= self.max_bytes:
+            return True
+        return self.rotate_interval > 0 and time.monotonic() - self._opened_at >= self.rotate_interval
+
+    def rotate(self):
+        if self._file:
+            self._file.close()
+            self._file = None
+        if self.backup_count > 0:
+            for i in range(self.backup_count - 1, 0, -1):
+                src = self.path.with_name(f"{self.path.name}.{i}")
+                if src.exists():
+                    os.replace(src, self.path.with_name(f"{self.path.name}.{i + 1}"))
+            if self.path.exists():
+                os.replace(self.path, self.path.with_name(f"{self.path.name}.1"))
+        elif self.path.exists():
+            self.path.unlink()
+
+    def write(self, lines: list[str]):
+        if self._file is None:
+            self._open()
+        elif self._rotated_elsewhere():
+            self.close()
+            self._open()
+        elif self._should_rotate():
+            with self._rotation_lock():
+                # Unless another process rotated it while this one was waiting for the lock
+                if self._rotated_elsewhere():
+                    self.close()
+                else:
+                    self.rotate()
+                self._open()
+        self._file.write("".join(lines))
+        self._file.flush()
+
+    def close(self):
+        if self._file:
+            self._file.close()
+            self._file = None
+
+
+class LogWriter:
+    """
+    Background thread writing queued log lines in batches: callers only format a line and push it to a queue.
+    Lines are flushed every `flush_interval` seconds or as soon as enough of them are waiting.
+    """
+
+    def __init__(
+        self,
+        max_bytes: int = LOG_MAX_BYTES,
+        rotate_interval: float = LOG_ROTATE_INTERVAL,
+        backup_count: int = LOG_BACKUP_COUNT,
+        flush_interval: float = LOG_FLUSH_INTERVAL,
+        console: Optional[TextIO] = None,
+        echo: bool = True,
+        batch_size: int = 1000,
+    ):
+        self.max_bytes = max_bytes
+        self.rotate_interval = rotate_interval
+        self.backup_count = backup_count
+        self.flush_interval = flush_interval
+        self.console = console
+        self.echo = echo
+        self.batch_size = batch_size
+        self._queue: queue.SimpleQueue = queue.SimpleQueue()
+        self._files: dict[Path, RotatingFile] = {}
+        self._flushed = threading.Condition()
+        self._pending = 0
+        self._thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+        self._thread.start()
+
+    def write(self, path: Optional[Path], line: str, echo: bool = False):
+        with self._flushed:
+            self._pending += 1
+        self._queue.put((path, line, echo))
+
+    def _drain(self, first) -> list:
+        batch = [first]
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _write_batch(self, batch: list):
+        per_file: dict[Path, list[str]] = {}
+        console = []
+        for path, line, echo in batch:
+            if path is not None:
+                per_file.setdefault(path, []).append(line + "\n")
+            if echo:
+                console.append(line + "\n")
+        for path, lines in per_file.items():
+            target = self._files.get(path)
+            if target is None:
+                target = self._files[path] = RotatingFile(path, self.max_bytes, self.rotate_interval, self.backup_count)
+            try:
+                target.write(lines)
+            except Exception as e:
+                print(f"[Logger] Failed to write {path}: {e}", file=sys.stderr)
+        if console and self.echo:
+            # sys.stdout is looked up on each batch, it can be replaced (tests, reloads…)
+            stream = self.console or sys.stdout
+            try:
+                stream.write("".join(console))
+                stream.flush()
+            except Exception:
+                pass
+
+    def _run(self):
+        while True:
+            first = self._queue.get()
+            # Let a few more lines arrive to write them in the same batch
+            time.sleep(self.flush_interval)
+            batch = self._drain(first)
+            try:
+                self._write_batch(batch)
+            except Exception as e:
+                print(f"[Logger] Failed to write logs: {e}", file=sys.stderr)
+            with self._flushed:
+                self._pending -= len(batch)
+                self._flushed.notify_all()
+
+    def flush(self, timeout: float = 5):
+        """Wait until every queued line is written."""
+        with self._flushed:
+            self._flushed.wait_for(lambda: self._pending == 0, timeout=timeout)
+
+    def close(self):
+        self.flush()
+        for target in self._files.values():
+            target.close()
+
+
+_writer = LogWriter()
+atexit.register(_writer.close)
+
+
+def log(msg: str, level: str = "info"):
+    if LEVELS.get(level, 20) < LEVELS.get(LOG_LEVEL, 20):
+        return
+    now = datetime.now()
+    if LOG_FORMAT == "json":
+        line = json.dumps({"ts": now.isoformat(timespec="seconds"), "level": level, "msg": msg}, ensure_ascii=False)
+    else:
+        line = f"[{now.strftime('%Y-%m-%d %H:%M:%S')}] {msg}"
+    _writer.write(LOG_FILE, line, echo=True)
 
 
 def log_history(action: str, filename: str, knowledge_id: str):
-    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    line = f"[{timestamp}] {action.upper()} → {filename} in knowledge {knowledge_id}"
-    with HISTORY_LOG.open("a", encoding="utf-8", newline="\n") as f:
-        f.write(line + "\n")
+    now = datetime.now()
+    if LOG_FORMAT == "json":
+        line = json.dumps(
+            {
+                "ts": now.isoformat(timespec="seconds"),
+                "action": action.upper(),
+                "filename": filename,
+                "knowledge_id": knowledge_id,
+            },
+            ensure_ascii=False,
+        )
+    else:
+        line = f"[{now.strftime('%Y-%m-%d %H:%M:%S')}] {action.upper()} → {filename} in knowledge {knowledge_id}"
+    _writer.write(HISTORY_LOG, line)
+
+
+def flush_logs():
+    _writer.flush()
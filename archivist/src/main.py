@@ -1,18 +1,17 @@
-import threading
 import uvicorn
-from delete import delete_loop
+from config import API_WORKERS
 from logger import log
 
 
 def start_api():
-    log("[Archivist] 🌀 Starting Archivist API server...")
-    uvicorn.run("add:app", host="0.0.0.0", port=9000, reload=False)
+    log(f"[Archivist] 🌀 Starting Archivist API server with {API_WORKERS} worker(s)...")
+    # The delete loop runs in the workers (see `add.lifespan`), only the holder of the sweeper lease sweeps
+    uvicorn.run("add:app", host="0.0.0.0", port=9000, reload=False, workers=API_WORKERS)
 
 
 if __name__ == "__main__":
     log("[Archivist] 🟢 Starting archivist...")
     try:
-        threading.Thread(target=delete_loop, daemon=True).start()
         start_api()
     except Exception as e:
         log(f"[Archivist] ❌ Fatal error: {e}")
@@ -0,0 +1,158 @@
+"""
+Move the conversation files of `MEMORY_DIR` and of its archive to another layout, flat or hash-prefix shards
+(`ab/cd/<chat_id>.md`), and update the archive paths recorded in the database, cold storage included.
+
+    python migrate_layout.py --levels 2 [--dry-run]
+
+Stop Archivist and the pipeline first, then restart them with `MEMORY_SHARD_LEVELS` and the `shard_levels` valve
+set to the new value. Files are found whatever their current layout, so an interrupted migration is resumed by
+running it again.
+"""
+
+import argparse
+from collections import Counter, namedtuple
+import os
+from pathlib import Path
+from typing import Iterator
+
+from archive_store import archive_store
+from cold_storage import ColdEntry, cold_storage
+from config import ARCHIVE_PER_KNOWLEDGE, FILENAME_TEMPLATE, MEMORY_DIR, MEMORY_SHARD_LEVELS
+from file_utils import conversation_path, is_shard_dir
+from logger import flush_logs, log
+
+Move = namedtuple("Move", ["chat_id", "source", "target"])
+
+
+def find_conversation_files(root: Path, extension: str) -> Iterator[Path]:
+    """Conversation files of `root` and of its shard directories, at any depth."""
+    stack = [Path(root)]
+    while stack:
+        try:
+            with os.scandir(stack.pop()) as it:
+                entries = list(it)
+        except FileNotFoundError:
+            continue
+        for entry in entries:
+            if is_shard_dir(entry.name) and entry.is_dir(follow_symlinks=False):
+                stack.append(Path(entry.path))
+            elif entry.name.endswith(f".{extension}") and entry.is_file(follow_symlinks=False):
+                yield Path(entry.path)
+
+
+def layout_roots(memory_dir: Path, per_knowledge: bool = ARCHIVE_PER_KNOWLEDGE) -> list[Path]:
+    """Directories holding conversations: the memory, the archive and, when archived per knowledge, its folders."""
+    archive_dir = Path(memory_dir, "archived")
+    roots = [Path(memory_dir), archive_dir]
+    if per_knowledge and archive_dir.is_dir():
+        with os.scandir(archive_dir) as it:
+            roots += sorted(Path(e.path) for e in it if e.is_dir(follow_symlinks=False) and not is_shard_dir(e.name))
+    return roots
+
+
+def plan_moves(roots: list[Path], extension: str, levels: int) -> list[Move]:
+    moves = []
+    for root in roots:
+        for path in find_conversation_files(root, extension):
+            target = conversation_path(root, path.stem, extension, levels)
+            if target != path:
+                moves.append(Move(path.stem, path, target))
+    return moves
+
+
+def cold_target(entry: ColdEntry, roots: list[Path], extension: str, levels: int) -> Path:
+    """Archive path of a file of the cold tier in the layout with `levels` shard levels."""
+    root = Path(entry.archive_path).parent
+    while root not in roots and is_shard_dir(root.name):
+        root = root.parent
+    return conversation_path(root, entry.chat_id, extension, levels)
+
+
+def record_move(move: Move):
+    record = archive_store.get(move.chat_id)
+    if record and record.archive_path == str(move.source):
+        archive_store.upsert(record._replace(archive_path=str(move.target)))
+
+
+def prune_empty_shards(directory: Path) -> int:
+    """Remove the shard directories left empty under `directory`. Return the number removed."""
+    removed = 0
+    try:
+        subdirs = [Path(e.path) for e in os.scandir(directory) if is_shard_dir(e.name) and e.is_dir()]
+    except FileNotFoundError:
+        return 0
+    for subdir in subdirs:
+        removed += prune_empty_shards(subdir)
+        try:
+            subdir.rmdir()
+            removed += 1
+        except OSError:
+            continue  # not empty
+    return removed
+
+
+def migrate(
+    memory_dir: Path = MEMORY_DIR,
+    levels: int = MEMORY_SHARD_LEVELS,
+    dry_run: bool = False,
+    per_knowledge: bool = ARCHIVE_PER_KNOWLEDGE,
+) -> Counter:
+    """Move every conversation file to the layout with `levels` shard levels. Return the count of each result."""
+    extension = Path(FILENAME_TEMPLATE).suffix[1:]
+    roots = layout_roots(memory_dir, per_knowledge)
+    moves = plan_moves(roots, extension, levels)
+    # Files of the cold tier are not on disk: only the path they are restored to changes
+    cold_moves = []
+    for entry in cold_storage.entries():
+        target = cold_target(entry, roots, extension, levels)
+        if str(target) != entry.archive_path:
+            cold_moves.append(Move(entry.chat_id, Path(entry.archive_path), target))
+    log(f"[Layout] {len(moves) + len(cold_moves)} files to move to {levels or 'no'} shard levels")
+    results: Counter = Counter()
+    if dry_run:
+        results["to move"] = len(moves) + len(cold_moves)
+        return results
+    for move in cold_moves:
+        cold_storage.set_archive_path(move.chat_id, move.target)
+        record_move(move)
+        results["moved"] += 1
+    for i, move in enumerate(moves, 1):
+        if move.target.exists():
+            log(f"[Layout] ⚠️ {move.target} already exists, keeping {move.source}", level="warning")
+            results["conflict"] += 1
+            continue
+        try:
+            move.target.parent.mkdir(parents=True, exist_ok=True)
+            move.source.rename(move.target)
+        except OSError as e:
+            log(f"[Layout] Failed to move {move.source}: {e}", level="error")
+            results["error"] += 1
+            continue
+        record_move(move)
+        results["moved"] += 1
+        if i % 10000 == 0:
+            log(f"[Layout] {i}/{len(moves)} files moved")
+    removed = sum(prune_empty_shards(root) for root in roots)
+    if removed:
+        log(f"[Layout] Removed {removed} empty shard directories")
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Move the conversation files to another directory layout.")
+    parser.add_argument("--memory-dir", type=Path, default=MEMORY_DIR)
+    parser.add_argument(
+        "--levels", type=int, default=MEMORY_SHARD_LEVELS, help="hash-prefix directory levels, 0 for a flat directory"
+    )
+    parser.add_argument("--dry-run", action="store_true", help="only count the files to move")
+    args = parser.parse_args(argv)
+    if not 0 <= args.levels <= 4:
+        parser.error("--levels must be between 0 and 4")
+    results = migrate(args.memory_dir, args.levels, args.dry_run)
+    log(f"[Layout] Done: {dict(results)}")
+    flush_logs()
+    return 1 if results["error"] or results["conflict"] else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,50 @@
+import asyncio
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+import time
+from typing import Optional
+
+from config import SWEEP_PER_TOKEN_CONCURRENCY, SWEEP_RATE_LIMIT
+
+
+class RateLimiter:
+    """
+    Global requests-per-second limit (token bucket, `rate <= 0` disables it)
+    and a cap on concurrent requests per API key.
+    Must be used from a single event loop.
+    """
+
+    def __init__(self, rate: float = SWEEP_RATE_LIMIT, per_key: int = SWEEP_PER_TOKEN_CONCURRENCY):
+        self.rate = rate
+        self.burst = max(rate, 1)
+        self.per_key = per_key
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+        self._semaphores: dict[str, asyncio.Semaphore] = {}
+
+    async def _take(self):
+        if self.rate <= 0:
+            return
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+    @asynccontextmanager
+    async def limit(self, key: str):
+        semaphore = self._semaphores.get(key)
+        if semaphore is None:
+            semaphore = self._semaphores[key] = asyncio.Semaphore(self.per_key)
+        async with semaphore:
+            await self._take()
+            yield
+
+
+# Limiter applied by `http_client.request` to every call made in the current context (ex: the delete sweep)
+current_limiter: ContextVar[Optional[RateLimiter]] = ContextVar("current_limiter", default=None)
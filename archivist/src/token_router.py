@@ -0,0 +1,116 @@
+import json
+from pathlib import Path
+import threading
+import time
+from typing import Optional
+
+from config import TOKEN, TOKEN_NEGATIVE_TTL, USERS_API
+from logger import log
+from metrics import cache_lookups
+
+
+class TokenRouter:
+    """
+    Route chat lookups to the API key that can see them.
+    `user_api.json` is reloaded when its mtime changes, the key owning a chat or a user is remembered once found,
+    and chats found with no key are remembered as missing for `negative_ttl` seconds.
+    Expired missing chats are pruned every `negative_ttl` seconds, and a complete listing of every key replaces the
+    remembered chat owners, so deleted chats are forgotten.
+    The default key (`WEBUI_TOKEN`) is represented by `None`.
+    """
+
+    def __init__(self, path: Path = USERS_API, negative_ttl: float = TOKEN_NEGATIVE_TTL):
+        self.path = Path(path)
+        self.negative_ttl = negative_ttl
+        self._mtime: Optional[float] = None
+        self._tokens: list[str] = []
+        self._chat_owner: dict[str, Optional[str]] = {}
+        self._user_owner: dict[str, Optional[str]] = {}
+        self._missing: dict[str, float] = {}
+        self._next_prune = 0.0
+        self._lock = threading.Lock()
+
+    def tokens(self) -> list[str]:
+        """Tokens of `user_api.json` (without the default key), reloaded when the file changed."""
+        try:
+            mtime = self.path.stat().st_mtime
+        except OSError:
+            mtime = None
+        if mtime != self._mtime:
+            tokens = []
+            if mtime is not None:
+                try:
+                    tokens = list(json.loads(self.path.read_text(encoding="utf-8")).values())
+                except Exception as e:
+                    log(f"Failed to load user API: {e}", level="warning")
+            with self._lock:
+                self._tokens = [token for token in dict.fromkeys(tokens) if token and token != TOKEN]
+                self._mtime = mtime
+        return self._tokens
+
+    def candidates(self, chat_id: str, user_id: Optional[str] = None) -> list[Optional[str]]:
+        """Keys to try for `chat_id`: the remembered owner of the chat, then of the user, then the default and the others."""
+        available = [None, *self.tokens()]
+        known_owner = chat_id in self._chat_owner and self._chat_owner[chat_id] in available
+        cache_lookups.inc(cache="chat_owner", result="hit" if known_owner else "miss")
+        ordered: list[Optional[str]] = []
+        for owners, key in ((self._chat_owner, chat_id), (self._user_owner, user_id)):
+            # Remembered keys removed from user_api.json since are ignored
+            if key in owners and owners[key] in available and owners[key] not in ordered:
+                ordered.append(owners[key])
+        for token in available:
+            if token not in ordered:
+                ordered.append(token)
+        return ordered
+
+    def remember(self, chat_id: str, token: Optional[str], user_id: Optional[str] = None):
+        with self._lock:
+            self._chat_owner[chat_id] = token
+            if user_id:
+                self._user_owner[user_id] = token
+            self._missing.pop(chat_id, None)
+
+    def remember_many(self, owners: dict[str, Optional[str]]):
+        """Remember the key owning each chat of a partial listing."""
+        with self._lock:
+            self._chat_owner.update(owners)
+            for chat_id in owners:
+                self._missing.pop(chat_id, None)
+
+    def replace_owners(self, owners: dict[str, Optional[str]]):
+        """Keep only the chats of a complete listing of every key, with the key owning each."""
+        now = time.monotonic()
+        with self._lock:
+            self._chat_owner = dict(owners)
+            self._missing = {
+                chat_id: expires
+                for chat_id, expires in self._missing.items()
+                if expires > now and chat_id not in owners
+            }
+
+    def mark_missing(self, chat_id: str):
+        now = time.monotonic()
+        with self._lock:
+            self._missing[chat_id] = now + self.negative_ttl
+            self._chat_owner.pop(chat_id, None)
+            if now >= self._next_prune:
+                self._missing = {chat_id: expires for chat_id, expires in self._missing.items() if expires > now}
+                self._next_prune = now + self.negative_ttl
+
+    def is_missing(self, chat_id: str) -> bool:
+        expires = self._missing.get(chat_id)
+        if expires is not None and time.monotonic() > expires:
+            with self._lock:
+                self._missing.pop(chat_id, None)
+            expires = None
+        cache_lookups.inc(cache="missing_chat", result="miss" if expires is None else "hit")
+        return expires is not None
+
+    @staticmethod
+    def headers(token: Optional[str]) -> Optional[dict[str, str]]:
+        if token is None:
+            return None
+        return {"Authorization": f"Bearer {token}", "Accept": "application/json"}
+
+
+token_router = TokenRouter()
@@ -0,0 +1,202 @@
+import asyncio
+import json
+from pathlib import Path
+from typing import AsyncIterator, Callable, Iterator, Optional
+import uuid
+import weakref
+import zlib
+
+import httpx
+
+from config import UPLOAD_CHUNK_SIZE, UPLOAD_GZIP, UPLOAD_MEMORY_BUDGET
+from http_client import request
+from logger import log
+
+# Answer of a server that could not read a gzip body. A 400 or 422 only counts when it mentions the encoding,
+# otherwise it is about the content itself and the uncompressed body would be rejected as well
+GZIP_UNSUPPORTED_STATUS = 415
+GZIP_ERROR_STATUSES = {400, 422}
+GZIP_ERROR_HINTS = ("gzip", "encoding")
+
+BodyEncoder = Callable[[Iterator[bytes]], Iterator[bytes]]
+
+
+def read_chunks(path: Path, chunk_size: int = UPLOAD_CHUNK_SIZE) -> Iterator[bytes]:
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            yield chunk
+
+
+def read_text_chunks(path: Path, chunk_size: int = UPLOAD_CHUNK_SIZE) -> Iterator[str]:
+    # Text mode never splits a multi-byte character between two chunks
+    with open(path, "r", encoding="utf-8", errors="replace") as f:
+        for chunk in iter(lambda: f.read(chunk_size), ""):
+            yield chunk
+
+
+def multipart_file(filename: str, content_type: str = "text/plain; charset=utf-8") -> tuple[str, BodyEncoder]:
+    """Content type and encoder of a `multipart/form-data` body holding a single `file` field."""
+    boundary = uuid.uuid4().hex
+    quoted = filename.replace("\\", "\\\\").replace('"', "%22").replace("\r", "%0D").replace("\n", "%0A")
+    head = (
+        f"--{boundary}\r\n"
+        f'Content-Disposition: form-data; name="file"; filename="{quoted}"\r\n'
+        f"Content-Type: {content_type}\r\n\r\n"
+    ).encode("utf-8")
+    tail = f"\r\n--{boundary}--\r\n".encode("utf-8")
+
+    def encode(chunks: Iterator[bytes]) -> Iterator[bytes]:
+        yield head
+        yield from chunks
+        yield tail
+
+    return f"multipart/form-data; boundary={boundary}", encode
+
+
+def json_content(chunks: Iterator[str], key: str = "content") -> Iterator[bytes]:
+    """`{"<key>": "<text>"}` encoded chunk by chunk, the text never being joined in memory."""
+    yield f"{{{json.dumps(key)}: \"".encode("utf-8")
+    for chunk in chunks:
+        yield json.dumps(chunk)[1:-1].encode("utf-8")
+    yield b'"}'
+
+
+def gzip_chunks(chunks: Iterator[bytes]) -> Iterator[bytes]:
+    compressor = zlib.compressobj(wbits=31)  # gzip container
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+class ByteBudget:
+    """Async semaphore counted in bytes. A reservation larger than the budget waits until it is alone."""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.used = 0
+        self._changed = asyncio.Condition()
+
+    async def acquire(self, size: int) -> int:
+        size = min(size, self.limit)
+        async with self._changed:
+            await self._changed.wait_for(lambda: self.used + size <= self.limit)
+            self.used += size
+        return size
+
+    async def release(self, size: int):
+        async with self._changed:
+            self.used -= size
+            self._changed.notify_all()
+
+
+class StreamingUploader:
+    """
+    Send files to Open WebUI as streamed request bodies, read `chunk_size` bytes at a time, never building the whole
+    content in memory. Bodies are gzip-compressed when `gzip` is set, until the server answers it can't read them.
+    Concurrent uploads are limited to `memory_budget` bytes in flight, each file counting for its size (0: no limit).
+    """
+
+    def __init__(
+        self,
+        chunk_size: int = UPLOAD_CHUNK_SIZE,
+        memory_budget: int = UPLOAD_MEMORY_BUDGET,
+        gzip: bool = UPLOAD_GZIP,
+    ):
+        self.chunk_size = max(chunk_size, 1)
+        self.memory_budget = memory_budget
+        self.gzip_supported = gzip
+        # asyncio primitives are bound to the loop they are used in
+        self._budgets: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, ByteBudget]" = (
+            weakref.WeakKeyDictionary()
+        )
+
+    def budget(self) -> ByteBudget:
+        loop = asyncio.get_running_loop()
+        budget = self._budgets.get(loop)
+        if budget is None:
+            budget = self._budgets[loop] = ByteBudget(self.memory_budget)
+        return budget
+
+    async def upload(self, path: Path, filename: str, **kwargs) -> httpx.Response:
+        """Upload `path` as a new file (multipart form)."""
+        content_type, encode = multipart_file(filename)
+        return await self.send(
+            "POST",
+            "/api/v1/files/",
+            "upload",
+            path,
+            lambda: encode(read_chunks(path, self.chunk_size)),
+            content_type,
+            **kwargs,
+        )
+
+    async def update_content(self, file_id: str, path: Path, **kwargs) -> httpx.Response:
+        """Replace the content of `file_id` by the text of `path` (JSON body)."""
+        return await self.send(
+            "POST",
+            f"/api/v1/files/{file_id}/data/content/update",
+            "update",
+            path,
+            lambda: json_content(read_text_chunks(path, self.chunk_size)),
+            "application/json",
+            **kwargs,
+        )
+
+    async def send(
+        self,
+        method: str,
+        path: str,
+        endpoint: str,
+        source: Path,
+        body: Callable[[], Iterator[bytes]],
+        content_type: str,
+        headers: Optional[dict[str, str]] = None,
+    ) -> httpx.Response:
+        if self.memory_budget <= 0:
+            return await self._send(method, path, endpoint, body, content_type, headers)
+        budget = self.budget()
+        reserved = await budget.acquire(source.stat().st_size)
+        try:
+            return await self._send(method, path, endpoint, body, content_type, headers)
+        finally:
+            await budget.release(reserved)
+
+    async def _send(self, method, path, endpoint, body, content_type, headers) -> httpx.Response:
+        headers = {**(headers or {}), "Content-Type": content_type}
+        if self.gzip_supported:
+            res = await request(
+                method,
+                path,
+                endpoint=endpoint,
+                headers={**headers, "Content-Encoding": "gzip"},
+                content=aiter_chunks(gzip_chunks(body())),
+            )
+            if not gzip_rejected(res):
+                return res
+            log(f"Open WebUI rejected a gzip body ({res.status_code}), sending uncompressed bodies", level="warning")
+            self.gzip_supported = False
+        return await request(method, path, endpoint=endpoint, headers=headers, content=aiter_chunks(body()))
+
+
+def gzip_rejected(res: httpx.Response) -> bool:
+    if res.status_code == GZIP_UNSUPPORTED_STATUS:
+        return True
+    if res.status_code in GZIP_ERROR_STATUSES:
+        text = res.text.lower()
+        return any(hint in text for hint in GZIP_ERROR_HINTS)
+    return False
+
+
+async def aiter_chunks(chunks: Iterator[bytes]) -> AsyncIterator[bytes]:
+    # httpx needs an async iterator for the body of an AsyncClient request. Files are read and compressed in a
+    # thread, one chunk at a time, to keep the event loop free during large uploads
+    try:
+        while (chunk := await asyncio.to_thread(next, chunks, None)) is not None:
+            yield chunk
+    finally:
+        chunks.close()
+
+
+uploader = StreamingUploader()
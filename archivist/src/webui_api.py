@@ -1,152 +1,207 @@
+import asyncio
 from pathlib import Path
-from file_utils import get_uid, load_user_api, read_file_content
+from typing import Optional
+from http_client import request
+from knowledge_cache import knowledge_cache
+from token_router import token_router
+from upload_stream import uploader
 from logger import log, log_history
-import requests
 
-from config import HEADERS, WEBUI_API
+from config import HEADERS
 
 
-def is_webui_reachable():
+async def is_webui_reachable():
     try:
-        res = requests.get(f"{WEBUI_API}/api/v1/health", timeout=5)
+        res = await request("GET", "/api/v1/health", endpoint="health")
         return res.status_code == 200
     except Exception as e:
         log(f"[Delete archive] 🚫 WebUI not reachable: {e}")
         return False
 
 
-def get_chat_info(chat_id: str):
-    # 1. Essaie avec la clé par défaut
-    try:
-        res = requests.get(f"{WEBUI_API}/api/v1/chats/{chat_id}", headers=HEADERS)
-        if res.status_code == 200:
-            return res.json()
-    except Exception as e:
-        log(f"Error fetching chat with default key: {e}")
-
-    # 2. Fallback avec les autres clés utilisateur
-    all_user_tokens = load_user_api()
-    for token in all_user_tokens:
+async def get_chat_info(chat_id: str, user_id: Optional[str] = None):
+    """
+    Fetch a chat, trying first the API key known to own it (or its user), then the default key and the others.
+    Chats found with no key are not looked up again for `TOKEN_NEGATIVE_TTL` seconds.
+    """
+    if token_router.is_missing(chat_id):
+        return None
+    failed = False
+    for token in token_router.candidates(chat_id, user_id):
         try:
-            headers = {"Authorization": f"Bearer {token}", "Accept": "application/json"}
-            res = requests.get(f"{WEBUI_API}/api/v1/chats/{chat_id}", headers=headers)
+            res = await request("GET", f"/api/v1/chats/{chat_id}", endpoint="chat", headers=token_router.headers(token))
             if res.status_code == 200:
-                log(f"✅ Chat {chat_id} found using fallback API key")
-                return res.json()
+                chat = res.json()
+                token_router.remember(chat_id, token, user_id or chat.get("user_id"))
+                if token is not None:
+                    log(f"✅ Chat {chat_id} found using fallback API key")
+                return chat
+            if res.status_code not in (401, 403, 404):
+                failed = True
         except Exception as e:
-            log(f"Error fetching chat {chat_id} with fallback key: {e}")
+            failed = True
+            key = "default key" if token is None else "fallback key"
+            log(f"Error fetching chat {chat_id} with {key}: {e}", level="error")
 
     log(f"❌ Chat {chat_id} not found with any available key")
+    # Only a definitive answer of every key is cached
+    if not failed:
+        token_router.mark_missing(chat_id)
     return None
 
 
-def get_existing_file(knowledge_id: str, filename: str):
+async def list_chat_ids(headers: Optional[dict[str, str]] = None) -> Optional[set[str]]:
+    """
+    Return the ids of every chat (including archived ones) visible with `headers` (default key if `None`),
+    using the paged list endpoints. Return `None` if a listing failed, as the result would be incomplete.
+    """
+    chat_ids: set[str] = set()
+    for path in ("/api/v1/chats/", "/api/v1/chats/archived"):
+        listed: set[str] = set()
+        page = 1
+        while True:
+            try:
+                res = await request("GET", path, endpoint="chat", headers=headers, params={"page": page})
+                if res.status_code != 200:
+                    log(f"Failed to list chats from {path}: {res.status_code}", level="warning")
+                    return None
+                items = res.json()
+            except Exception as e:
+                log(f"Error listing chats from {path}: {e}", level="error")
+                return None
+            before = len(listed)
+            listed.update(item["id"] for item in items or [] if item.get("id"))
+            # Stop on an empty page, or when the server ignores paging and sends the same chats again
+            if len(listed) == before:
+                break
+            page += 1
+        chat_ids |= listed
+    return chat_ids
+
+
+async def list_all_chat_ids() -> tuple[set[str], bool]:
+    """
+    Union of the chat ids listed with the default key and every key of `user_api.json`.
+    The boolean is `False` when at least one listing failed.
+    """
+    tokens = [None, *token_router.tokens()]
+    listings = await asyncio.gather(*(list_chat_ids(token_router.headers(token)) for token in tokens))
+    owners: dict[str, Optional[str]] = {}
+    for token, chat_ids in zip(tokens, listings):
+        if chat_ids is not None:
+            owners.update(dict.fromkeys(chat_ids, token))
+    complete = None not in listings
+    if complete:
+        # The owners of the chats deleted since the last listing are forgotten
+        token_router.replace_owners(owners)
+    else:
+        token_router.remember_many(owners)
+    return set(owners), complete
+
+
+async def get_existing_file(knowledge_id: str, filename: str, file_id: Optional[str] = None):
+    """File of the knowledge recorded as `file_id` when archived, else the one named `filename`."""
     try:
-        res = requests.get(f"{WEBUI_API}/api/v1/knowledge/{knowledge_id}", headers=HEADERS)
-        if res.status_code == 200:
-            files = res.json().get("files", [])
-            for f in files:
-                if f.get("filename") == get_uid(filename):
-                    return f
-        else:
-            log(f"Failed to fetch knowledge details: {res.status_code}")
+        return await knowledge_cache.get_file(knowledge_id, filename, file_id)
     except Exception as e:
-        log(f"Error checking existing file: {e}")
+        log(f"Error checking existing file: {e}", level="error")
     return None
 
 
-def update_file_content(file_id: str, content: str):
+async def update_file_content(file_id: str, source_path: Path):
+    """Replace the content of `file_id` by the text of `source_path`, streamed."""
     try:
-        res = requests.post(
-            f"{WEBUI_API}/api/v1/files/{file_id}/data/content/update",
-            headers={**HEADERS, "Content-Type": "application/json"},
-            json={"content": content},
-        )
+        res = await uploader.update_content(file_id, source_path)
         if res.status_code != 200:
-            log(f"Failed to update file content: {res.status_code} - {res.text}")
+            log(f"Failed to update file content: {res.status_code} - {res.text}", level="warning")
         return res.status_code == 200
     except Exception as e:
-        log(f"Error updating file content: {e}")
+        log(f"Error updating file content: {e}", level="error")
     return False
 
 
-def update_file_in_knowledge(knowledge_id: str, file_id: str):
+async def update_file_in_knowledge(knowledge_id: str, file_id: str):
     try:
-        res = requests.post(
-            f"{WEBUI_API}/api/v1/knowledge/{knowledge_id}/file/update",
+        res = await request(
+            "POST",
+            f"/api/v1/knowledge/{knowledge_id}/file/update",
+            endpoint="update",
             headers={**HEADERS, "Content-Type": "application/json"},
             json={"file_id": file_id},
         )
         if res.status_code != 200:
-            log(f"Failed to reindex file {file_id}: {res.status_code} - {res.text}")
+            log(f"Failed to reindex file {file_id}: {res.status_code} - {res.text}", level="warning")
         return res.status_code == 200
     except Exception as e:
-        log(f"Error reindexing file in knowledge: {e}")
+        log(f"Error reindexing file in knowledge: {e}", level="error")
     return False
 
 
-def delete_file(file_id: str):
+async def delete_file(file_id: str):
     try:
-        res = requests.delete(f"{WEBUI_API}/api/v1/files/{file_id}", headers=HEADERS)
+        res = await request("DELETE", f"/api/v1/files/{file_id}", endpoint="delete")
         if res.status_code != 200:
-            log(f"Failed to delete file {file_id}: {res.status_code} - {res.text}")
+            log(f"Failed to delete file {file_id}: {res.status_code} - {res.text}", level="warning")
         return res.status_code == 200
     except Exception as e:
-        log(f"Error deleting file: {e}")
+        log(f"Error deleting file: {e}", level="error")
     return False
 
 
-def add_to_knowledge(file_id: str, knowledge_id: str, filename: str, source_path: Path):
-    existing_file = get_existing_file(knowledge_id, filename)
-    if existing_file:
-        log(f"File already in knowledge, updating content: {filename}")
-        existing_file_id = existing_file.get("id")
-        if existing_file_id:
-            content = read_file_content(source_path)
-            if update_file_content(existing_file_id, content):
-                if update_file_in_knowledge(knowledge_id, existing_file_id):
-                    log_history("updated", filename, knowledge_id)
-                    return True
-                else:
-                    log(f"⚠️ Failed to reindex file {filename} in knowledge {knowledge_id}")
-                    if not remove_from_knowledge({"file_id": file_id}, knowledge_id, filename):
-                        return False
-            else:
-                log(f"⚠️ Failed to update content for file {filename}")
-        else:
-            log(f"⚠️ No file ID found for existing file: {filename} in knowledge {knowledge_id}")
-
-    # fallback to upload + add
+async def update_knowledge_file(knowledge_id: str, file_id: str, filename: str, source_path: Path) -> bool:
+    """
+    Replace the content of `file_id`, already in the knowledge, by `source_path` and reindex it: no new upload.
+    A file that can't be reindexed is removed from the knowledge, to be added again.
+    """
+    log(f"File already in knowledge, updating content: {filename}")
+    if not await update_file_content(file_id, source_path):
+        log(f"⚠️ Failed to update content for file {filename}", level="warning")
+        return False
+    if not await update_file_in_knowledge(knowledge_id, file_id):
+        log(f"⚠️ Failed to reindex file {filename} in knowledge {knowledge_id}", level="warning")
+        await remove_from_knowledge({"file_id": file_id}, knowledge_id, filename)
+        return False
+    log_history("updated", filename, knowledge_id)
+    return True
+
+
+async def add_to_knowledge(file_id: str, knowledge_id: str, filename: str) -> Optional[str]:
+    """Add the uploaded `file_id` to the knowledge. Return the id of the file in the knowledge."""
     data = {"file_id": file_id}
-    res = requests.post(
-        f"{WEBUI_API}/api/v1/knowledge/{knowledge_id}/file/add",
+    res = await request(
+        "POST",
+        f"/api/v1/knowledge/{knowledge_id}/file/add",
+        endpoint="add",
         headers={**HEADERS, "Content-Type": "application/json"},
         json=data,
     )
     if res.status_code != 200:
         log(f"Add failed: {res.status_code} - {res.text}")
-    else:
-        log_history("added", filename, knowledge_id)
-    return res.status_code == 200
+        return None
+    knowledge_cache.put(knowledge_id, {"id": file_id, "filename": filename, "meta": {"name": filename}})
+    log_history("added", filename, knowledge_id)
+    return file_id
 
 
-def remove_from_knowledge(data: dict[str, str], knowledge_id: str, filename: str):
-    res = requests.post(
-        f"{WEBUI_API}/api/v1/knowledge/{knowledge_id}/file/remove",
+async def remove_from_knowledge(data: dict[str, str], knowledge_id: str, filename: str):
+    res = await request(
+        "POST",
+        f"/api/v1/knowledge/{knowledge_id}/file/remove",
+        endpoint="remove",
         headers={**HEADERS, "Content-Type": "application/json"},
         json=data,
     )
     if res.status_code != 200:
         log(f"Remove failed: {res.status_code} - {res.text}")
     else:
+        knowledge_cache.remove(knowledge_id, data.get("file_id"))
         log_history("removed", filename, knowledge_id)
     return res.status_code == 200
 
 
-def upload_file(file_path: Path, filename: str):
-    with open(file_path, "rb") as f:
-        files = {"file": (filename, f, "text/plain; charset=utf-8")}
-        res = requests.post(f"{WEBUI_API}/api/v1/files/", headers=HEADERS, files=files)
+async def upload_file(file_path: Path, filename: str):
+    """Upload `file_path` as `filename`, streamed. Return the id of the new file."""
+    res = await uploader.upload(file_path, filename)
     if res.status_code == 200:
         try:
             return res.json().get("id")
@@ -0,0 +1,59 @@
+"""
+Compare the single-pass `ContentCleaner` with the previous three `re.sub` implementation on large RAG-heavy messages.
+
+Usage: `python tests/benchmarks/bench_clean_content.py [--messages 200] [--sources 20] [--repeat 5]`
+Results are printed as JSON.
+"""
+
+import argparse
+import json
+from pathlib import Path
+import random
+import re
+import sys
+import timeit
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[3] / "Pipelines"))
+
+from conversation_saver import ContentCleaner, DEFAULT_CLEAN_RULES  # noqa: E402
+
+
+def legacy_clean(text: str) -> str:
+    text = re.sub(r"<source(_context)?>.*?</source(_context)?>", "", text, flags=re.DOTALL)
+    text = re.sub(r"\[source_id.*\]", "", text)
+    text = re.sub(r"\[\d+\]", "", text)
+    return text.strip()
+
+
+def make_message(sources: int, rng: random.Random) -> str:
+    words = ["archive", "memory", "knowledge", "conversation", "model", "pipeline", "vector", "[1]", "[12]"]
+    parts = []
+    for i in range(sources):
+        body = " ".join(rng.choices(words, k=200))
+        parts.append(f'<source><source_context>[source_id: {i}] {body}</source_context></source>\n')
+    parts.append(" ".join(rng.choices(words, k=500)))
+    return "".join(parts)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", type=int, default=200)
+    parser.add_argument("--sources", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    messages = [make_message(args.sources, rng) for _ in range(args.messages)]
+    cleaner = ContentCleaner(DEFAULT_CLEAN_RULES)
+    size = sum(len(m) for m in messages)
+
+    results = {"messages": args.messages, "characters": size}
+    for name, clean in (("legacy", legacy_clean), ("single_pass", cleaner.clean)):
+        best = min(timeit.repeat(lambda: [clean(m) for m in messages], number=1, repeat=args.repeat))
+        results[name] = {"seconds": round(best, 4), "mb_per_second": round(size / best / 1e6, 2)}
+    results["speedup"] = round(results["legacy"]["seconds"] / results["single_pass"]["seconds"], 2)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
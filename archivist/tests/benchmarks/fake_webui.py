@@ -0,0 +1,252 @@
+"""
+In-memory stand-in for the Open WebUI endpoints used by Archivist (health, chats, files, knowledge),
+with configurable latency and failure rate, and knowledge collections pre-filled with many files.
+
+Run it alone with `python tests/benchmarks/fake_webui.py --port 8080 --latency 0.02`,
+or start it from a benchmark with `FakeWebUIServer(config).start()`.
+"""
+
+import argparse
+import asyncio
+import itertools
+import random
+import re
+import socket
+import threading
+import time
+from typing import Optional
+
+from fastapi import FastAPI, Request, Response
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+import uvicorn
+
+
+class FakeConfig(BaseModel):
+    latency: float = 0.0  # seconds added to every call
+    jitter: float = 0.0  # random extra latency, up to this many seconds
+    upload_latency: float = 0.0  # extra seconds for uploads and reindexing (embedding)
+    failure_rate: float = 0.0  # share of the calls answered with a 500
+    page_size: int = 60  # chats per page of /api/v1/chats/
+    seed: int = 42
+
+
+class FakeWebUI:
+    """State of the fake server: chats, files and knowledge collections, with call counters per endpoint."""
+
+    def __init__(self, config: FakeConfig):
+        self.config = config
+        self.rng = random.Random(config.seed)
+        self.chats: dict[str, dict] = {}
+        self.files: dict[str, dict] = {}
+        self.knowledge: dict[str, dict] = {}
+        self.calls: dict[str, int] = {}
+        self._ids = itertools.count(1)
+
+    def add_chat(self, chat_id: str, user_id: str = "user-1", title: Optional[str] = None):
+        self.chats[chat_id] = {"id": chat_id, "user_id": user_id, "title": title or f"Chat {chat_id[:8]}"}
+
+    def add_knowledge(self, knowledge_id: str, name: str, files: int = 0):
+        """Create a knowledge collection pre-filled with `files` files."""
+        knowledge = self.knowledge.setdefault(knowledge_id, {"id": knowledge_id, "name": name, "files": [], "version": 0})
+        for i in range(files):
+            file = self.new_file(f"[{i:08d}] filler_{i}.md", "filler")
+            knowledge["files"].append(file["id"])
+
+    def new_file(self, filename: str, content: str) -> dict:
+        file_id = f"file-{next(self._ids)}"
+        self.files[file_id] = {"id": file_id, "filename": filename, "meta": {"name": filename}, "content": content}
+        return self.files[file_id]
+
+    def file_record(self, file_id: str) -> dict:
+        file = self.files[file_id]
+        return {"id": file_id, "filename": file["filename"], "meta": file["meta"]}
+
+    async def call(self, endpoint: str, slow: bool = False) -> Optional[Response]:
+        """Count the call and wait for the configured latency. Return a 500 response for injected failures."""
+        self.calls[endpoint] = self.calls.get(endpoint, 0) + 1
+        delay = self.config.latency + self.rng.uniform(0, self.config.jitter) + (self.config.upload_latency if slow else 0)
+        if delay:
+            await asyncio.sleep(delay)
+        if self.config.failure_rate and self.rng.random() < self.config.failure_rate:
+            return JSONResponse({"detail": "injected failure"}, status_code=500)
+        return None
+
+
+def parse_upload(content_type: str, body: bytes) -> tuple[str, str]:
+    """Filename and content of the single file of a multipart upload (no `python-multipart` needed)."""
+    boundary = content_type.partition("boundary=")[2].strip('"').encode()
+    part = body.split(b"--" + boundary)[1]
+    headers, _, content = part.partition(b"\r\n\r\n")
+    match = re.search(rb'filename="([^"]*)"', headers)
+    filename = match.group(1).decode("utf-8") if match else "upload"
+    return filename, content.removesuffix(b"\r\n").decode("utf-8", errors="replace")
+
+
+def create_app(state: FakeWebUI) -> FastAPI:
+    app = FastAPI()
+    app.state.webui = state
+
+    @app.get("/health")
+    async def health():
+        return await state.call("health") or {"status": True}
+
+    @app.get("/api/v1/chats/archived")
+    async def list_archived_chats(page: int = 1):
+        return await state.call("chats") or []
+
+    @app.get("/api/v1/chats/")
+    async def list_chats(page: int = 1):
+        failure = await state.call("chats")
+        if failure:
+            return failure
+        chats = list(state.chats.values())
+        size = state.config.page_size
+        return [{"id": chat["id"], "title": chat["title"]} for chat in chats[(page - 1) * size : page * size]]
+
+    @app.get("/api/v1/chats/{chat_id}")
+    async def get_chat(chat_id: str):
+        failure = await state.call("chat")
+        if failure:
+            return failure
+        if chat_id not in state.chats:
+            return JSONResponse({"detail": "not found"}, status_code=404)
+        return state.chats[chat_id]
+
+    @app.post("/api/v1/files/")
+    async def upload(request: Request):
+        failure = await state.call("upload", slow=True)
+        if failure:
+            return failure
+        filename, content = parse_upload(request.headers.get("content-type", ""), await request.body())
+        return state.file_record(state.new_file(filename, content)["id"])
+
+    @app.post("/api/v1/files/{file_id}/data/content/update")
+    async def update_content(file_id: str, request: Request):
+        failure = await state.call("update", slow=True)
+        if failure:
+            return failure
+        if file_id not in state.files:
+            return JSONResponse({"detail": "not found"}, status_code=404)
+        state.files[file_id]["content"] = (await request.json()).get("content", "")
+        return state.file_record(file_id)
+
+    @app.delete("/api/v1/files/{file_id}")
+    async def delete_file(file_id: str):
+        failure = await state.call("delete")
+        if failure:
+            return failure
+        state.files.pop(file_id, None)
+        return True
+
+    @app.get("/api/v1/knowledge/{knowledge_id}")
+    async def get_knowledge(knowledge_id: str, request: Request):
+        failure = await state.call("knowledge")
+        if failure:
+            return failure
+        knowledge = state.knowledge.get(knowledge_id)
+        if knowledge is None:
+            return JSONResponse({"detail": "not found"}, status_code=404)
+        etag = f'"{knowledge_id}-{knowledge["version"]}"'
+        if request.headers.get("if-none-match") == etag:
+            return Response(status_code=304, headers={"etag": etag})
+        files = [state.file_record(file_id) for file_id in knowledge["files"] if file_id in state.files]
+        return JSONResponse({"id": knowledge_id, "name": knowledge["name"], "files": files}, headers={"etag": etag})
+
+    def knowledge_update(knowledge_id: str, add: list[str] = (), remove: list[str] = ()) -> Optional[dict]:
+        knowledge = state.knowledge.get(knowledge_id)
+        if knowledge is None:
+            return None
+        knowledge["files"] = [file_id for file_id in knowledge["files"] if file_id not in remove]
+        knowledge["files"] += [file_id for file_id in add if file_id in state.files and file_id not in knowledge["files"]]
+        knowledge["version"] += 1
+        return {"id": knowledge_id, "files": [state.file_record(file_id) for file_id in knowledge["files"]]}
+
+    @app.post("/api/v1/knowledge/{knowledge_id}/file/add")
+    async def add_file(knowledge_id: str, request: Request):
+        failure = await state.call("add", slow=True)
+        if failure:
+            return failure
+        result = knowledge_update(knowledge_id, add=[(await request.json())["file_id"]])
+        return result if result else JSONResponse({"detail": "not found"}, status_code=404)
+
+    @app.post("/api/v1/knowledge/{knowledge_id}/files/batch/add")
+    async def batch_add(knowledge_id: str, request: Request):
+        # One reindex for the whole batch
+        failure = await state.call("batch_add", slow=True)
+        if failure:
+            return failure
+        result = knowledge_update(knowledge_id, add=[item["file_id"] for item in await request.json()])
+        return result if result else JSONResponse({"detail": "not found"}, status_code=404)
+
+    @app.post("/api/v1/knowledge/{knowledge_id}/file/update")
+    async def reindex_file(knowledge_id: str, request: Request):
+        failure = await state.call("reindex", slow=True)
+        if failure:
+            return failure
+        result = knowledge_update(knowledge_id)
+        return result if result else JSONResponse({"detail": "not found"}, status_code=404)
+
+    @app.post("/api/v1/knowledge/{knowledge_id}/file/remove")
+    async def remove_file(knowledge_id: str, request: Request):
+        failure = await state.call("remove")
+        if failure:
+            return failure
+        result = knowledge_update(knowledge_id, remove=[(await request.json())["file_id"]])
+        return result if result else JSONResponse({"detail": "not found"}, status_code=404)
+
+    return app
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class FakeWebUIServer:
+    """Serve the fake Open WebUI with uvicorn in a background thread, on a free local port."""
+
+    def __init__(self, config: Optional[FakeConfig] = None, port: Optional[int] = None):
+        self.state = FakeWebUI(config or FakeConfig())
+        self.port = port or free_port()
+        self.url = f"http://127.0.0.1:{self.port}"
+        self._server = uvicorn.Server(
+            uvicorn.Config(create_app(self.state), host="127.0.0.1", port=self.port, log_level="error")
+        )
+        self._thread = threading.Thread(target=self._server.run, name="fake-webui", daemon=True)
+
+    def start(self) -> "FakeWebUIServer":
+        self._thread.start()
+        deadline = time.monotonic() + 10
+        while not self._server.started:
+            if time.monotonic() > deadline:
+                raise RuntimeError("Fake Open WebUI did not start")
+            time.sleep(0.01)
+        return self
+
+    def stop(self):
+        self._server.should_exit = True
+        self._thread.join(timeout=5)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a fake Open WebUI")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--upload-latency", type=float, default=0.0)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--knowledge-files", type=int, default=0, help="files in the `default` knowledge")
+    args = parser.parse_args()
+    state = FakeWebUI(
+        FakeConfig(
+            latency=args.latency, jitter=args.jitter, upload_latency=args.upload_latency, failure_rate=args.failure_rate
+        )
+    )
+    state.add_knowledge("default", "default", args.knowledge_files)
+    uvicorn.run(create_app(state), host="127.0.0.1", port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
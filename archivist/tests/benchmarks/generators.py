@@ -0,0 +1,75 @@
+"""Synthetic conversations for the benchmarks: memory files written by the pipeline and `outlet` bodies."""
+
+import os
+from pathlib import Path
+import random
+import time
+import uuid
+
+WORDS = ["archive", "memory", "knowledge", "conversation", "model", "pipeline", "vector", "embedding", "[1]", "[12]"]
+
+
+def chat_ids(count: int, seed: int = 42) -> list[str]:
+    rng = random.Random(seed)
+    return [str(uuid.UUID(int=rng.getrandbits(128), version=4)) for _ in range(count)]
+
+
+def make_messages(count: int, rng: random.Random, words: int = 80, sources: int = 0) -> list[dict]:
+    """`count` alternating user/assistant messages, with `sources` RAG source blocks in the assistant answers."""
+    messages = []
+    for i in range(count):
+        role = "user" if i % 2 == 0 else "assistant"
+        parts = []
+        if role == "assistant":
+            for s in range(sources):
+                body = " ".join(rng.choices(WORDS, k=50))
+                parts.append(f"<source><source_context>[source_id: {s}] {body}</source_context></source>\n")
+        parts.append(" ".join(rng.choices(WORDS, k=words)))
+        messages.append({"role": role, "content": "".join(parts)})
+    return messages
+
+
+def conversation_text(chat_id: str, model: str, user: str, messages: list[dict]) -> str:
+    """A conversation file as written by the pipeline."""
+    lines = [
+        "---\n",
+        f'conversation_id: "{chat_id}"\n',
+        'date: "2025-01-01 12:00"\n',
+        f'model: "{model}"\n',
+        f'user: "{user}"\n',
+        f"---\nConversation with {user} using model {model}\n\n",
+    ]
+    for msg in messages:
+        speaker = user if msg["role"] == "user" else msg["role"].capitalize()
+        lines.append(f"**{speaker}**: {msg['content']}\n\n")
+    return "".join(lines)
+
+
+def write_memory_files(
+    directory: Path,
+    ids: list[str],
+    models: list[str],
+    messages: int = 20,
+    extension: str = "md",
+    age: float = 0,
+    seed: int = 42,
+) -> list[Path]:
+    """Write one conversation file per chat id in `directory`, backdated by `age` seconds."""
+    rng = random.Random(seed)
+    directory.mkdir(parents=True, exist_ok=True)
+    mtime = time.time() - age
+    paths = []
+    for i, chat_id in enumerate(ids):
+        path = Path(directory, f"{chat_id}.{extension}")
+        path.write_text(
+            conversation_text(chat_id, models[i % len(models)], f"user{i % 7}", make_messages(messages, rng)),
+            encoding="utf-8",
+        )
+        if age:
+            os.utime(path, (mtime, mtime))
+        paths.append(path)
+    return paths
+
+
+def outlet_body(chat_id: str, messages: list[dict], model: str = "llama3") -> dict:
+    return {"chat_id": chat_id, "model": model, "messages": messages}
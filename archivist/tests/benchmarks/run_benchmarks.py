@@ -0,0 +1,255 @@
+"""
+Benchmarks of Archivist against a local fake Open WebUI (see `fake_webui.py`).
+
+Scenarios:
+- `notify`: `/notify` latency (p50/p99) and archive throughput, from the requests to the last archived file
+- `sweep`: `delete.sweep` duration versus archive size, with a share of chats deleted in Open WebUI
+- `outlet`: pipeline `outlet` latency versus conversation length, for the first write and the following appends
+
+Usage: `python tests/benchmarks/run_benchmarks.py [--scenarios notify sweep outlet] [--output results.json]`
+Results are printed as JSON (and written to `--output`) to be tracked over time.
+"""
+
+import argparse
+import asyncio
+from datetime import datetime
+import json
+import os
+from pathlib import Path
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+BENCH_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(BENCH_DIR))
+sys.path.insert(0, str(BENCH_DIR.parents[1] / "src"))
+sys.path.insert(0, str(BENCH_DIR.parents[2] / "Pipelines"))
+
+from fake_webui import FakeConfig, FakeWebUIServer  # noqa: E402
+from generators import chat_ids, make_messages, outlet_body, write_memory_files  # noqa: E402
+
+COLLECTIONS = {
+    "default": {"id": "k-default", "name": "default"},
+    "llama3": {"id": "k-llama", "name": "llama"},
+    "mistral": {"id": "k-mistral", "name": "mistral"},
+}
+MODELS = ["llama3", "mistral", "qwen"]
+
+
+def percentile(values: list[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def ms(seconds: float) -> float:
+    return round(seconds * 1000, 3)
+
+
+def configure(workdir: Path, webui_url: str, args):
+    """Point Archivist at the fake server and the work directory. Must run before importing Archivist modules."""
+    collections = Path(workdir, "model_collections.json")
+    collections.write_text(json.dumps(COLLECTIONS), encoding="utf-8")
+    os.environ.update(
+        {
+            "WEBUI_API": webui_url,
+            "WEBUI_TOKEN": "bench-token",
+            "MEMORY_DIR": str(Path(workdir, "memories")),
+            "COLLECTIONS_FILE": str(collections),
+            "USERS_API": str(Path(workdir, "user_api.json")),
+            "FILENAME_TEMPLATE": "conversation_{date}.md",
+            "LOG_LEVEL": "error",
+            "JOB_WORKERS": str(args.workers),
+            "JOB_QUEUE_SIZE": str(max(args.notify, 1000)),
+            "JOB_HISTORY_SIZE": str(max(args.notify, 1000)),
+            "SWEEP_RATE_LIMIT": "0",
+        }
+    )
+
+
+async def bench_notify(server: FakeWebUIServer, count: int, concurrency: int) -> dict:
+    import httpx
+
+    import add
+    from config import MEMORY_DIR
+    from http_client import close_client
+
+    ids = chat_ids(count, seed=1)
+    write_memory_files(Path(MEMORY_DIR), ids, MODELS)
+    for chat_id in ids:
+        server.state.add_chat(chat_id)
+    calls_before = dict(server.state.calls)
+    await add.archive_queue.start()
+    latencies = []
+    semaphore = asyncio.Semaphore(concurrency)
+    transport = httpx.ASGITransport(app=add.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://archivist") as client:
+
+        async def post(chat_id: str):
+            async with semaphore:
+                start = time.perf_counter()
+                await client.post(
+                    "/notify", json={"chat_id": chat_id, "user_id": "user-1", "username": "Lili", "model": "llama3"}
+                )
+                latencies.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(post(chat_id) for chat_id in ids))
+        accepted = time.perf_counter() - start
+        while True:
+            jobs = [add.archive_queue.get(chat_id) for chat_id in ids]
+            if all(job is None or job.state in ("done", "failed") for job in jobs):
+                break
+            await asyncio.sleep(0.01)
+        total = time.perf_counter() - start
+    await add.archive_queue.stop()
+    await close_client()
+    results: dict[str, int] = {}
+    for job in jobs:
+        if job:
+            results[job.result] = results.get(job.result, 0) + 1
+    return {
+        "requests": count,
+        "concurrency": concurrency,
+        "notify_p50_ms": ms(percentile(latencies, 50)),
+        "notify_p99_ms": ms(percentile(latencies, 99)),
+        "accepted_per_second": round(count / accepted, 1),
+        "archived_per_second": round(count / total, 1),
+        "total_seconds": round(total, 3),
+        "results": results,
+        "webui_calls": {k: v - calls_before.get(k, 0) for k, v in server.state.calls.items()},
+    }
+
+
+async def bench_sweep(server: FakeWebUIServer, sizes: list[int], deleted_ratio: float) -> list[dict]:
+    import delete
+    from config import ARCHIVE_DIR
+    from http_client import close_client
+
+    results = []
+    for size in sizes:
+        shutil.rmtree(ARCHIVE_DIR, ignore_errors=True)
+        server.state.chats.clear()
+        ids = chat_ids(size, seed=size)
+        files = write_memory_files(Path(ARCHIVE_DIR), ids, MODELS, messages=4)
+        rng = random.Random(size)
+        deleted = 0
+        for chat_id in ids:
+            if rng.random() < deleted_ratio:
+                deleted += 1
+            else:
+                server.state.add_chat(chat_id)
+        calls_before = dict(server.state.calls)
+        start = time.perf_counter()
+        # A fresh listing per size: the chats changed since the previous one
+        await delete.sweep(files, listing=delete.ChatListing())
+        elapsed = time.perf_counter() - start
+        results.append(
+            {
+                "archived_files": size,
+                "deleted_chats": deleted,
+                "seconds": round(elapsed, 3),
+                "files_per_second": round(size / elapsed, 1),
+                "webui_calls": {k: v - calls_before.get(k, 0) for k, v in server.state.calls.items()},
+            }
+        )
+    await close_client()
+    return results
+
+
+async def bench_outlet(workdir: Path, lengths: list[int], appends: int, sources: int) -> list[dict]:
+    from conversation_saver import CollectionLoader, OngoingConversationTracker, Pipeline
+
+    save_path = Path(workdir, "pipeline")
+    pipeline = Pipeline()
+    pipeline.valves.save_path = str(save_path)
+    pipeline.valves.archive_path = str(save_path / "archived")
+    pipeline.valves.notify_url = ""
+    pipeline.valves.models_collections_path = str(Path(workdir, "model_collections.json"))
+    pipeline.collection_loader = CollectionLoader(pipeline.valves.models_collections_path)
+    pipeline.ongoing_tracker = OngoingConversationTracker(save_path / "ongoing_conversations")
+    user = {"id": "user-1", "name": "Lili"}
+    rng = random.Random(7)
+    results = []
+    for length in lengths:
+        chat_id = f"outlet-{length}"
+        messages = make_messages(length + appends, rng, sources=sources)
+        start = time.perf_counter()
+        await pipeline.outlet(outlet_body(chat_id, messages[:length]), user)
+        first = time.perf_counter() - start
+        latencies = []
+        for i in range(1, appends + 1):
+            start = time.perf_counter()
+            await pipeline.outlet(outlet_body(chat_id, messages[: length + i]), user)
+            latencies.append(time.perf_counter() - start)
+        results.append(
+            {
+                "messages": length,
+                "first_write_ms": ms(first),
+                "append_p50_ms": ms(percentile(latencies, 50)),
+                "append_p99_ms": ms(percentile(latencies, 99)),
+            }
+        )
+    await pipeline.on_shutdown()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Archivist benchmarks against a fake Open WebUI")
+    parser.add_argument("--scenarios", nargs="+", default=["notify", "sweep", "outlet"])
+    parser.add_argument("--notify", type=int, default=500, help="conversations notified")
+    parser.add_argument("--notify-concurrency", type=int, default=50)
+    parser.add_argument("--workers", type=int, default=4, help="archive workers (JOB_WORKERS)")
+    parser.add_argument("--sweep-sizes", type=int, nargs="+", default=[100, 1000, 5000])
+    parser.add_argument("--deleted-ratio", type=float, default=0.05, help="share of archived chats deleted")
+    parser.add_argument("--outlet-lengths", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--outlet-appends", type=int, default=20)
+    parser.add_argument("--outlet-sources", type=int, default=2, help="RAG source blocks per answer")
+    parser.add_argument("--latency", type=float, default=0.005, help="fake Open WebUI latency (seconds)")
+    parser.add_argument("--jitter", type=float, default=0.005)
+    parser.add_argument("--upload-latency", type=float, default=0.02, help="extra latency of uploads and reindexing")
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--knowledge-files", type=int, default=5000, help="files already in each knowledge")
+    parser.add_argument("--output", type=Path, help="also write the results to this JSON file")
+    args = parser.parse_args()
+
+    config = FakeConfig(
+        latency=args.latency, jitter=args.jitter, upload_latency=args.upload_latency, failure_rate=args.failure_rate
+    )
+    server = FakeWebUIServer(config).start()
+    for collection in COLLECTIONS.values():
+        server.state.add_knowledge(collection["id"], collection["name"], args.knowledge_files)
+    report = {
+        "date": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "fake_webui": config.model_dump(),
+        "knowledge_files": args.knowledge_files,
+    }
+    with tempfile.TemporaryDirectory() as workdir:
+        configure(Path(workdir), server.url, args)
+        try:
+            if "notify" in args.scenarios:
+                report["notify"] = asyncio.run(bench_notify(server, args.notify, args.notify_concurrency))
+            if "sweep" in args.scenarios:
+                report["sweep"] = asyncio.run(bench_sweep(server, args.sweep_sizes, args.deleted_ratio))
+            if "outlet" in args.scenarios:
+                report["outlet"] = asyncio.run(
+                    bench_outlet(Path(workdir), args.outlet_lengths, args.outlet_appends, args.outlet_sources)
+                )
+        finally:
+            server.stop()
+            from logger import flush_logs
+
+            flush_logs()
+    text = json.dumps(report, indent=2)
+    if args.output:
+        args.output.write_text(text + "\n", encoding="utf-8")
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,23 +1,23 @@
 import os
 import sys
 import json
+import tempfile
 import unittest
 from pathlib import Path
 from fastapi.testclient import TestClient
 
 # Chemin vers le dossier root du projet
 PROJECT_ROOT = Path(__file__).resolve().parent.parent
-sys.path.insert(0, str(PROJECT_ROOT / "loop"))
+sys.path.insert(0, str(PROJECT_ROOT / "src"))
 
 # Injecte les ENV VARS pour que add.py les utilise
-test_memory_dir = PROJECT_ROOT / "tests" / "memories"
-test_memory_dir.mkdir(parents=True, exist_ok=True)
-os.environ["MEMORY_DIR"] = str(test_memory_dir)
+TEST_MEMORY = tempfile.TemporaryDirectory()  # database, logs and archives of the tests
+os.environ.setdefault("MEMORY_DIR", TEST_MEMORY.name)
 os.environ["COLLECTIONS_FILE"] = str(PROJECT_ROOT / "model_collections.json")
 os.environ["FILENAME_TEMPLATE"] = "conversation_{date}.md"
 os.environ["USERS_API"] = str(PROJECT_ROOT / "user_api.json")
 
-from src.add import app  # noqa: E402
+from add import app, archive_queue, get_memory_path  # noqa: E402
 
 client = TestClient(app)
 
@@ -36,7 +36,8 @@ class TestArchivistAPI(unittest.TestCase):
         cls.chat_id = "47b87066-9adf-4cbf-9283-44c79dbc6e81"
         cls.user_id = "f4147eae-bfa5-408b-b67a-9ce0d498046e"
         cls.model = "default"
-        cls.filepath = test_memory_dir / f"{cls.chat_id}.md"
+        cls.filepath = get_memory_path(cls.chat_id)
+        cls.filepath.parent.mkdir(parents=True, exist_ok=True)
         if not cls.filepath.exists():
             cls.filepath.write_text(
                 "# Conversation ID: {}\n---\n**User**: Hello!\n**Assistant**: Hi!\n".format(cls.chat_id),
@@ -55,8 +56,32 @@ class TestArchivistAPI(unittest.TestCase):
         response = client.post(
             "/notify", json={"chat_id": self.chat_id, "user_id": self.user_id, "username": "Lili", "model": self.model}
         )
-        self.assertEqual(response.status_code, 200)
-        self.assertIn(response.json()["status"], ["archived", "upload failed", "failed to add", "no title"])
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.json()["status"], "queued")
+
+    def test_notify_deduplicates_queued_chat(self):
+        chat_id = "0f3c1d2e-5b6a-4c7d-8e9f-a0b1c2d3e4f5"
+        filepath = get_memory_path(chat_id)
+        filepath.parent.mkdir(parents=True, exist_ok=True)
+        filepath.write_text("---\nmodel: \"default\"\n---\n**User**: Hello!\n", encoding="utf-8")
+        try:
+            payload = {"chat_id": chat_id, "user_id": self.user_id, "username": "Lili", "model": self.model}
+            queued = archive_queue.queue.qsize()
+            first = client.post("/notify", json=payload)
+            second = client.post("/notify", json=payload)
+            self.assertEqual(first.status_code, 202)
+            self.assertEqual(second.status_code, 202)
+            self.assertEqual(archive_queue.queue.qsize(), queued + 1)
+
+            job = client.get(f"/jobs/{chat_id}")
+            self.assertEqual(job.status_code, 200)
+            self.assertEqual(job.json()["state"], "queued")
+        finally:
+            filepath.unlink()
+
+    def test_unknown_job(self):
+        response = client.get("/jobs/unknown-chat-id")
+        self.assertEqual(response.status_code, 404)
 
     @classmethod
     def tearDownClass(cls):
@@ -0,0 +1,86 @@
+import asyncio
+import os
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import AsyncMock, MagicMock, patch
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PROJECT_ROOT / "src"))
+TEST_MEMORY = tempfile.TemporaryDirectory()  # database, logs and archives of the tests
+os.environ.setdefault("MEMORY_DIR", TEST_MEMORY.name)
+
+import add  # noqa: E402
+from archive_store import ArchiveStore  # noqa: E402
+from file_utils import ModelCollection  # noqa: E402
+
+COLLECTION = ModelCollection(id="k1", name="Knowledge")
+
+
+class TestArchiveFile(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dir = Path(self.tmp.name)
+        (self.dir / "archived").mkdir()
+        self.store = ArchiveStore(self.dir / "archivist.db")
+        self.api = {
+            "get_existing_file": AsyncMock(return_value=None),
+            "update_knowledge_file": AsyncMock(return_value=True),
+            "upload_file": AsyncMock(return_value="new-file"),
+            "batch_add": AsyncMock(side_effect=lambda file_id, knowledge_id, filename: file_id),
+        }
+        patches = [patch(f"add.{name}", mock) for name, mock in self.api.items()]
+        patches += [
+            patch("add.archive_store", self.store),
+            patch("add.archive_index", MagicMock()),
+            patch("add.get_archive_path", lambda fname, knowledge_name: self.dir / "archived" / fname),
+        ]
+        for p in patches:
+            p.start()
+            self.addCleanup(p.stop)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def archive(self, content: str) -> str:
+        path = self.dir / "chat-a.md"
+        path.write_text(content, encoding="utf-8")
+        return asyncio.run(add.archive_file(path, "chat-a", COLLECTION, "[chat-a] conversation.md"))
+
+    def test_new_conversation_is_uploaded(self):
+        self.assertEqual(self.archive("hello"), "archived")
+        self.api["upload_file"].assert_awaited_once()
+        record = self.store.get("chat-a")
+        self.assertEqual(record.file_id, "new-file")
+        self.assertTrue(record.content_hash)
+        self.assertTrue((self.dir / "archived" / "chat-a.md").exists())
+
+    def test_unchanged_conversation_is_not_sent_again(self):
+        self.archive("hello")
+        self.api["upload_file"].reset_mock()
+        self.assertEqual(self.archive("hello"), "unchanged")
+        self.api["upload_file"].assert_not_awaited()
+        self.api["get_existing_file"].assert_awaited_once()
+        self.api["update_knowledge_file"].assert_not_awaited()
+
+    def test_existing_file_is_updated_without_upload(self):
+        self.archive("hello")
+        self.api["upload_file"].reset_mock()
+        self.api["get_existing_file"].return_value = {"id": "new-file"}
+        self.assertEqual(self.archive("hello again"), "archived")
+        self.api["upload_file"].assert_not_awaited()
+        self.api["update_knowledge_file"].assert_awaited_once()
+        # Looked up by the file id recorded at the first archive
+        self.assertEqual(self.api["get_existing_file"].await_args.args[2], "new-file")
+
+    def test_failed_update_falls_back_to_upload(self):
+        self.api["get_existing_file"].return_value = {"id": "old-file"}
+        self.api["update_knowledge_file"].return_value = False
+        self.assertEqual(self.archive("hello"), "archived")
+        self.api["upload_file"].assert_awaited_once()
+        self.assertEqual(self.store.get("chat-a").file_id, "new-file")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,59 @@
+import os
+import sys
+import tempfile
+import time
+import unittest
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PROJECT_ROOT / "src"))
+TEST_MEMORY = tempfile.TemporaryDirectory()  # database, logs and archives of the tests
+os.environ.setdefault("MEMORY_DIR", TEST_MEMORY.name)
+
+from archive_index import ArchiveIndex  # noqa: E402
+
+
+class TestArchiveIndex(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = Path(self.tmp.name)
+        self.index = ArchiveIndex(self.root, min_interval=10, max_interval=1000, age_ratio=0.1)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_interval_grows_with_age(self):
+        now = time.time()
+        self.assertEqual(self.index.interval(now, now), 10)
+        self.assertEqual(self.index.interval(now - 2000, now), 200)
+        self.assertEqual(self.index.interval(now - 10**6, now), 1000)
+
+    def test_new_archive_is_due_after_min_interval(self):
+        path = self.root / "chat-a.md"
+        self.index.add(path, time.time())
+        self.assertEqual(self.index.due(), [])
+        self.assertEqual(self.index.due(time.time() + 11), [path])
+        # Popped until rescheduled
+        self.assertEqual(self.index.due(time.time() + 11), [])
+        self.index.reschedule([path])
+        self.assertEqual(self.index.due(time.time() + 11), [path])
+
+    def test_discarded_entries_are_never_due(self):
+        self.index.add(self.root / "chat-a.md", time.time())
+        self.index.discard("chat-a")
+        self.assertEqual(self.index.due(time.time() + 100), [])
+
+    def test_scan_reconciles_with_disk(self):
+        (self.root / "knowledge").mkdir()
+        (self.root / "knowledge" / "chat-a.md").write_text("a", encoding="utf-8")
+        (self.root / "chat-b.md").write_text("b", encoding="utf-8")
+        self.index.add(self.root / "gone.md", time.time())
+        self.assertEqual(self.index.scan(), 2)
+        self.assertIn("chat-a", self.index)
+        self.assertIn("chat-b", self.index)
+        self.assertNotIn("gone", self.index)
+        self.assertEqual(len(self.index.due(time.time() + 11)), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,82 @@
+import json
+import os
+import sys
+import tempfile
+import threading
+import unittest
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PROJECT_ROOT / "src"))
+TEST_MEMORY = tempfile.TemporaryDirectory()  # database, logs and archives of the tests
+os.environ.setdefault("MEMORY_DIR", TEST_MEMORY.name)
+
+from archive_store import ArchivedChat, ArchiveStore  # noqa: E402
+
+
+class TestArchiveStore(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.store = ArchiveStore(Path(self.tmp.name, "archivist.db"))
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_upsert_keeps_first_archive_date(self):
+        self.store.upsert(ArchivedChat(chat_id="chat-a", knowledge_id="k1", user_id="u1", archived_at="2025-01-01"))
+        self.store.upsert(ArchivedChat(chat_id="chat-a", file_id="file-1"))
+        record = self.store.get("chat-a")
+        self.assertEqual(record.knowledge_id, "k1")
+        self.assertEqual(record.file_id, "file-1")
+        self.assertEqual(record.archived_at, "2025-01-01")
+        self.assertEqual(self.store.count(), 1)
+
+    def test_lookup_by_knowledge_and_user(self):
+        self.store.upsert(ArchivedChat(chat_id="chat-a", knowledge_id="k1", user_id="u1"))
+        self.store.upsert(ArchivedChat(chat_id="chat-b", knowledge_id="k2", user_id="u1"))
+        self.assertEqual([r.chat_id for r in self.store.by_knowledge("k1")], ["chat-a"])
+        self.assertEqual(sorted(r.chat_id for r in self.store.by_user("u1")), ["chat-a", "chat-b"])
+        self.store.delete("chat-a")
+        self.assertIsNone(self.store.get("chat-a"))
+
+    def test_migrate_from_json(self):
+        legacy = Path(self.tmp.name, "archived_ids.json")
+        legacy.write_text(
+            json.dumps(
+                {
+                    "chat-a": "knowledge-1",
+                    "chat-b": {"user_id": "u1", "username": "Lili", "model": "llama3", "archived_at": "2025-04-02"},
+                }
+            ),
+            encoding="utf-8",
+        )
+        self.assertEqual(self.store.migrate_from_json(legacy), 2)
+        self.assertFalse(legacy.exists())
+        self.assertTrue(legacy.with_name("archived_ids.json.migrated").exists())
+        self.assertEqual(self.store.get("chat-a").knowledge_id, "knowledge-1")
+        self.assertEqual(self.store.get("chat-b").username, "Lili")
+        self.assertEqual(self.store.migrate_from_json(legacy), 0)
+
+    def test_migrate_from_json_in_several_workers(self):
+        legacy = Path(self.tmp.name, "archived_ids.json")
+        legacy.write_text(json.dumps({f"chat-{i}": "knowledge-1" for i in range(50)}), encoding="utf-8")
+        stores = [ArchiveStore(self.store.path) for _ in range(4)]
+        barrier = threading.Barrier(len(stores))
+        migrated = []
+
+        def migrate(store):
+            barrier.wait()
+            migrated.append(store.migrate_from_json(legacy))
+
+        threads = [threading.Thread(target=migrate, args=(store,)) for store in stores]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(sorted(migrated), [0, 0, 0, 50])
+        self.assertEqual(self.store.count(), 50)
+        self.assertTrue(legacy.with_name("archived_ids.json.migrated").exists())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,120 @@
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+import unittest
+from pathlib import Path
+from unittest.mock import AsyncMock, patch
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PROJECT_ROOT / "src"))
+TEST_MEMORY = tempfile.TemporaryDirectory()  # database, logs and archives of the tests
+os.environ.setdefault("MEMORY_DIR", TEST_MEMORY.name)
+os.environ.setdefault("FILENAME_TEMPLATE", "conversation_{date}.md")
+
+import backfill  # noqa: E402
+from archive_store import ArchiveStore  # noqa: E402
+from collection_registry import CollectionRegistry  # noqa: E402
+from leases import LeaseStore  # noqa: E402
+from token_router import TokenRouter  # noqa: E402
+
+COLLECTIONS = {
+    "llama3": {"id": "k-llama", "name": "Llama"},
+    "secret": {"id": "0", "name": "excluded"},
+    "default": {"id": "k-default", "name": "Default"},
+}
+
+
+class TestBackfill(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dir = Path(self.tmp.name)
+        old = time.time() - 7200
+        for chat_id, model in (("a", "llama3"), ("b", "llama3"), ("c", "mistral"), ("d", "secret"), ("e", "llama3")):
+            path = self.dir / f"{chat_id}.md"
+            path.write_text(f'---\nmodel: "{model}"\nuser: "Lili"\n---\n', encoding="utf-8")
+            os.utime(path, (old, old))
+        # Ongoing conversation, and files that are not conversations
+        (self.dir / "recent.md").write_text('---\nmodel: "llama3"\n---\n', encoding="utf-8")
+        (self.dir / "notes.json").write_text("{}", encoding="utf-8")
+        (self.dir / "archived").mkdir()
+        collections = Path(self.tmp.name, "collections", "model_collections.json")
+        collections.parent.mkdir()
+        collections.write_text(json.dumps(COLLECTIONS), encoding="utf-8")
+        self.registry = CollectionRegistry(collections)
+        self.leases = LeaseStore(ArchiveStore(self.dir / "archivist.db"), owner="backfill")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def run_backfill(self, archive_file: AsyncMock, listed=("a", "b", "c", "d", "e"), chats=None, **kwargs) -> dict:
+        router = TokenRouter(self.dir / "user_api.json")
+
+        async def get_chat_info(chat_id, user_id=None):
+            if chats is None:
+                # Open WebUI failing
+                return None
+            if chat_id not in chats:
+                router.mark_missing(chat_id)
+            return chats.get(chat_id)
+
+        with (
+            patch("backfill.list_all_chat_ids", AsyncMock(return_value=(set(listed), True))),
+            patch("backfill.get_chat_info", get_chat_info),
+            patch("backfill.token_router", router),
+            patch("backfill.collection_registry", self.registry),
+            patch("backfill.already_archived", side_effect=lambda path: path.stem == "e"),
+            patch("backfill.is_webui_reachable", AsyncMock(return_value=True)),
+            patch("backfill.archive_file", archive_file),
+            patch("backfill.leases", self.leases),
+        ):
+            return asyncio.run(backfill.backfill(self.dir, min_age=3600, **kwargs))
+
+    def test_groups_by_collection(self):
+        archive_file = AsyncMock(return_value="archived")
+        results = self.run_backfill(archive_file, batch_size=1)
+        archived = {call.args[1]: call.args[2].id for call in archive_file.await_args_list}
+        self.assertEqual(archived, {"a": "k-llama", "b": "k-llama", "c": "k-default"})
+        self.assertEqual(results, {"archived": 3, "excluded": 1, "already archived": 1})
+
+    def test_dry_run(self):
+        archive_file = AsyncMock(return_value="archived")
+        results = self.run_backfill(archive_file, dry_run=True)
+        archive_file.assert_not_awaited()
+        self.assertEqual(results, {"excluded": 1, "already archived": 1})
+
+    def test_failures_are_counted(self):
+        archive_file = AsyncMock(side_effect=["archived", "upload failed", RuntimeError("boom")])
+        results = self.run_backfill(archive_file, concurrency=1)
+        self.assertEqual(results["archived"], 1)
+        self.assertEqual(results["upload failed"], 1)
+        self.assertEqual(results["error"], 1)
+
+    def test_chat_archived_elsewhere_is_skipped(self):
+        # Being archived by the API
+        LeaseStore(self.leases.store, owner="api").acquire("archive:a", 600)
+        archive_file = AsyncMock(return_value="archived")
+        results = self.run_backfill(archive_file)
+        self.assertEqual({call.args[1] for call in archive_file.await_args_list}, {"b", "c"})
+        self.assertEqual(results["locked"], 1)
+        self.assertIsNone(self.leases.get("archive:b"))
+
+    def test_deleted_chats_are_skipped(self):
+        archive_file = AsyncMock(return_value="archived")
+        # b deleted in Open WebUI, c missing from the listing but still there
+        results = self.run_backfill(archive_file, listed=("a",), chats={"c": {"id": "c", "title": "Hello"}})
+        self.assertEqual({call.args[1] for call in archive_file.await_args_list}, {"a", "c"})
+        self.assertEqual(results["deleted"], 1)
+        self.assertTrue(Path(self.dir, "b.md").exists())
+
+    def test_failed_lookup_is_not_a_deletion(self):
+        archive_file = AsyncMock(return_value="archived")
+        results = self.run_backfill(archive_file, listed=("a", "b"))
+        self.assertEqual(results["no title"], 1)
+        self.assertNotIn("deleted", results)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,147 @@
+import asyncio
+import os
+import sys
+import tempfile
+import time
+import unittest
+from pathlib import Path
+from unittest.mock import AsyncMock, patch
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PROJECT_ROOT / "src"))
+TEST_MEMORY = tempfile.TemporaryDirectory()  # database, logs and archives of the tests
+os.environ.setdefault("MEMORY_DIR", TEST_MEMORY.name)
+
+import delete  # noqa: E402
+from archive_index import ArchiveIndex  # noqa: E402
+from archive_store import ArchiveStore  # noqa: E402
+from cold_storage import ColdStorage, zstandard  # noqa: E402
+
+OLD = time.time() - 90 * 86400
+
+
+class TestColdStorage(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dir = Path(self.tmp.name)
+        self.store = ArchiveStore(self.dir / "archivist.db")
+        self.archive = self.dir / "archived"
+        self.archive.mkdir()
+        self.contents = {}
+        for i in range(5):
+            path = self.archive / f"chat-{i}.md"
+            self.contents[path.stem] = f'---\nmodel: "llama3"\nuser: "Lili {i}"\n---\n' + "**Lili**: hello\n" * 2000 * i
+            path.write_text(self.contents[path.stem], encoding="utf-8")
+            os.utime(path, (OLD, OLD))
+        self.recent = self.archive / "recent.md"
+        self.recent.write_text('---\nmodel: "llama3"\n---\n', encoding="utf-8")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def cold(self, compression: str = "gzip", segment_size: int = 64 * 1024 * 1024) -> ColdStorage:
+        return ColdStorage(self.dir / "cold", self.store, compression, segment_size)
+
+    def paths(self) -> list[Path]:
+        return sorted(self.archive.glob("*.md"))
+
+    def test_pack_and_restore(self):
+        codecs = ["gzip", "zstd"] if zstandard else ["gzip"]
+        for compression in codecs:
+            with self.subTest(compression=compression):
+                cold = self.cold(compression)
+                self.assertEqual(cold.pack(self.paths(), older_than=30 * 86400), 5)
+                self.assertEqual(self.paths(), [self.recent])
+                stats = cold.stats()
+                self.assertEqual(stats["files"], 5)
+                self.assertLess(stats["segment_bytes"] * 10, stats["original_bytes"])
+                self.assertEqual(cold.info("chat-3"), ("llama3", "Lili 3"))
+                self.assertIn("chat-3", cold)
+
+                for chat_id, content in self.contents.items():
+                    restored = cold.restore(chat_id)
+                    self.assertEqual(restored, self.archive / f"{chat_id}.md")
+                    self.assertEqual(restored.read_text(encoding="utf-8"), content)
+                    self.assertAlmostEqual(restored.stat().st_mtime, OLD, places=0)
+                self.assertIsNone(cold.restore("chat-3"))
+                self.assertEqual(cold.stats()["files"], 0)
+                # Segments of restored files are removed
+                self.assertEqual(cold.compact(), 1)
+                self.assertEqual(cold.stats()["segments"], 0)
+
+    def test_segments_and_compaction(self):
+        cold = self.cold(segment_size=1)
+        cold.pack(self.paths(), older_than=30 * 86400)
+        self.assertEqual(cold.stats()["segments"], 5)
+        for chat_id in ("chat-0", "chat-1", "chat-2"):
+            cold.delete(chat_id)
+        self.assertEqual(cold.compact(min_live_ratio=1.1), 5)
+        self.assertEqual(cold.stats()["segments"], 1)
+        for chat_id in ("chat-3", "chat-4"):
+            self.assertEqual(cold.restore(chat_id).read_text(encoding="utf-8"), self.contents[chat_id])
+
+    def test_compaction_keeps_deleted_files_out(self):
+        cold = self.cold(segment_size=1)
+        cold.pack(self.paths(), older_than=30 * 86400)
+        cold.delete("chat-0")
+        read_raw = cold._read_raw
+
+        def archived_again(entry):
+            # chat-3 is archived again while its segment is being copied
+            if entry.chat_id == "chat-3":
+                cold.delete("chat-3")
+            return read_raw(entry)
+
+        with patch.object(cold, "_read_raw", archived_again):
+            cold.compact(min_live_ratio=1.1)
+        self.assertNotIn("chat-3", cold)
+        self.assertEqual(cold.stats()["files"], 3)
+        self.assertEqual(cold.restore("chat-4").read_text(encoding="utf-8"), self.contents["chat-4"])
+
+    def test_replaced_file_stays_hot(self):
+        cold = self.cold()
+        path = self.archive / "chat-1.md"
+        real_stat = Path.stat
+
+        def archived_again(self, *args, **kwargs):
+            # The conversation is archived again right after being compressed
+            if self == path and cold.get("chat-1"):
+                self.write_text("archived again", encoding="utf-8")
+            return real_stat(self, *args, **kwargs)
+
+        with patch.object(Path, "stat", archived_again):
+            self.assertEqual(cold.pack(self.paths(), older_than=30 * 86400), 4)
+        self.assertEqual(path.read_text(encoding="utf-8"), "archived again")
+        self.assertNotIn("chat-1", cold)
+
+    def test_index_and_sweep(self):
+        listed = {"chat-0", "chat-1", "chat-3", "chat-4", "recent"}
+        cold = self.cold()
+        cold.pack(self.paths(), older_than=30 * 86400)
+        index = ArchiveIndex(self.archive, cold=cold)
+        self.assertEqual(index.scan(), 6)
+        self.assertEqual(index.get("chat-2").path, self.archive / "chat-2.md")
+
+        delete_file = AsyncMock(return_value=True)
+        with (
+            patch("delete.cold_storage", cold),
+            patch("delete.archive_index", index),
+            patch("delete.archive_store", self.store),
+            patch("delete.list_all_chat_ids", AsyncMock(return_value=(listed, True))),
+            patch("delete.get_chat_info", AsyncMock(return_value=None)),
+            patch("delete.get_existing_file", AsyncMock(return_value={"id": "file-2"})),
+            patch("delete.generate_filename", wraps=delete.generate_filename) as generate_filename,
+            patch("delete.delete_file", delete_file),
+            patch("delete.batch_remove", AsyncMock(return_value=True)),
+            patch("delete.extract_from_file", side_effect=AssertionError("cold file read")),
+        ):
+            asyncio.run(delete.sweep(index.paths()))
+        self.assertEqual(generate_filename.call_args.args[1:3], ("llama3", "Lili 2"))
+        delete_file.assert_awaited_once_with("file-2")
+        self.assertNotIn("chat-2", cold)
+        self.assertNotIn("chat-2", index)
+        self.assertIn("chat-3", index)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,89 @@
+import json
+import os
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PROJECT_ROOT / "src"))
+TEST_MEMORY = tempfile.TemporaryDirectory()  # database, logs and archives of the tests
+os.environ.setdefault("MEMORY_DIR", TEST_MEMORY.name)
+
+from collection_registry import CollectionRegistry  # noqa: E402
+from file_utils import ModelCollection  # noqa: E402
+
+COLLECTIONS = {
+    "llama3:latest": {"id": "k-llama", "name": "Llama"},
+    "llama3:70b": {"id": "k-llama-big", "name": "Llama big"},
+    "mistral*": {"id": "k-mistral", "name": "Mistral"},
+    "*:private": {"id": "0", "name": "excluded"},
+    "broken": {"id": "k-broken"},
+    "default": {"id": "k-default", "name": "Default"},
+}
+
+LLAMA = ModelCollection("k-llama", "Llama")
+DEFAULT = ModelCollection("k-default", "Default")
+
+
+class TestCollectionRegistry(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = Path(self.tmp.name, "model_collections.json")
+        self.write(COLLECTIONS)
+        self.registry = CollectionRegistry(self.path, check_interval=3600)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def write(self, data, mtime: float = 0):
+        self.path.write_text(data if isinstance(data, str) else json.dumps(data), encoding="utf-8")
+        if mtime:
+            os.utime(self.path, (mtime, mtime))
+
+    def test_resolve(self):
+        cases = {
+            "llama3:latest": LLAMA,
+            "llama3": LLAMA,
+            "llama3:8b": LLAMA,
+            "llama3:70b": ModelCollection("k-llama-big", "Llama big"),
+            "mistral-nemo:12b": ModelCollection("k-mistral", "Mistral"),
+            "qwen:private": ModelCollection("0", "excluded"),
+            "broken": DEFAULT,
+            "qwen": DEFAULT,
+            "": DEFAULT,
+        }
+        for model, expected in cases.items():
+            with self.subTest(model=model):
+                self.assertEqual(self.registry.resolve(model), expected)
+        self.assertNotIn("broken", self.registry.collections())
+
+    def test_reload_on_change_only(self):
+        self.assertEqual(self.registry.resolve("qwen"), DEFAULT)
+        self.write({"qwen": {"id": "k-qwen", "name": "Qwen"}}, mtime=1_000_000)
+        with patch.object(Path, "stat", wraps=self.path.stat) as stat:
+            # Not checked again before the interval
+            self.assertEqual(self.registry.resolve("qwen"), DEFAULT)
+            self.assertEqual(stat.call_count, 0)
+        self.registry.changed()
+        self.assertEqual(self.registry.resolve("qwen"), ModelCollection("k-qwen", "Qwen"))
+        self.assertIsNone(self.registry.resolve("llama3"))
+        self.assertFalse(self.registry.reload())
+
+    def test_invalid_file_keeps_mapping(self):
+        self.write("{not json", mtime=1_000_000)
+        self.assertFalse(self.registry.reload())
+        self.assertEqual(self.registry.resolve("llama3"), LLAMA)
+        self.write(["not", "a", "mapping"], mtime=2_000_000)
+        self.assertFalse(self.registry.reload())
+        self.assertEqual(self.registry.resolve("llama3"), LLAMA)
+
+    def test_missing_file(self):
+        registry = CollectionRegistry(Path(self.tmp.name, "missing.json"))
+        self.assertIsNone(registry.resolve("llama3"))
+        self.assertEqual(registry.collections(), {})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,215 @@
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import AsyncMock, patch
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PROJECT_ROOT.parent / "Pipelines"))
+sys.path.insert(0, str(PROJECT_ROOT / "src"))
+TEST_MEMORY = tempfile.TemporaryDirectory()  # database, logs and archives of the tests
+os.environ.setdefault("MEMORY_DIR", TEST_MEMORY.name)
+
+from collection_registry import CollectionRegistry  # noqa: E402
+from conversation_saver import (  # noqa: E402
+    CollectionLoader,
+    ContentCleaner,
+    DEFAULT_CLEAN_RULES,
+    OngoingConversationTracker,
+    Pipeline,
+    conversation_path,
+)
+
+USER = {"id": "user-1", "name": "Lili"}
+
+COLLECTIONS = {
+    "llama3:latest": {"id": "k-llama", "name": "Llama"},
+    "qwen": {"id": "k-qwen", "name": "Qwen"},
+    "mistral*": {"id": "0", "name": "excluded"},
+    "default": {"id": "k-default", "name": "Default"},
+}
+
+# (message, cleaned message)
+CLEAN_CORPUS = [
+    ("Hello!", "Hello!"),
+    ("  padded  \n", "padded"),
+    ("Paris is the capital [1].", "Paris is the capital ."),
+    ("Sources [1][2] and [10]", "Sources  and"),
+    ("<source>doc</source>Answer", "Answer"),
+    ("<source_context>multi\nline\ncontext</source_context>\nAnswer", "Answer"),
+    ("<source><source_context>a</source_context></source> kept", "kept"),
+    ("<source>a<source>b</source>c</source> kept", "kept"),
+    ("<source>a<source>b<source>c</source></source></source>", ""),
+    ("Before <source>a</source> middle <source>b</source> after", "Before  middle  after"),
+    ("[source_id: 1] text kept [2]", "text kept"),
+    ("[source_id: 1] first line\nsecond line]", "first line\nsecond line]"),
+    ("Array [a] and [1a] stay", "Array [a] and [1a] stay"),
+    ("<source>unclosed", "<source>unclosed"),
+    ("<source>only</source>", ""),
+]
+
+
+class TestCleanContent(unittest.TestCase):
+    def test_corpus(self):
+        cleaner = ContentCleaner(DEFAULT_CLEAN_RULES)
+        for text, expected in CLEAN_CORPUS:
+            with self.subTest(text=text):
+                self.assertEqual(cleaner.clean(text), expected)
+
+    def test_custom_rules_from_valves(self):
+        pipeline = Pipeline()
+        self.assertEqual(pipeline.clean_content("a [1] <b>x</b>"), "a  <b>x</b>")
+        pipeline.valves.clean_rules = [r"<b>.*?</b>"]
+        self.assertEqual(pipeline.clean_content("a [1] <b>x</b>"), "a [1]")
+        # No implicit DOTALL for the rules of the valves
+        self.assertEqual(pipeline.clean_content("<b>x\ny</b>"), "<b>x\ny</b>")
+        pipeline.valves.clean_rules = [r"(?s:<b>.*?</b>)"]
+        self.assertEqual(pipeline.clean_content("<b>x\ny</b>"), "")
+        pipeline.valves.clean_rules = []
+        self.assertEqual(pipeline.clean_content(" a [1] "), "a [1]")
+        pipeline.valves.clean_rules = ["[unclosed"]
+        self.assertEqual(pipeline.clean_content("a [1]"), "a")
+
+
+class TestCollectionLoader(unittest.TestCase):
+    def test_resolves_like_archivist(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp, "model_collections.json")
+            path.write_text(json.dumps(COLLECTIONS), encoding="utf-8")
+            loader, registry = CollectionLoader(str(path)), CollectionRegistry(path)
+            loader.load()
+            for model in ("llama3", "llama3:latest", "llama3:8b", "qwen:7b", "mistral-large", "gpt-4o", ""):
+                with self.subTest(model=model):
+                    self.assertEqual(loader.resolve(model), registry.resolve(model))
+        self.assertEqual(loader.resolve("llama3:8b").id, "k-llama")
+        self.assertIsNone(loader.match("gpt-4o"))
+        self.assertEqual(loader.resolve("gpt-4o").id, "k-default")
+
+
+class TestConversationSaver(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.pipeline = Pipeline()
+        self.pipeline.valves.save_path = self.tmp.name
+        self.pipeline.valves.archive_path = str(Path(self.tmp.name, "archived"))
+        self.pipeline.valves.models_collections_path = str(Path(self.tmp.name, "missing.json"))
+        self.pipeline.valves.notify_url = ""
+        self.pipeline.ongoing_tracker = OngoingConversationTracker(Path(self.tmp.name, "ongoing_conversations"))
+        self.file = Path(self.tmp.name, "chat-1.md")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def outlet(self, messages):
+        body = {"chat_id": "chat-1", "model": "llama3", "messages": messages}
+        asyncio.run(self.pipeline.outlet(body, USER))
+        return self.file.read_text(encoding="utf-8")
+
+    def test_appends_only_new_messages(self):
+        messages = [{"role": "user", "content": "Hello [1]"}, {"role": "assistant", "content": "Hi!"}]
+        self.outlet(messages)
+        messages += [{"role": "user", "content": "How are you?"}, {"role": "assistant", "content": "Fine."}]
+        with patch.object(Pipeline, "clean_content", wraps=self.pipeline.clean_content) as clean:
+            content = self.outlet(messages)
+        self.assertEqual(clean.call_count, 2)
+        self.assertEqual(content.count("---\n"), 2)
+        self.assertTrue(
+            content.endswith("**Lili**: Hello\n\n**Assistant**: Hi!\n\n**Lili**: How are you?\n\n**Assistant**: Fine.\n\n")
+        )
+
+    def test_rewrites_when_previous_message_edited(self):
+        messages = [{"role": "user", "content": "Hello"}, {"role": "assistant", "content": "Hi!"}]
+        self.outlet(messages)
+        messages = [{"role": "user", "content": "Hello"}, {"role": "assistant", "content": "Hello there!"}]
+        content = self.outlet(messages + [{"role": "user", "content": "Thanks"}])
+        self.assertNotIn("Hi!", content)
+        self.assertTrue(content.endswith("**Assistant**: Hello there!\n\n**Lili**: Thanks\n\n"))
+
+    def test_rewrites_when_file_changed(self):
+        messages = [{"role": "user", "content": "Hello"}]
+        self.outlet(messages)
+        self.file.unlink()
+        content = self.outlet(messages + [{"role": "assistant", "content": "Hi!"}])
+        self.assertTrue(content.startswith("---\n"))
+        self.assertIn("**Lili**: Hello\n\n**Assistant**: Hi!\n\n", content)
+
+    def test_full_rewrite_without_append_only(self):
+        self.pipeline.valves.append_only = False
+        messages = [{"role": "user", "content": "Hello"}]
+        self.outlet(messages)
+        with patch.object(Pipeline, "clean_content", wraps=self.pipeline.clean_content) as clean:
+            self.outlet(messages + [{"role": "assistant", "content": "Hi!"}])
+        self.assertEqual(clean.call_count, 2)
+
+    def test_persisted_conversations_are_bounded(self):
+        messages = [{"role": "user", "content": "Hello"}]
+        self.outlet(messages)
+        self.assertIn("chat-1", self.pipeline.persisted)
+        # Switching to another chat forgets the one left
+        asyncio.run(self.pipeline.outlet({"chat_id": "chat-2", "model": "llama3", "messages": messages}, USER))
+        self.assertEqual(list(self.pipeline.persisted), ["chat-2"])
+        persisted = self.pipeline.persisted["chat-2"]
+        with patch("conversation_saver.MAX_PERSISTED", 2):
+            for chat_id in ("chat-3", "chat-4", "chat-2"):
+                self.pipeline.set_persisted(chat_id, persisted)
+        self.assertEqual(list(self.pipeline.persisted), ["chat-4", "chat-2"])
+
+    def test_models_resolved_by_alias_and_pattern(self):
+        path = Path(self.tmp.name, "model_collections.json")
+        path.write_text(json.dumps(COLLECTIONS), encoding="utf-8")
+        self.pipeline.collection_loader = CollectionLoader(str(path))
+        self.pipeline.valves.ignore_models_not_listed = True
+        messages = [{"role": "user", "content": "Hello"}]
+        for chat_id, model in (("chat-1", "llama3:8b"), ("chat-2", "mistral-large"), ("chat-3", "gpt-4o")):
+            asyncio.run(self.pipeline.outlet({"chat_id": chat_id, "model": model, "messages": messages}, USER))
+        # Excluded by the `mistral*` pattern, not listed
+        self.assertEqual(sorted(path.stem for path in Path(self.tmp.name).glob("chat-*.md")), ["chat-1"])
+        self.pipeline.valves.archive_per_knowledge = True
+        archived = Path(self.tmp.name, "archived", "Llama", "chat-1.md")
+        archived.parent.mkdir(parents=True)
+        archived.touch()
+        self.pipeline.delete_archived("chat-1", "llama3:8b")
+        self.assertFalse(archived.exists())
+
+    def test_sharded_layout(self):
+        self.pipeline.valves.shard_levels = 2
+        self.file = conversation_path(self.tmp.name, "chat-1", "md", 2)
+        archived = conversation_path(Path(self.tmp.name, "archived"), "chat-1", "md", 2)
+        archived.parent.mkdir(parents=True)
+        archived.write_text("archived", encoding="utf-8")
+        content = self.outlet([{"role": "user", "content": "Hello"}])
+        self.assertIn("**Lili**: Hello", content)
+        self.assertEqual(len(self.file.relative_to(self.tmp.name).parts), 3)
+        self.assertFalse(archived.exists())
+
+
+    def test_failed_notification_is_spooled_then_resent(self):
+        self.pipeline.valves.notify_url = "http://127.0.0.1:9/notify"
+        self.pipeline.valves.notify_timeout = 1
+        self.pipeline.valves.notify_retry_interval = 0
+
+        async def scenario():
+            await self.pipeline.outlet({"chat_id": "chat-1", "model": "llama3", "messages": [{"content": "a"}]}, USER)
+            await self.pipeline.outlet({"chat_id": "chat-2", "model": "llama3", "messages": [{"content": "b"}]}, USER)
+            await asyncio.gather(*self.pipeline._tasks)
+            spooled = sorted(p.name for p in self.pipeline.spool_path.glob("*.json"))
+            with patch.object(self.pipeline, "send_notification", AsyncMock(return_value=True)) as send:
+                await self.pipeline.outlet(
+                    {"chat_id": "chat-2", "model": "llama3", "messages": [{"content": "b"}]}, USER
+                )
+                await asyncio.gather(*self.pipeline._tasks)
+            await self.pipeline.on_shutdown()
+            return spooled, send.await_args_list
+
+        spooled, calls = asyncio.run(scenario())
+        self.assertEqual(spooled, ["chat-1.json"])
+        self.assertEqual([call.args[0]["chat_id"] for call in calls], ["chat-1"])
+        self.assertEqual(list(self.pipeline.spool_path.glob("*.json")), [])
+        self.assertFalse(self.pipeline._spool_pending)
+
+
+if __name__ == "__main__":
+    unittest.main()
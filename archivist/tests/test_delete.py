@@ -0,0 +1,146 @@
+import asyncio
+from datetime import datetime, timedelta
+import os
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import httpx
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PROJECT_ROOT / "src"))
+TEST_MEMORY = tempfile.TemporaryDirectory()  # database, logs and archives of the tests
+os.environ.setdefault("MEMORY_DIR", TEST_MEMORY.name)
+
+import delete  # noqa: E402
+import webui_api  # noqa: E402
+from archive_index import ArchiveIndex  # noqa: E402
+from archive_store import ArchiveStore, ArchivedChat  # noqa: E402
+
+
+class TestListChatIds(unittest.TestCase):
+    def test_pages_until_empty(self):
+        pages = {
+            ("/api/v1/chats/", 1): [{"id": "a"}, {"id": "b"}],
+            ("/api/v1/chats/", 2): [{"id": "c"}],
+            ("/api/v1/chats/", 3): [],
+            ("/api/v1/chats/archived", 1): [{"id": "d"}],
+            ("/api/v1/chats/archived", 2): [],
+        }
+
+        async def fake_request(method, path, endpoint="default", **kwargs):
+            return httpx.Response(200, json=pages[(path, kwargs["params"]["page"])])
+
+        with patch("webui_api.request", fake_request):
+            self.assertEqual(asyncio.run(webui_api.list_chat_ids()), {"a", "b", "c", "d"})
+
+    def test_stops_when_paging_is_ignored(self):
+        fetch = AsyncMock(return_value=httpx.Response(200, json=[{"id": "a"}]))
+        with patch("webui_api.request", fetch):
+            self.assertEqual(asyncio.run(webui_api.list_chat_ids()), {"a"})
+        self.assertEqual(fetch.await_count, 4)
+
+    def test_failed_listing(self):
+        fetch = AsyncMock(return_value=httpx.Response(500))
+        with patch("webui_api.request", fetch):
+            self.assertIsNone(asyncio.run(webui_api.list_chat_ids()))
+
+
+class TestSweep(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.files = []
+        for chat_id in ("listed", "unlisted-alive", "deleted"):
+            path = Path(self.tmp.name, f"{chat_id}.md")
+            path.write_text('---\nmodel: "default"\nuser: "Lili"\n---\n', encoding="utf-8")
+            self.files.append(path)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_only_unlisted_chats_are_checked(self):
+        get_chat_info = AsyncMock(side_effect=lambda chat_id: {"id": chat_id} if chat_id == "unlisted-alive" else None)
+        delete_chat = AsyncMock()
+        with (
+            patch("delete.list_all_chat_ids", AsyncMock(return_value=({"listed"}, True))),
+            patch("delete.get_chat_info", get_chat_info),
+            patch("delete.delete_archived_chat", delete_chat),
+        ):
+            asyncio.run(delete.sweep(self.files, listing=delete.ChatListing()))
+        self.assertEqual([call.args[0] for call in get_chat_info.await_args_list], ["unlisted-alive", "deleted"])
+        self.assertEqual([call.args[0].stem for call in delete_chat.await_args_list], ["deleted"])
+
+    def test_listing_is_reused(self):
+        list_ids = AsyncMock(return_value=({f"chat-{i}" for i in range(100)}, True))
+        listing = delete.ChatListing(ttl=60, min_ratio=0.05)
+
+        async def scenario():
+            self.assertEqual(len(await listing.get(10)), 100)
+            self.assertEqual(len(await listing.get(10)), 100)
+            listing.listed_at -= 60
+            # 4 due chats out of 100 listed: confirmed one by one
+            self.assertEqual(await listing.get(4), set())
+            self.assertEqual(len(await listing.get(5)), 100)
+
+        with patch("delete.list_all_chat_ids", list_ids):
+            asyncio.run(scenario())
+        self.assertEqual(list_ids.await_count, 2)
+
+    def test_incomplete_listing_is_not_reused(self):
+        list_ids = AsyncMock(return_value=({"chat-a"}, False))
+        listing = delete.ChatListing(ttl=60)
+
+        async def scenario():
+            self.assertEqual(await listing.get(1), {"chat-a"})
+            self.assertEqual(await listing.get(1), {"chat-a"})
+
+        with patch("delete.list_all_chat_ids", list_ids):
+            asyncio.run(scenario())
+        self.assertEqual(list_ids.await_count, 2)
+
+    def test_archives_of_other_workers_are_indexed(self):
+        store = ArchiveStore(Path(self.tmp.name, "archivist.db"))
+        index = ArchiveIndex(Path(self.tmp.name))
+        since = datetime.now() - timedelta(seconds=1)
+        # Archived by another worker: the index of this one was not told
+        store.upsert(ArchivedChat(chat_id="listed", archive_path=str(self.files[0])))
+        store.upsert(ArchivedChat(chat_id="gone", archive_path=str(Path(self.tmp.name, "gone.md"))))
+        store.upsert(ArchivedChat(chat_id="old", archive_path=str(self.files[1]), updated_at="2020-01-01T00:00:00"))
+        with patch("delete.archive_store", store), patch("delete.archive_index", index):
+            self.assertEqual(delete.index_archived_since(since), 1)
+        self.assertEqual(index.paths(), [self.files[0]])
+
+    def test_only_the_leader_indexes_the_archive(self):
+        sweeper = MagicMock(start=AsyncMock(), stop=AsyncMock(), is_leader=False)
+        index = MagicMock(due=MagicMock(return_value=[]), scan=MagicMock(return_value=0))
+        observer = MagicMock()
+
+        async def scenario():
+            loop = asyncio.create_task(delete.delete_loop())
+            await asyncio.sleep(0.05)
+            index.scan.assert_not_called()
+            sweeper.is_leader = True
+            await asyncio.sleep(0.05)
+            index.scan.assert_called_once()
+            observer.stop.assert_not_called()
+            sweeper.is_leader = False
+            await asyncio.sleep(0.05)
+            observer.stop.assert_called_once()
+            loop.cancel()
+            await asyncio.gather(loop, return_exceptions=True)
+
+        with (
+            patch("delete.sweeper", sweeper),
+            patch("delete.archive_index", index),
+            patch("delete.watch_archive", MagicMock(return_value=observer)),
+            patch("delete.index_archived_since", MagicMock(return_value=0)),
+            patch("delete.TIMELOOP", 0.01),
+        ):
+            asyncio.run(scenario())
+        sweeper.stop.assert_awaited_once()
+
+
+if __name__ == "__main__":
+    unittest.main()
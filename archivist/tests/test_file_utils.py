@@ -0,0 +1,128 @@
+from datetime import datetime
+import os
+import sys
+import tempfile
+import unittest
+from unittest.mock import patch
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PROJECT_ROOT / "src"))
+TEST_MEMORY = tempfile.TemporaryDirectory()  # database, logs and archives of the tests
+os.environ.setdefault("MEMORY_DIR", TEST_MEMORY.name)
+
+from file_utils import (  # noqa: E402
+    FilenameTemplate,
+    FrontmatterCache,
+    ParsedFilename,
+    conversation_path,
+    extract_from_file,
+    generate_filename,
+    get_uid,
+    parse_yaml_scalar,
+    shard_parts,
+    uid_prefix,
+)
+
+CHAT_ID = "47b87066-9adf-4cbf-9283-44c79dbc6e81"
+NOW = datetime(2025, 4, 2, 9, 5)
+
+
+class TestFilenameTemplate(unittest.TestCase):
+    def test_render(self):
+        cases = {
+            "conversation_{datetime}.txt": "[47b87066] conversation_2025-04-02_09-05.txt",
+            "{user}_{model}_{date:%d-%m-%Y}.md": "[47b87066] Lili_llama3_02-04-2025.md",
+            "{time} {chat_id}.md": f"[47b87066] 09:05 {CHAT_ID}.md",
+            "{{literal}} {model}.md": "[47b87066] {literal} llama3.md",
+        }
+        for template, expected in cases.items():
+            with self.subTest(template=template):
+                rendered = FilenameTemplate(template).render("llama3:latest", "Lili", CHAT_ID, now=NOW)
+                self.assertEqual(rendered, expected)
+
+    def test_generate_filename(self):
+        name = generate_filename("conversation_{date}.md", "llama3", "Lili", CHAT_ID)
+        self.assertEqual(name, f"[47b87066] conversation_{datetime.now():%Y-%m-%d}.md")
+
+    def test_invalid_templates(self):
+        for template in ("conversation_{username}.md", "{}.md", "{model!r}.md", "conversation_{date"):
+            with self.subTest(template=template), self.assertRaises(ValueError) as error:
+                FilenameTemplate(template)
+            self.assertIn(template, str(error.exception))
+
+    def test_parse(self):
+        template = FilenameTemplate("{user}_{model}_{date}.md")
+        name = template.render("llama3:latest", "Lili", CHAT_ID, now=NOW)
+        self.assertEqual(template.parse(name), ParsedFilename("47b87066", model="llama3", user="Lili"))
+        self.assertIsNone(template.parse("[47b87066] Lili-llama3.md"))
+        self.assertIsNone(template.parse("notes.md"))
+        # Two placeholders in a row can't be split
+        self.assertIsNone(FilenameTemplate("{user}{model}.md").parse("[47b87066] Lilillama3.md"))
+
+    def test_uid(self):
+        self.assertEqual(uid_prefix("[47b87066] conversation.md"), "47b87066")
+        self.assertIsNone(uid_prefix("[47b8-066] conversation.md"))
+        self.assertIsNone(uid_prefix("conversation.md"))
+        self.assertEqual(get_uid("[47b87066] conversation.md"), "47b87066")
+        self.assertEqual(len(get_uid("conversation.md")), 8)
+
+
+class TestLayout(unittest.TestCase):
+    def test_conversation_path(self):
+        self.assertEqual(shard_parts(CHAT_ID, 0), [])
+        parts = shard_parts(CHAT_ID, 2)
+        self.assertEqual([len(part) for part in parts], [2, 2])
+        self.assertEqual(conversation_path(Path("/m"), CHAT_ID, "md", 2), Path("/m", *parts, f"{CHAT_ID}.md"))
+        self.assertEqual(conversation_path(Path("/m"), CHAT_ID, "md", 0), Path("/m", f"{CHAT_ID}.md"))
+
+    def test_same_layout_as_pipeline(self):
+        sys.path.insert(0, str(PROJECT_ROOT.parent / "Pipelines"))
+        from conversation_saver import conversation_path as pipeline_path
+
+        for levels in range(4):
+            self.assertEqual(pipeline_path("/m", CHAT_ID, "md", levels), conversation_path(Path("/m"), CHAT_ID, "md", levels))
+
+
+class TestFrontmatter(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = Path(self.tmp.name, "chat.md")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_scalars(self):
+        self.assertEqual(parse_yaml_scalar('"llama3:8b"'), "llama3:8b")
+        self.assertEqual(parse_yaml_scalar('"say \\"hi\\" \\u00e9"'), 'say "hi" \u00e9')
+        self.assertEqual(parse_yaml_scalar("'it''s'"), "it's")
+        self.assertEqual(parse_yaml_scalar("plain value # comment"), "plain value")
+
+    def test_extract_from_file(self):
+        self.path.write_text(
+            '---\nconversation_id: "abc"\nModel: "llama3:latest"\nuser: \'Lili O\'\'Neil\'\n---\n'
+            + '**Lili**: model: "not this one"\n' * 1000,
+            encoding="utf-8",
+        )
+        info = extract_from_file(self.path)
+        self.assertEqual((info.model, info.user), ("llama3:latest", "Lili O'Neil"))
+
+    def test_defaults(self):
+        self.path.write_text('# Conversation\n---\nmodel: "llama3"\n---\n', encoding="utf-8")
+        self.assertEqual(tuple(extract_from_file(self.path)), ("default", "User"))
+        self.assertEqual(tuple(extract_from_file(Path(self.tmp.name, "missing.md"))), ("default", "User"))
+
+    def test_cache_invalidated_on_change(self):
+        cache = FrontmatterCache()
+        self.path.write_text('---\nmodel: "llama3"\n---\n', encoding="utf-8")
+        with patch("file_utils.read_frontmatter", wraps=__import__("file_utils").read_frontmatter) as read:
+            self.assertEqual(cache.get(self.path).model, "llama3")
+            self.assertEqual(cache.get(self.path).model, "llama3")
+            self.assertEqual(read.call_count, 1)
+            self.path.write_text('---\nmodel: "mistral"\n---\n', encoding="utf-8")
+            self.assertEqual(cache.get(self.path).model, "mistral")
+            self.assertEqual(read.call_count, 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,88 @@
+import json
+import os
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PROJECT_ROOT / "src"))
+TEST_MEMORY = tempfile.TemporaryDirectory()  # database, logs and archives of the tests
+os.environ.setdefault("MEMORY_DIR", TEST_MEMORY.name)
+os.environ.setdefault("FILENAME_TEMPLATE", "conversation_{date}.md")
+
+from idle_archiver import IdleArchiver  # noqa: E402
+
+
+class TestIdleArchiver(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dir = Path(self.tmp.name)
+        self.submitted = []
+        self.accept = True
+        self.archiver = IdleArchiver(self.submit, self.dir, idle_after=600, debounce=60, max_per_scan=10)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def submit(self, chat):
+        if self.accept:
+            self.submitted.append(chat)
+        return self.accept
+
+    def write(self, chat_id: str, mtime: float, model: str = "llama3"):
+        path = self.dir / f"{chat_id}.md"
+        path.write_text(f'---\nmodel: "{model}"\nuser: "Lili"\n---\n', encoding="utf-8")
+        os.utime(path, (mtime, mtime))
+        return path
+
+    def test_idle_chats_are_submitted_once(self):
+        self.write("old", 1000)
+        self.write("recent", 1900)
+        # Found for the first time: wait for the debounce window
+        self.assertEqual(self.archiver.submit_all(self.archiver.scan(2000), 2000), 0)
+        self.assertEqual(self.archiver.submit_all(self.archiver.scan(2070), 2070), 1)
+        self.assertEqual([chat.chat_id for chat in self.submitted], ["old"])
+        self.assertEqual(self.archiver.scan(2080), [])
+        # Still there after another idle period (failed archive): submitted again
+        self.assertEqual([chat.chat_id for chat in self.archiver.scan(2700)], ["old", "recent"])
+
+    def test_edits_restart_the_idle_timer(self):
+        self.write("chat", 1000)
+        self.archiver.scan(1100)
+        self.write("chat", 1650)
+        self.assertEqual(self.archiver.scan(1700), [])
+        self.assertEqual(self.archiver.scan(2200), [])
+        self.assertEqual([chat.chat_id for chat in self.archiver.scan(2300)], ["chat"])
+
+    def test_user_from_tracker_or_frontmatter(self):
+        self.write("tracked", 1000)
+        self.write("untracked", 1000, model="mistral")
+        tracker_dir = self.dir / "ongoing_conversations"
+        tracker_dir.mkdir()
+        (tracker_dir / "user-1.json").write_text(
+            json.dumps({"chat_id": "tracked", "model": "llama3", "username": "Lili"}), encoding="utf-8"
+        )
+        self.archiver.scan(1000)
+        chats = {chat.chat_id: chat for chat in self.archiver.scan(2000)}
+        self.assertEqual((chats["tracked"].user_id, chats["tracked"].model), ("user-1", "llama3"))
+        self.assertEqual((chats["untracked"].user_id, chats["untracked"].model), (None, "mistral"))
+
+    def test_oldest_first_and_capped(self):
+        self.archiver.max_per_scan = 2
+        for i, chat_id in enumerate(("c", "a", "b")):
+            self.write(chat_id, 1000 + i)
+        self.archiver.scan(1000)
+        self.assertEqual([chat.chat_id for chat in self.archiver.scan(2000)], ["c", "a"])
+
+    def test_full_queue_keeps_the_rest_for_later(self):
+        self.write("chat", 1000)
+        self.archiver.scan(1000)
+        self.accept = False
+        self.assertEqual(self.archiver.submit_all(self.archiver.scan(2000), 2000), 0)
+        self.accept = True
+        self.assertEqual(self.archiver.submit_all(self.archiver.scan(2010), 2010), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,144 @@
+import asyncio
+import os
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PROJECT_ROOT / "src"))
+TEST_MEMORY = tempfile.TemporaryDirectory()  # database, logs and archives of the tests
+os.environ.setdefault("MEMORY_DIR", TEST_MEMORY.name)
+
+from jobs import JobQueue  # noqa: E402
+
+
+class FakeResponse:
+    def __init__(self, status: str):
+        self.status = status
+        self.detail = {"status": status}
+
+
+class TestJobQueue(unittest.TestCase):
+    def run_queue(self, handler, payloads, **kwargs):
+        async def scenario():
+            queue = JobQueue(handler, workers=2, backoff=0.01, max_backoff=0.01, **kwargs)
+            await queue.start()
+            for chat_id, payload in payloads:
+                queue.submit(chat_id, payload)
+            for _ in range(200):
+                await asyncio.sleep(0.01)
+                if all(queue.get(chat_id).state in ("done", "failed") for chat_id, _ in payloads):
+                    break
+            await queue.stop()
+            return queue
+
+        return asyncio.run(scenario())
+
+    def test_deduplicates_queued_chat(self):
+        calls = []
+
+        async def handler(payload):
+            calls.append(payload)
+            return FakeResponse("archived")
+
+        queue = self.run_queue(handler, [("chat-a", "first"), ("chat-a", "second"), ("chat-b", "other")])
+        self.assertEqual(sorted(calls), ["other", "second"])
+        self.assertEqual(queue.get("chat-a").state, "done")
+
+    def test_chat_submitted_while_running_runs_after(self):
+        calls = []
+
+        async def scenario():
+            release = asyncio.Event()
+
+            async def handler(payload):
+                calls.append(payload)
+                if payload == "first":
+                    await release.wait()
+                return FakeResponse("archived")
+
+            queue = JobQueue(handler, workers=2, maxsize=1)
+            await queue.start()
+            queue.submit("chat-a", "first")
+            await asyncio.sleep(0.01)
+            # Waits for the running job without taking the only queue slot
+            queue.submit("chat-a", "second")
+            queue.submit("chat-b", "other")
+            await asyncio.sleep(0.05)
+            self.assertEqual(calls, ["first", "other"])
+            release.set()
+            for _ in range(100):
+                await asyncio.sleep(0.01)
+                if queue.get("chat-a").state == "done":
+                    break
+            await queue.stop()
+            return queue
+
+        queue = asyncio.run(scenario())
+        self.assertEqual(calls, ["first", "other", "second"])
+        self.assertEqual(queue.get("chat-a").result, "archived")
+
+    def test_retries_transient_failures(self):
+        statuses = iter(["upload failed", "error", "archived"])
+
+        async def handler(payload):
+            return FakeResponse(next(statuses))
+
+        queue = self.run_queue(handler, [("chat-a", "payload")])
+        job = queue.get("chat-a")
+        self.assertEqual(job.state, "done")
+        self.assertEqual(job.result, "archived")
+        self.assertEqual(job.attempts, 3)
+
+    def test_gives_up_after_max_retries(self):
+        async def handler(payload):
+            raise RuntimeError("boom")
+
+        queue = self.run_queue(handler, [("chat-a", "payload")], max_retries=2)
+        job = queue.get("chat-a")
+        self.assertEqual(job.state, "failed")
+        self.assertEqual(job.attempts, 3)
+
+    def test_submit_supersedes_pending_retry(self):
+        calls = []
+
+        async def handler(payload):
+            calls.append(payload)
+            return FakeResponse("archived" if payload == "second" else "upload failed")
+
+        async def scenario():
+            queue = JobQueue(handler, workers=1, backoff=0.1, max_backoff=0.1)
+            await queue.start()
+            queue.submit("chat-a", "first")
+            await asyncio.sleep(0.02)
+            self.assertEqual(queue.get("chat-a").state, "retrying")
+            queue.submit("chat-a", "second")
+            await asyncio.sleep(0.2)
+            await queue.stop()
+            return queue
+
+        queue = asyncio.run(scenario())
+        self.assertEqual(calls, ["first", "second"])
+        self.assertEqual(queue.get("chat-a").result, "archived")
+
+    def test_stop_cancels_pending_retries(self):
+        async def handler(payload):
+            return FakeResponse("upload failed")
+
+        async def scenario():
+            queue = JobQueue(handler, workers=1, backoff=10, max_backoff=10)
+            await queue.start()
+            queue.submit("chat-a", "payload")
+            await asyncio.sleep(0.02)
+            retries = set(queue._background)
+            self.assertEqual(len(retries), 1)
+            await queue.stop()
+            self.assertTrue(all(task.cancelled() for task in retries))
+            self.assertEqual(queue._background, set())
+
+        asyncio.run(scenario())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,124 @@
+import asyncio
+import os
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import AsyncMock, patch
+
+import httpx
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PROJECT_ROOT / "src"))
+TEST_MEMORY = tempfile.TemporaryDirectory()  # database, logs and archives of the tests
+os.environ.setdefault("MEMORY_DIR", TEST_MEMORY.name)
+
+from knowledge_batcher import KnowledgeBatcher, failed_file_ids  # noqa: E402
+
+
+class TestKnowledgeBatcher(unittest.TestCase):
+    def run_adds(self, batcher: KnowledgeBatcher, adds: list[tuple[str, str]], busy: bool = True) -> list:
+        if busy:
+            # As if an add was already in flight for each knowledge: the files wait and are sent together
+            batcher._in_flight.update({("add", kid): 1 for _, kid in adds})
+
+        async def run():
+            return await asyncio.gather(*(batcher.add(file_id, kid, f"{file_id}.md") for file_id, kid in adds))
+
+        return asyncio.run(run())
+
+    def test_adds_are_grouped_per_knowledge(self):
+        calls = []
+
+        async def fake_request(method, path, endpoint="default", **kwargs):
+            calls.append((path, [item["file_id"] for item in kwargs["json"]]))
+            return httpx.Response(200, json={"files": [{"id": "f2"}, {"id": "f3"}, {"id": "old"}]})
+
+        async def slow_add(file_id, kid, filename):
+            await asyncio.sleep(0.05)
+            return file_id
+
+        single = AsyncMock(side_effect=slow_add)
+        adds = [("f1", "k1"), ("f2", "k1"), ("f3", "k1"), ("f4", "k2")]
+        with patch("knowledge_batcher.request", fake_request), patch("knowledge_batcher.add_to_knowledge", single):
+            results = self.run_adds(KnowledgeBatcher(window=60), adds, busy=False)
+        self.assertEqual(results, ["f1", "f2", "f3", "f4"])
+        # The first add of each knowledge is sent alone, the ones queued while it runs in one batch
+        self.assertEqual(calls, [("/api/v1/knowledge/k1/files/batch/add", ["f2", "f3"])])
+        self.assertEqual([call.args[:2] for call in single.await_args_list], [("f1", "k1"), ("f4", "k2")])
+
+    def test_add_is_sent_right_away_when_idle(self):
+        single = AsyncMock(side_effect=lambda file_id, kid, filename: file_id)
+
+        async def run():
+            batcher = KnowledgeBatcher(window=60)
+            return [await asyncio.wait_for(batcher.add(file_id, "k1", "f.md"), 1) for file_id in ("f1", "f2")]
+
+        with patch("knowledge_batcher.add_to_knowledge", single):
+            self.assertEqual(asyncio.run(run()), ["f1", "f2"])
+
+    def test_per_file_results(self):
+        files = [{"id": "f1"}, {"id": "f2"}, {"id": "f10"}]
+        response = {"files": files, "warnings": {"errors": ["f10: processing failed"]}}
+        adds = [("f1", "k1"), ("f2", "k1"), ("f3", "k1"), ("f10", "k1")]
+        with patch("knowledge_batcher.request", AsyncMock(return_value=httpx.Response(200, json=response))):
+            results = self.run_adds(KnowledgeBatcher(window=0.01), adds)
+        # f1 is not failed by the error of f10
+        self.assertEqual(results, ["f1", "f2", None, None])
+
+    def test_failed_file_ids(self):
+        errors = ["f1: no content", "File f2: processing failed", {"file_id": "f3", "error": "x"}, ""]
+        self.assertEqual(failed_file_ids(errors), {"f1", "f2", "f3"})
+
+    def test_in_flight_released_when_cancelled(self):
+        async def add(file_id, kid, filename):
+            if file_id == "f1":
+                await asyncio.sleep(10)
+            return file_id
+
+        async def run():
+            batcher = KnowledgeBatcher(window=60)
+            first = asyncio.ensure_future(batcher.add("f1", "k1", "f1.md"))
+            second = asyncio.ensure_future(batcher.add("f2", "k1", "f2.md"))
+            await asyncio.sleep(0.01)
+            for task in list(batcher._tasks):
+                task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await first
+            # Sent once the cancelled request released the knowledge, not after the window
+            return await asyncio.wait_for(second, 1)
+
+        with patch("knowledge_batcher.add_to_knowledge", AsyncMock(side_effect=add)):
+            self.assertEqual(asyncio.run(run()), "f2")
+
+    def test_full_batch_is_sent_at_once(self):
+        fetch = AsyncMock(return_value=httpx.Response(200, json={}))
+        with patch("knowledge_batcher.request", fetch):
+            results = self.run_adds(KnowledgeBatcher(window=60, max_size=2), [("f1", "k1"), ("f2", "k1")])
+        self.assertEqual(results, ["f1", "f2"])
+
+    def test_falls_back_to_single_adds(self):
+        batcher = KnowledgeBatcher(window=0.01)
+        fetch = AsyncMock(return_value=httpx.Response(404))
+        single = AsyncMock(side_effect=lambda file_id, kid, filename: None if file_id == "bad" else file_id)
+        with patch("knowledge_batcher.request", fetch), patch("knowledge_batcher.add_to_knowledge", single):
+            results = self.run_adds(batcher, [("f1", "k1"), ("bad", "k1")])
+            self.run_adds(batcher, [("f2", "k1"), ("f3", "k1")])
+        self.assertEqual(results, ["f1", None])
+        self.assertFalse(batcher.batch_add_supported)
+        self.assertEqual(fetch.await_count, 1)
+        self.assertEqual(single.await_count, 4)
+
+    def test_removes_are_fanned_out(self):
+        remove = AsyncMock(side_effect=lambda data, kid, filename: data["file_id"] != "bad")
+
+        async def run():
+            batcher = KnowledgeBatcher(window=0.01)
+            return await asyncio.gather(batcher.remove("f1", "k1", "f1.md"), batcher.remove("bad", "k1", "bad.md"))
+
+        with patch("knowledge_batcher.remove_from_knowledge", remove):
+            self.assertEqual(asyncio.run(run()), [True, False])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,97 @@
+import asyncio
+import os
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import AsyncMock, patch
+
+import httpx
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PROJECT_ROOT / "src"))
+TEST_MEMORY = tempfile.TemporaryDirectory()  # database, logs and archives of the tests
+os.environ.setdefault("MEMORY_DIR", TEST_MEMORY.name)
+
+from knowledge_cache import KnowledgeCache  # noqa: E402
+
+FILES = [
+    {"id": "file-1", "filename": "[47b87066] conversation_2025-04-02.md"},
+    {"id": "file-2", "filename": "other.md", "meta": {"name": "[0f3c1d2e] conversation_2025-04-03.md"}},
+]
+
+
+def response(status_code: int, files=None, etag=None):
+    headers = {"etag": etag} if etag else {}
+    return httpx.Response(status_code, json={"files": files or []}, headers=headers)
+
+
+class TestKnowledgeCache(unittest.TestCase):
+    def test_lookup_by_uid_fetches_once(self):
+        cache = KnowledgeCache(ttl=60)
+        fetch = AsyncMock(return_value=response(200, FILES))
+
+        async def scenario():
+            # Generated again with another date: found by its uid
+            first = await cache.get_file("k1", "[47b87066] conversation_2025-05-01.md")
+            second = await cache.get_file("k1", "[0f3c1d2e] conversation_2025-04-03.md")
+            missing = await cache.get_file("k1", "[deadbeef] conversation_2025-04-03.md")
+            return first, second, missing
+
+        with patch("knowledge_cache.request", fetch):
+            first, second, missing = asyncio.run(scenario())
+        self.assertEqual(first["id"], "file-1")
+        self.assertEqual(second["id"], "file-2")
+        self.assertIsNone(missing)
+        self.assertEqual(fetch.await_count, 1)
+
+    def test_revalidates_with_etag(self):
+        cache = KnowledgeCache(ttl=0)
+        fetch = AsyncMock(side_effect=[response(200, FILES, etag='"v1"'), response(304)])
+
+        async def scenario():
+            await cache.get_file("k1", "[47b87066] conversation_2025-04-02.md")
+            return await cache.get_file("k1", "[47b87066] conversation_2025-04-02.md")
+
+        with patch("knowledge_cache.request", fetch):
+            record = asyncio.run(scenario())
+        self.assertEqual(record["id"], "file-1")
+        self.assertEqual(fetch.await_args_list[1].kwargs["headers"], {"If-None-Match": '"v1"'})
+
+    def test_write_through(self):
+        cache = KnowledgeCache(ttl=60)
+        fetch = AsyncMock(return_value=response(200, FILES))
+
+        async def scenario():
+            await cache.get_index("k1")
+            cache.put("k1", {"id": "file-3", "filename": "[abcdef12] new.md"})
+            cache.remove("k1", "file-1")
+            return await cache.get_file("k1", "[abcdef12] new.md"), await cache.get_file("k1", "[47b87066] x.md")
+
+        with patch("knowledge_cache.request", fetch):
+            added, removed = asyncio.run(scenario())
+        self.assertEqual(added["id"], "file-3")
+        self.assertIsNone(removed)
+        self.assertEqual(fetch.await_count, 1)
+
+    def test_ambiguous_uid(self):
+        files = FILES + [{"id": "file-3", "filename": "[47b87066] conversation_2025-06-01.md"}]
+        cache = KnowledgeCache(ttl=60)
+
+        async def scenario():
+            return [
+                await cache.get_file("k1", "[47b87066] conversation_2025-07-01.md"),
+                await cache.get_file("k1", "[47b87066] conversation_2025-06-01.md"),
+                await cache.get_file("k1", "[47b87066] conversation_2025-07-01.md", file_id="file-1"),
+            ]
+
+        with patch("knowledge_cache.request", AsyncMock(return_value=response(200, files))):
+            ambiguous, by_name, by_id = asyncio.run(scenario())
+        # Two chats with the same uid: neither is taken for the other
+        self.assertIsNone(ambiguous)
+        self.assertEqual(by_name["id"], "file-3")
+        self.assertEqual(by_id["id"], "file-1")
+
+
+if __name__ == "__main__":
+    unittest.main()
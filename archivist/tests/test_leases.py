@@ -0,0 +1,98 @@
+import asyncio
+import os
+import sys
+import tempfile
+import time
+import unittest
+from pathlib import Path
+from unittest.mock import AsyncMock, patch
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PROJECT_ROOT / "src"))
+TEST_MEMORY = tempfile.TemporaryDirectory()  # database, logs and archives of the tests
+os.environ.setdefault("MEMORY_DIR", TEST_MEMORY.name)
+
+import add  # noqa: E402
+from archive_store import ArchiveStore  # noqa: E402
+from leases import Leader, LeaseLocked, LeaseStore  # noqa: E402
+
+
+class TestLeases(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        path = Path(self.tmp.name, "archivist.db")
+        # Two instances, each with its own connection to the database
+        self.a = LeaseStore(ArchiveStore(path), owner="host-a:1")
+        self.b = LeaseStore(ArchiveStore(path), owner="host-b:1")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_acquire_renew_and_expire(self):
+        now = time.time()
+        self.assertTrue(self.a.acquire("sweeper", 30, now=now))
+        self.assertFalse(self.b.acquire("sweeper", 30, now=now + 10))
+        self.assertTrue(self.a.acquire("sweeper", 30, now=now + 20))
+        self.assertFalse(self.b.acquire("sweeper", 30, now=now + 40))
+        # Not renewed by its owner
+        self.assertTrue(self.b.acquire("sweeper", 30, now=now + 50))
+        self.assertEqual(self.a.get("sweeper").owner, "host-b:1")
+        self.assertFalse(self.a.acquire("sweeper", 30, now=now + 60))
+
+    def test_release(self):
+        self.assertTrue(self.a.acquire("archive:chat", 600))
+        self.b.release("archive:chat")
+        self.assertFalse(self.b.acquire("archive:chat", 600))
+        self.a.release("archive:chat")
+        self.assertIsNone(self.a.get("archive:chat"))
+        self.assertTrue(self.b.acquire("archive:chat", 600))
+
+    def test_hold(self):
+        async def scenario():
+            async with self.a.hold("archive:chat", 600):
+                with self.assertRaises(LeaseLocked):
+                    async with self.b.hold("archive:chat", 600):
+                        pass
+                waiting = asyncio.create_task(self.b.hold("archive:chat", 600, timeout=5, poll=0.01).__aenter__())
+                await asyncio.sleep(0.05)
+                self.assertFalse(waiting.done())
+            await waiting
+            self.assertEqual(self.a.get("archive:chat").owner, "host-b:1")
+
+        asyncio.run(scenario())
+
+    def test_leader_election(self):
+        async def scenario():
+            first, second = Leader("sweeper", self.a, ttl=0.3), Leader("sweeper", self.b, ttl=0.3)
+            await first.start()
+            await second.start()
+            self.assertTrue(first.is_leader)
+            self.assertFalse(second.is_leader)
+            await asyncio.sleep(0.4)
+            # Renewed before it expires
+            self.assertTrue(first.is_leader)
+            self.assertFalse(second.is_leader)
+            await first.stop()
+            self.assertFalse(first.is_leader)
+            await asyncio.sleep(0.2)
+            self.assertTrue(second.is_leader)
+            await second.stop()
+
+        asyncio.run(scenario())
+
+    def test_archive_locked_by_another_instance(self):
+        data = add.NotifyRequest(chat_id="chat-locked", user_id="u", model="llama3")
+        self.assertTrue(self.b.acquire("archive:chat-locked", 600))
+        archive = AsyncMock()
+        with patch("add.leases", self.a), patch("add._archive_conversation", archive):
+            response = asyncio.run(add.archive_conversation(data))
+            self.assertEqual(response.status, "locked")
+            archive.assert_not_awaited()
+            self.b.release("archive:chat-locked")
+            asyncio.run(add.archive_conversation(data))
+        archive.assert_awaited_once_with(data)
+        self.assertIsNone(self.a.get("archive:chat-locked"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,79 @@
+import io
+import json
+import os
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PROJECT_ROOT / "src"))
+TEST_MEMORY = tempfile.TemporaryDirectory()  # database, logs and archives of the tests
+os.environ.setdefault("MEMORY_DIR", TEST_MEMORY.name)
+
+import logger  # noqa: E402
+from logger import LogWriter, RotatingFile  # noqa: E402
+
+
+class TestLogWriter(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = Path(self.tmp.name, "archivist.log")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_batched_writes_and_console(self):
+        console = io.StringIO()
+        writer = LogWriter(max_bytes=0, rotate_interval=0, flush_interval=0.01, console=console)
+        for i in range(100):
+            writer.write(self.path, f"line {i}", echo=i % 2 == 0)
+        writer.close()
+        lines = self.path.read_text(encoding="utf-8").splitlines()
+        self.assertEqual(lines, [f"line {i}" for i in range(100)])
+        self.assertEqual(len(console.getvalue().splitlines()), 50)
+
+    def test_size_rotation(self):
+        writer = LogWriter(max_bytes=100, rotate_interval=0, backup_count=2, flush_interval=0, echo=False)
+        for i in range(10):
+            writer.write(self.path, "x" * 60)
+            writer.flush()
+        writer.close()
+        self.assertTrue(self.path.with_name("archivist.log.1").exists())
+        self.assertTrue(self.path.with_name("archivist.log.2").exists())
+        self.assertFalse(self.path.with_name("archivist.log.3").exists())
+        self.assertLessEqual(self.path.stat().st_size, 200)
+
+    def test_rotation_shared_by_processes(self):
+        # Two workers writing the same log file
+        first, second = (RotatingFile(self.path, 100, 0, 2) for _ in range(2))
+        first.write(["a" * 60 + "\n"])
+        second.write(["b" * 60 + "\n"])
+        first.write(["c\n"])
+        # Rotated by the first one: the second one writes to the new file, and does not rotate it again
+        second.write(["d\n"])
+        first.close()
+        second.close()
+        self.assertEqual(self.path.read_text(encoding="utf-8"), "c\nd\n")
+        rotated = self.path.with_name("archivist.log.1").read_text(encoding="utf-8")
+        self.assertEqual(rotated, "a" * 60 + "\n" + "b" * 60 + "\n")
+        self.assertFalse(self.path.with_name("archivist.log.2").exists())
+
+    def test_json_lines_and_level(self):
+        writer = LogWriter(flush_interval=0, echo=False)
+        with (
+            patch.object(logger, "_writer", writer),
+            patch.object(logger, "LOG_FILE", self.path),
+            patch.object(logger, "LOG_FORMAT", "json"),
+            patch.object(logger, "LOG_LEVEL", "info"),
+        ):
+            logger.log("hidden", level="debug")
+            logger.log("shown", level="warning")
+            writer.close()
+        records = [json.loads(line) for line in self.path.read_text(encoding="utf-8").splitlines()]
+        self.assertEqual([(r["level"], r["msg"]) for r in records], [("warning", "shown")])
+
+
+if __name__ == "__main__":
+    unittest.main()
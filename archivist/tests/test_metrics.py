@@ -0,0 +1,56 @@
+import asyncio
+import os
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import AsyncMock, patch
+
+import httpx
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PROJECT_ROOT / "src"))
+TEST_MEMORY = tempfile.TemporaryDirectory()  # database, logs and archives of the tests
+os.environ.setdefault("MEMORY_DIR", TEST_MEMORY.name)
+
+import http_client  # noqa: E402
+from metrics import Counter, Gauge, Histogram, Registry, webui_request_seconds, webui_requests  # noqa: E402
+
+
+class TestMetrics(unittest.TestCase):
+    def test_render(self):
+        registry = Registry()
+        counter = registry.register(Counter("jobs_total", "Jobs", ("status",)))
+        gauge = registry.register(Gauge("depth", "Depth", function=lambda: 3))
+        histogram = registry.register(Histogram("latency_seconds", "Latency", ("endpoint",), buckets=(0.1, 1)))
+        counter.inc(status="done")
+        counter.inc(2, status='fail"ed')
+        histogram.observe(0.05, endpoint="chat")
+        histogram.observe(0.5, endpoint="chat")
+        histogram.observe(5, endpoint="chat")
+        text = registry.render()
+        self.assertIn("# TYPE jobs_total counter", text)
+        self.assertIn('jobs_total{status="done"} 1', text)
+        self.assertIn('jobs_total{status="fail\\"ed"} 2', text)
+        self.assertIn("depth 3", text)
+        self.assertIn('latency_seconds_bucket{endpoint="chat",le="0.1"} 1', text)
+        self.assertIn('latency_seconds_bucket{endpoint="chat",le="1"} 2', text)
+        self.assertIn('latency_seconds_bucket{endpoint="chat",le="+Inf"} 3', text)
+        self.assertIn('latency_seconds_count{endpoint="chat"} 3', text)
+        self.assertEqual(gauge.get(), 3)
+
+    def test_webui_calls_are_measured(self):
+        client = AsyncMock()
+        client.request.side_effect = [httpx.Response(200), httpx.ConnectError("down")]
+        before = webui_request_seconds.count(endpoint="upload")
+        with patch("http_client.get_client", return_value=client):
+            asyncio.run(http_client.request("POST", "/api/v1/files/", endpoint="upload"))
+            with self.assertRaises(httpx.ConnectError):
+                asyncio.run(http_client.request("POST", "/api/v1/files/", endpoint="upload"))
+        self.assertEqual(webui_request_seconds.count(endpoint="upload"), before + 2)
+        self.assertGreaterEqual(webui_requests.get(endpoint="upload", status=200), 1)
+        self.assertGreaterEqual(webui_requests.get(endpoint="upload", status="error"), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
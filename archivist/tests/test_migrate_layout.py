@@ -0,0 +1,85 @@
+import os
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PROJECT_ROOT / "src"))
+TEST_MEMORY = tempfile.TemporaryDirectory()  # database, logs and archives of the tests
+os.environ.setdefault("MEMORY_DIR", TEST_MEMORY.name)
+os.environ.setdefault("FILENAME_TEMPLATE", "conversation_{date}.md")
+
+import migrate_layout  # noqa: E402
+from archive_store import ArchiveStore, ArchivedChat  # noqa: E402
+from cold_storage import ColdEntry, ColdStorage  # noqa: E402
+from file_utils import conversation_path, iter_conversation_files  # noqa: E402
+
+
+class TestMigrateLayout(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dir = Path(self.tmp.name)
+        self.store = ArchiveStore(self.dir / "archivist.db")
+        for chat_id in ("a", "b"):
+            (self.dir / f"{chat_id}.md").write_text("---\n---\n", encoding="utf-8")
+        self.archived = self.dir / "archived" / "Llama" / "c.md"
+        self.archived.parent.mkdir(parents=True)
+        self.archived.write_text("---\n---\n", encoding="utf-8")
+        self.store.upsert(ArchivedChat(chat_id="c", archive_path=str(self.archived)))
+        # Packed into the cold tier: not on disk
+        self.cold = ColdStorage(self.dir / "cold", self.store, "gzip")
+        self.cold_path = self.dir / "archived" / "Llama" / "d.md"
+        self.cold._insert([ColdEntry("d", "segment-1.gz", 0, 1, 1, str(self.cold_path), "llama3", "Lili", 0)])
+        # Not conversations
+        (self.dir / "ongoing_conversations").mkdir()
+        (self.dir / "ongoing_conversations" / "user.md").write_text("", encoding="utf-8")
+        (self.dir / "notes.json").write_text("{}", encoding="utf-8")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def migrate(self, levels: int, **kwargs):
+        with patch("migrate_layout.archive_store", self.store), patch("migrate_layout.cold_storage", self.cold):
+            return migrate_layout.migrate(self.dir, levels, per_knowledge=True, **kwargs)
+
+    def files(self) -> set[Path]:
+        return {path for path in self.dir.rglob("*.md") if "ongoing_conversations" not in path.parts}
+
+    def test_shard_and_back(self):
+        self.assertEqual(self.migrate(2, dry_run=True), {"to move": 4})
+        self.assertEqual(len(self.files()), 3)
+
+        self.assertEqual(self.migrate(2), {"moved": 4})
+        sharded = conversation_path(self.dir / "archived" / "Llama", "c", "md", 2)
+        self.assertEqual(
+            self.files(),
+            {conversation_path(self.dir, "a", "md", 2), conversation_path(self.dir, "b", "md", 2), sharded},
+        )
+        self.assertEqual(self.store.get("c").archive_path, str(sharded))
+        cold_sharded = conversation_path(self.dir / "archived" / "Llama", "d", "md", 2)
+        self.assertEqual(self.cold.get("d").archive_path, str(cold_sharded))
+        self.assertEqual({entry.name for entry in iter_conversation_files(self.dir, "md", 2)}, {"a.md", "b.md"})
+        # Already in the layout
+        self.assertEqual(self.migrate(2), {})
+
+        self.assertEqual(self.migrate(0), {"moved": 4})
+        self.assertEqual(self.files(), {self.dir / "a.md", self.dir / "b.md", self.archived})
+        self.assertEqual(self.store.get("c").archive_path, str(self.archived))
+        self.assertEqual(self.cold.get("d").archive_path, str(self.cold_path))
+        # Empty shard directories are removed
+        self.assertEqual(sorted(p.name for p in self.dir.iterdir() if p.is_dir()), ["archived", "ongoing_conversations"])
+        self.assertTrue((self.dir / "ongoing_conversations" / "user.md").exists())
+
+    def test_conflict(self):
+        target = conversation_path(self.dir, "a", "md", 1)
+        target.parent.mkdir()
+        target.write_text("newer", encoding="utf-8")
+        results = self.migrate(1)
+        self.assertEqual(results, {"moved": 3, "conflict": 1})
+        self.assertTrue((self.dir / "a.md").exists())
+
+
+if __name__ == "__main__":
+    unittest.main()
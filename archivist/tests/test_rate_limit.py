@@ -0,0 +1,54 @@
+import asyncio
+import os
+import sys
+import tempfile
+import time
+import unittest
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PROJECT_ROOT / "src"))
+TEST_MEMORY = tempfile.TemporaryDirectory()  # database, logs and archives of the tests
+os.environ.setdefault("MEMORY_DIR", TEST_MEMORY.name)
+
+from rate_limit import RateLimiter  # noqa: E402
+
+
+class TestRateLimiter(unittest.TestCase):
+    def test_requests_per_second(self):
+        async def scenario():
+            limiter = RateLimiter(rate=20, per_key=100)
+            start = time.monotonic()
+
+            async def call():
+                async with limiter.limit("token"):
+                    pass
+
+            await asyncio.gather(*(call() for _ in range(30)))
+            return time.monotonic() - start
+
+        # 20 requests from the initial burst, then 10 more at 20 per second
+        self.assertGreaterEqual(asyncio.run(scenario()), 0.45)
+
+    def test_per_key_concurrency(self):
+        running = {"a": 0, "b": 0}
+        peaks = {"a": 0, "b": 0}
+
+        async def scenario():
+            limiter = RateLimiter(rate=0, per_key=2)
+
+            async def call(key):
+                async with limiter.limit(key):
+                    running[key] += 1
+                    peaks[key] = max(peaks[key], running[key])
+                    await asyncio.sleep(0.01)
+                    running[key] -= 1
+
+            await asyncio.gather(*(call(key) for key in "ab" * 10))
+
+        asyncio.run(scenario())
+        self.assertEqual(peaks, {"a": 2, "b": 2})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,106 @@
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+import httpx
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PROJECT_ROOT / "src"))
+TEST_MEMORY = tempfile.TemporaryDirectory()  # database, logs and archives of the tests
+os.environ.setdefault("MEMORY_DIR", TEST_MEMORY.name)
+
+import webui_api  # noqa: E402
+from token_router import TokenRouter  # noqa: E402
+
+
+class TestTokenRouter(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = Path(self.tmp.name, "user_api.json")
+        self.path.write_text(json.dumps({"alice": "sk-alice", "bob": "sk-bob"}), encoding="utf-8")
+        self.router = TokenRouter(self.path, negative_ttl=60)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_candidates_prefer_remembered_owner(self):
+        self.assertEqual(self.router.candidates("chat-a"), [None, "sk-alice", "sk-bob"])
+        self.router.remember("chat-a", "sk-bob", "user-b")
+        self.assertEqual(self.router.candidates("chat-a"), ["sk-bob", None, "sk-alice"])
+        self.assertEqual(self.router.candidates("chat-new", "user-b"), ["sk-bob", None, "sk-alice"])
+
+    def test_tokens_reloaded_on_change(self):
+        self.assertEqual(self.router.tokens(), ["sk-alice", "sk-bob"])
+        self.router.remember("chat-a", "sk-bob")
+        self.path.write_text(json.dumps({"alice": "sk-alice"}), encoding="utf-8")
+        os.utime(self.path, (0, 12345))
+        self.assertEqual(self.router.tokens(), ["sk-alice"])
+        self.assertEqual(self.router.candidates("chat-a"), [None, "sk-alice"])
+
+    def test_get_chat_info_routing(self):
+        calls = []
+
+        async def fake_request(method, path, endpoint="default", headers=None, **kwargs):
+            token = headers["Authorization"][7:] if headers else None
+            calls.append(token)
+            if path.endswith("chat-b") and token == "sk-bob":
+                return httpx.Response(200, json={"id": "chat-b", "title": "B"})
+            return httpx.Response(404)
+
+        async def scenario():
+            first = await webui_api.get_chat_info("chat-b")
+            second = await webui_api.get_chat_info("chat-b")
+            missing = await webui_api.get_chat_info("chat-gone")
+            missing_again = await webui_api.get_chat_info("chat-gone")
+            return first, second, missing, missing_again
+
+        with patch.object(webui_api, "token_router", self.router), patch.object(webui_api, "request", fake_request):
+            first, second, missing, missing_again = asyncio.run(scenario())
+        self.assertEqual(first["title"], "B")
+        self.assertEqual(second["title"], "B")
+        self.assertIsNone(missing)
+        self.assertIsNone(missing_again)
+        # chat-b: 3 keys the first time, only bob's the second; chat-gone: 3 keys, then cached as missing
+        self.assertEqual(calls, [None, "sk-alice", "sk-bob", "sk-bob", None, "sk-alice", "sk-bob"])
+
+    def test_errors_are_not_cached_as_missing(self):
+        async def fake_request(*args, **kwargs):
+            raise httpx.ConnectError("down")
+
+        with patch.object(webui_api, "token_router", self.router), patch.object(webui_api, "request", fake_request):
+            self.assertIsNone(asyncio.run(webui_api.get_chat_info("chat-a")))
+        self.assertFalse(self.router.is_missing("chat-a"))
+
+    def test_complete_listing_forgets_deleted_chats(self):
+        listings = {None: {"chat-a"}, "sk-alice": {"chat-b"}, "sk-bob": None}
+
+        async def fake_list(headers=None):
+            return listings[headers["Authorization"][7:] if headers else None]
+
+        self.router.remember("chat-deleted", "sk-alice")
+        self.router.mark_missing("chat-b")
+        with patch.object(webui_api, "token_router", self.router), patch.object(webui_api, "list_chat_ids", fake_list):
+            # Bob's listing failed: nothing is forgotten
+            self.assertEqual(asyncio.run(webui_api.list_all_chat_ids()), ({"chat-a", "chat-b"}, False))
+            self.assertIn("chat-deleted", self.router._chat_owner)
+            self.assertFalse(self.router.is_missing("chat-b"))
+            listings["sk-bob"] = {"chat-c"}
+            self.assertEqual(asyncio.run(webui_api.list_all_chat_ids()), ({"chat-a", "chat-b", "chat-c"}, True))
+        self.assertEqual(self.router._chat_owner, {"chat-a": None, "chat-b": "sk-alice", "chat-c": "sk-bob"})
+
+    def test_expired_missing_chats_are_pruned(self):
+        router = TokenRouter(self.path, negative_ttl=0.01)
+        router.mark_missing("chat-a")
+        time.sleep(0.02)
+        router.mark_missing("chat-b")
+        self.assertEqual(list(router._missing), ["chat-b"])
+
+
+if __name__ == "__main__":
+    unittest.main()
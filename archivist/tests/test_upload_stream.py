@@ -0,0 +1,145 @@
+import asyncio
+import gzip
+import json
+import os
+import sys
+import tempfile
+import threading
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+import httpx
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PROJECT_ROOT / "src"))
+TEST_MEMORY = tempfile.TemporaryDirectory()  # database, logs and archives of the tests
+os.environ.setdefault("MEMORY_DIR", TEST_MEMORY.name)
+
+from upload_stream import (  # noqa: E402
+    StreamingUploader,
+    aiter_chunks,
+    gzip_rejected,
+    json_content,
+    multipart_file,
+    read_text_chunks,
+)
+
+CONTENT = '---\nmodel: "llama3"\n---\n**Lili**: pasted logs \\ "quoted" é 🚀\n' * 50
+
+
+class FakeServer:
+    """Stand-in for `http_client.request`: consume the streamed body and answer `statuses` in order."""
+
+    def __init__(self, *statuses: int, delay: float = 0):
+        self.statuses = list(statuses)
+        self.delay = delay
+        self.calls = []
+        self.active = 0
+        self.max_active = 0
+
+    async def __call__(self, method, path, endpoint="default", headers=None, content=None):
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        chunks = [chunk async for chunk in content]
+        await asyncio.sleep(self.delay)
+        self.active -= 1
+        body = b"".join(chunks)
+        if headers.get("Content-Encoding") == "gzip":
+            body = gzip.decompress(body)
+        self.calls.append((path, headers, body, len(chunks)))
+        return httpx.Response(self.statuses.pop(0) if self.statuses else 200, json={"id": "file-1"})
+
+
+class TestUploadStream(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = Path(self.tmp.name, "chat.md")
+        self.path.write_text(CONTENT, encoding="utf-8")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_json_content(self):
+        body = b"".join(json_content(read_text_chunks(self.path, chunk_size=7)))
+        self.assertEqual(json.loads(body), {"content": CONTENT})
+
+    def test_chunks_are_read_off_the_loop(self):
+        threads = []
+
+        def chunks():
+            for chunk in (b"a", b"b"):
+                threads.append(threading.current_thread())
+                yield chunk
+
+        async def collect():
+            return [chunk async for chunk in aiter_chunks(chunks())]
+
+        self.assertEqual(asyncio.run(collect()), [b"a", b"b"])
+        self.assertNotIn(threading.main_thread(), threads)
+
+    def test_multipart(self):
+        content_type, encode = multipart_file('[47b87066] "chat".md')
+        body = b"".join(encode(iter([b"hello ", b"world"])))
+        boundary = content_type.partition("boundary=")[2].encode()
+        self.assertTrue(body.startswith(b"--" + boundary + b"\r\n"))
+        self.assertIn(b'filename="[47b87066] %22chat%22.md"', body)
+        self.assertTrue(body.endswith(b"\r\n\r\nhello world\r\n--" + boundary + b"--\r\n"))
+
+    def test_update_is_streamed(self):
+        server = FakeServer()
+        uploader = StreamingUploader(chunk_size=100, gzip=False)
+        with patch("upload_stream.request", server):
+            asyncio.run(uploader.update_content("file-1", self.path))
+        path, headers, body, chunks = server.calls[0]
+        self.assertEqual(path, "/api/v1/files/file-1/data/content/update")
+        self.assertEqual(headers["Content-Type"], "application/json")
+        self.assertEqual(json.loads(body)["content"], CONTENT)
+        self.assertGreater(chunks, 10)
+
+    def test_gzip_fallback(self):
+        server = FakeServer(415)
+        uploader = StreamingUploader(chunk_size=100, gzip=True)
+        with patch("upload_stream.request", server):
+            res = asyncio.run(uploader.upload(self.path, "chat.md"))
+            asyncio.run(uploader.upload(self.path, "chat.md"))
+        self.assertEqual(res.status_code, 200)
+        self.assertFalse(uploader.gzip_supported)
+        self.assertEqual([call[1].get("Content-Encoding") for call in server.calls], ["gzip", None, None])
+        # The same body is sent again, uncompressed
+        self.assertIn(CONTENT.encode("utf-8"), server.calls[1][2])
+
+    def test_content_errors_keep_gzip(self):
+        server = FakeServer(422)
+        uploader = StreamingUploader(chunk_size=100, gzip=True)
+        with patch("upload_stream.request", server):
+            res = asyncio.run(uploader.upload(self.path, "chat.md"))
+        self.assertEqual(res.status_code, 422)
+        self.assertTrue(uploader.gzip_supported)
+        self.assertEqual(len(server.calls), 1)
+
+    def test_gzip_rejected(self):
+        self.assertTrue(gzip_rejected(httpx.Response(415)))
+        self.assertTrue(gzip_rejected(httpx.Response(400, text="Unsupported Content-Encoding: gzip")))
+        self.assertTrue(gzip_rejected(httpx.Response(422, json={"detail": "unknown encoding"})))
+        self.assertFalse(gzip_rejected(httpx.Response(400, json={"detail": "File content is empty"})))
+        self.assertFalse(gzip_rejected(httpx.Response(500, text="gzip")))
+        self.assertFalse(gzip_rejected(httpx.Response(200)))
+
+    def test_memory_budget(self):
+        size = self.path.stat().st_size
+
+        async def upload_all(uploader, count):
+            await asyncio.gather(*(uploader.upload(self.path, f"chat{i}.md") for i in range(count)))
+
+        for budget, expected in ((size * 2, 2), (size // 2, 1), (0, 4)):
+            with self.subTest(budget=budget):
+                server = FakeServer(delay=0.01)
+                with patch("upload_stream.request", server):
+                    asyncio.run(upload_all(StreamingUploader(memory_budget=budget, gzip=False), 4))
+                self.assertEqual(len(server.calls), 4)
+                self.assertEqual(server.max_active, expected)
+
+
+if __name__ == "__main__":
+    unittest.main()